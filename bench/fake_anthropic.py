@@ -0,0 +1,207 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Replays the SSE streams recorded in bench/recordings, one directory per
+scenario with one file per response of the turn (0.sse, then the answers to
+tool results). A client selects the scenario through its base URL:
+
+  anthropic.AsyncAnthropic(base_url="http://127.0.0.1:8787/tool_use")
+
+Content deltas are paced at a configurable token rate with jitter. Every
+request and emitted delta is timestamped with time.perf_counter(), which is
+system-wide on Linux, so clients in other processes can compare against it.
+
+  poetry run python -m bench.fake_anthropic --port 8787 --tokens-per-sec 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+from aiohttp import web
+from attrs import define
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+
+
+@define(kw_only=True)
+class Pacing:
+  # delay before the first content delta of a response
+  first_token: float = 0.0
+  # 0 replays as fast as possible
+  tokens_per_sec: float = 0.0
+  # relative, each delay is scaled by a uniform factor in [1 - jitter, 1 + jitter]
+  jitter: float = 0.0
+  seed: int = 0
+
+
+def load_recordings(directory: str = RECORDINGS_DIR) -> dict[str, list[list[bytes]]]:
+  """Returns the events of every response of every scenario."""
+  recordings = {}
+  for scenario in sorted(os.listdir(directory)):
+    scenario_dir = os.path.join(directory, scenario)
+    if not os.path.isdir(scenario_dir):
+      continue
+
+    responses = []
+    for i in range(len(os.listdir(scenario_dir))):
+      with open(os.path.join(scenario_dir, f"{i}.sse"), "rb") as f:
+        events = f.read().split(b"\n\n")
+      responses.append([event + b"\n\n" for event in events if event.strip()])
+    recordings[scenario] = responses
+  return recordings
+
+
+def response_index(messages: list[dict]) -> int:
+  """Index of the response answering `messages`, the number of tool round-trips
+  since the last message the user said."""
+  for i in range(len(messages) - 1, -1, -1):
+    msg = messages[i]
+    content = msg["content"]
+    is_tool_result = isinstance(content, list) and any(
+      block.get("type") == "tool_result" for block in content
+    )
+    if msg["role"] == "user" and not is_tool_result:
+      return (len(messages) - 1 - i) // 2
+  return 0
+
+
+def is_content_delta(event: bytes) -> bool:
+  return event.startswith(b"event: content_block_delta")
+
+
+class FakeAnthropic:
+  def __init__(
+    self,
+    recordings: dict[str, list[list[bytes]]] | None = None,
+    pacing: Pacing | None = None,
+    *,
+    record_trace: bool = True,
+  ) -> None:
+    self._recordings = recordings if recordings is not None else load_recordings()
+    self._pacing = pacing or Pacing()
+    self._rng = random.Random(self._pacing.seed)
+    self._record_trace = record_trace
+    # (kind, scenario, response index, time), kind is "request", "delta" or "stop"
+    self._trace: list[tuple[str, str, int, float]] = []
+
+    self.app = web.Application()
+    self.app.add_routes(
+      [
+        web.post("/{scenario}/v1/messages", self._messages),
+        web.get("/_bench/trace", self._get_trace),
+        web.post("/_bench/reset", self._reset),
+        web.head("/{tail:.*}", self._head),
+      ]
+    )
+
+  async def _messages(self, request: web.Request) -> web.StreamResponse:
+    received_at = time.perf_counter()
+    scenario = request.match_info["scenario"]
+    responses = self._recordings.get(scenario)
+    if responses is None:
+      raise web.HTTPNotFound(text=f"unknown scenario {scenario}")
+
+    body = await request.json()
+    if not body.get("stream"):
+      raise web.HTTPBadRequest(text="only streaming requests are replayed")
+
+    index = min(response_index(body["messages"]), len(responses) - 1)
+    self._add_trace("request", scenario, index, received_at)
+
+    response = web.StreamResponse(
+      headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+    )
+    await response.prepare(request)
+
+    first_delta = True
+    for event in responses[index]:
+      if is_content_delta(event):
+        delay = self._pacing.first_token if first_delta else self._token_delay()
+        first_delta = False
+        if delay > 0:
+          await asyncio.sleep(delay)
+        await response.write(event)
+        self._add_trace("delta", scenario, index, time.perf_counter())
+      else:
+        await response.write(event)
+
+    self._add_trace("stop", scenario, index, time.perf_counter())
+    await response.write_eof()
+    return response
+
+  def _token_delay(self) -> float:
+    if self._pacing.tokens_per_sec <= 0:
+      return 0.0
+    jitter = self._pacing.jitter
+    return self._rng.uniform(1 - jitter, 1 + jitter) / self._pacing.tokens_per_sec
+
+  def _add_trace(self, kind: str, scenario: str, index: int, t: float) -> None:
+    if self._record_trace:
+      self._trace.append((kind, scenario, index, t))
+
+  async def _get_trace(self, request: web.Request) -> web.Response:
+    return web.json_response(self._trace)
+
+  async def _reset(self, request: web.Request) -> web.Response:
+    self._trace = []
+    return web.Response()
+
+  async def _head(self, request: web.Request) -> web.Response:
+    # connection warm-up of the client pool
+    return web.Response()
+
+
+def _serve(host: str, port: int, pacing: Pacing, record_trace: bool, ready) -> None:
+  async def _run() -> None:
+    runner = web.AppRunner(FakeAnthropic(pacing=pacing, record_trace=record_trace).app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    ready.set()
+    await asyncio.Event().wait()
+
+  asyncio.run(_run())
+
+
+def start_process(
+  pacing: Pacing | None = None,
+  *,
+  host: str = "127.0.0.1",
+  port: int = 8787,
+  record_trace: bool = True,
+) -> multiprocessing.Process:
+  """Runs the server in its own process, so it doesn't compete with the client
+  for the event loop or the GIL."""
+  ready = multiprocessing.Event()
+  process = multiprocessing.Process(
+    target=_serve,
+    args=(host, port, pacing or Pacing(), record_trace, ready),
+    daemon=True,
+  )
+  process.start()
+  if not ready.wait(10):
+    process.kill()
+    raise RuntimeError("fake Anthropic server didn't start")
+  return process
+
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+  )
+  arg_parser.add_argument("--host", default="127.0.0.1")
+  arg_parser.add_argument("--port", type=int, default=8787)
+  arg_parser.add_argument("--first-token", type=float, default=0.3)
+  arg_parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+  arg_parser.add_argument("--jitter", type=float, default=0.3)
+  args = arg_parser.parse_args()
+
+  print(f"scenarios: {', '.join(load_recordings())}")
+  pacing = Pacing(
+    first_token=args.first_token, tokens_per_sec=args.tokens_per_sec, jitter=args.jitter
+  )
+  _serve(args.host, args.port, pacing, False, multiprocessing.Event())
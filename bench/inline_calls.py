@@ -0,0 +1,120 @@
+"""Fuzzes and benchmarks the inline function call parser.
+
+Replays recorded assistant responses split at random delta boundaries and
+checks that the spoken text and the parsed calls don't depend on the split.
+
+  poetry run python -m bench.inline_calls --rounds 2000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from demospace.llm.inline_calls import InlineCall, InlineCallParser
+
+_SLIDE_URL = (
+  "https://pqkdimgujjrjmxpxptda.supabase.co/storage/v1/object/public/slides/"
+  "718A4B90-1D69-4535-990E-AA40E805CEB5"
+)
+
+# recorded responses, with the calls the parser should find in each of them
+RESPONSES: list[tuple[str, list[dict]]] = [
+  (
+    "Great question! Otter can transcribe your meetings in real time. "
+    f'functions.send_asset({{"assetUrl": "{_SLIDE_URL}", "alt": "Live transcription"}}) '
+    "As you can see, the transcript updates while people speak.",
+    [{"assetUrl": _SLIDE_URL, "alt": "Live transcription"}],
+  ),
+  (
+    "Otter has a lot of functions. Let me show you the summary view.\n"
+    f'functions.send_asset({{"assetUrl":"{_SLIDE_URL}","alt":"Summary {{with braces}} and \\"quotes\\""}})'
+    "\nIt highlights the action items for you.",
+    [{"assetUrl": _SLIDE_URL, "alt": 'Summary {with braces} and "quotes"'}],
+  ),
+  (
+    "Here are two views. functions.functions.send_asset( "
+    f'{{"assetUrl": "{_SLIDE_URL}", "alt": "First"}} ) and '
+    f'functions.send_asset({{"assetUrl": "{_SLIDE_URL}", "alt": "Second"}}). '
+    "Does that help? functions.",
+    [
+      {"assetUrl": _SLIDE_URL, "alt": "First"},
+      {"assetUrl": _SLIDE_URL, "alt": "Second"},
+    ],
+  ),
+  (
+    "No assets in this one, just plain speech about meeting notes, "
+    "integrations with Zoom, and how functions like search work.",
+    [],
+  ),
+]
+
+
+def random_split(text: str, rng: random.Random, max_len: int) -> list[str]:
+  deltas = []
+  i = 0
+  while i < len(text):
+    n = rng.randint(1, max_len)
+    deltas.append(text[i : i + n])
+    i += n
+  return deltas
+
+
+def parse(deltas: list[str]) -> tuple[str, list[InlineCall]]:
+  parser = InlineCallParser()
+  text: list[str] = []
+  calls: list[InlineCall] = []
+  for delta in deltas:
+    for item in parser.feed(delta):
+      (text if isinstance(item, str) else calls).append(item)
+  for item in parser.flush():
+    (text if isinstance(item, str) else calls).append(item)
+  return "".join(text), calls
+
+
+def fuzz(rounds: int, seed: int) -> None:
+  rng = random.Random(seed)
+  for response, expected_calls in RESPONSES:
+    expected_text, calls = parse([response])
+    assert [c.arguments for c in calls] == expected_calls, calls
+    assert "functions.send_asset" not in expected_text, expected_text
+
+    for _ in range(rounds):
+      deltas = random_split(response, rng, rng.choice([1, 2, 4, 8, 32]))
+      text, calls = parse(deltas)
+      assert text == expected_text, (deltas, text)
+      assert [c.arguments for c in calls] == expected_calls, (deltas, calls)
+      for call in calls:
+        json.loads(call.raw_arguments)
+
+  print(f"fuzz: {rounds * len(RESPONSES)} random splits ok")
+
+
+def benchmark(rounds: int, seed: int) -> None:
+  rng = random.Random(seed)
+  # ~4 chars per delta, like the assistant's token stream
+  splits = [
+    random_split(response, rng, 6) for response, _ in RESPONSES for _ in range(rounds)
+  ]
+  chars = sum(len(d) for deltas in splits for d in deltas)
+  deltas_count = sum(len(deltas) for deltas in splits)
+
+  start_time = time.perf_counter()
+  for deltas in splits:
+    parse(deltas)
+  elapsed = time.perf_counter() - start_time
+
+  print(
+    f"benchmark: {deltas_count} deltas, {chars / elapsed / 1e6:.2f}M chars/s, "
+    f"{elapsed / deltas_count * 1e6:.2f}us per delta"
+  )
+
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--rounds", type=int, default=500)
+  arg_parser.add_argument("--seed", type=int, default=0)
+  args = arg_parser.parse_args()
+
+  fuzz(args.rounds, args.seed)
+  benchmark(args.rounds, args.seed)
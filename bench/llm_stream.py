@@ -0,0 +1,386 @@
+"""Benchmarks claude.LLM and its LLMStream against recorded Anthropic streams.
+
+Two passes per scenario (text only, one tool call, two tool calls):
+
+  cpu      Responses are served from memory. Compares iterating the raw
+           Anthropic SDK stream with iterating LLMStream over the same events,
+           which gives the CPU cost and allocations LLMStream adds per event.
+  latency  Responses are replayed by bench.fake_anthropic in another process,
+           paced like the real API. Measures how long text takes from the
+           server writing it to LLMStream yielding it, which includes the time
+           it's held until the end of its clause, and the tool round-trip from
+           the end of a response to the follow-up request.
+
+  poetry run python -m bench.llm_stream --json results.json
+  poetry run python -m bench.llm_stream --compare results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+import anthropic
+import httpx
+from livekit.agents import llm
+
+from bench import fake_anthropic
+from demospace.functions import functions
+from demospace.livekit import claude
+from demospace.llm import assets, prompts
+
+# lower is better for all of them, checked by --compare
+COMPARED_METRICS = (
+  "llm_us_per_event",
+  "overhead_us_per_event",
+  "alloc_bytes_per_event",
+  "added_latency_p50_ms",
+  "tool_roundtrip_p50_ms",
+)
+
+QUESTIONS = {
+  "text_only": "We record a lot of customer calls, how would Otter help us?",
+  "tool_use": "How secure is our data with Otter?",
+  "multi_tool": "How do you compare to the competition, and what does it cost?",
+}
+
+
+class _FakeParticipant:
+  async def publish_data(self, payload, topic=None) -> None:
+    pass
+
+
+def build_chat_ctx(scenario: str) -> llm.ChatContext:
+  return llm.ChatContext(
+    messages=[
+      llm.ChatMessage(role=llm.ChatRole.USER, text=prompts.INITIAL_PROMPT),
+      llm.ChatMessage(role=llm.ChatRole.ASSISTANT, text=prompts.GREETING),
+      llm.ChatMessage(role=llm.ChatRole.USER, text=QUESTIONS.get(scenario, "Hi!")),
+    ]
+  )
+
+
+def build_llm(
+  client: anthropic.AsyncAnthropic,
+) -> tuple[claude.LLM, llm.FunctionContext]:
+  # a fresh LLM per turn, tool exchanges recorded by a previous one would shift
+  # the responses the server picks
+  room = types.SimpleNamespace(local_participant=_FakeParticipant())
+  asset_index = assets.load_index()
+  fnc_ctx = functions.Functions(room, asset_index.catalog)
+  claude_llm = claude.LLM(
+    room=room,
+    client=client,
+    system=prompts.SYSTEM_PROMPT,
+    turn_context=asset_index.turn_context,
+  )
+  return claude_llm, fnc_ctx
+
+
+def memory_client(
+  scenario: str, recordings: dict[str, list[list[bytes]]]
+) -> anthropic.AsyncAnthropic:
+  def _handler(request: httpx.Request) -> httpx.Response:
+    responses = recordings[scenario]
+    index = fake_anthropic.response_index(json.loads(request.content)["messages"])
+    return httpx.Response(
+      200,
+      headers={"Content-Type": "text/event-stream"},
+      content=b"".join(responses[min(index, len(responses) - 1)]),
+    )
+
+  return anthropic.AsyncAnthropic(
+    api_key="bench",
+    base_url=f"http://fake-anthropic/{scenario}",
+    http_client=httpx.AsyncClient(transport=httpx.MockTransport(_handler)),
+  )
+
+
+async def run_turn(
+  client: anthropic.AsyncAnthropic,
+  scenario: str,
+  on_chunk=None,
+  prebuilt: tuple[claude.LLM, llm.FunctionContext] | None = None,
+) -> int:
+  claude_llm, fnc_ctx = prebuilt or build_llm(client)
+  stream = await claude_llm.chat(build_chat_ctx(scenario), fnc_ctx)
+  chunks = 0
+  async for chunk in stream:
+    chunks += 1
+    if on_chunk is not None:
+      on_chunk(chunk)
+  await stream.aclose()
+  return chunks
+
+
+async def run_sdk(
+  client: anthropic.AsyncAnthropic, scenario: str, responses: int
+) -> int:
+  # the same responses without LLMStream, history doesn't matter to the SDK
+  events = 0
+  messages = [{"role": "user", "content": QUESTIONS.get(scenario, "Hi!")}]
+  for i in range(responses):
+    stream = await client.messages.create(
+      model="claude-3-5-sonnet-20240620",
+      max_tokens=1024,
+      messages=messages,
+      stream=True,
+    )
+    async for _ in stream:
+      events += 1
+    # the next response answers the tool results
+    messages = [
+      *messages,
+      {
+        "role": "assistant",
+        "content": [{"type": "tool_use", "id": f"t{i}", "name": "x", "input": {}}],
+      },
+      {
+        "role": "user",
+        "content": [{"type": "tool_result", "tool_use_id": f"t{i}", "content": ""}],
+      },
+    ]
+  return events
+
+
+async def bench_cpu(
+  scenario: str, recordings: dict[str, list[list[bytes]]], rounds: int
+) -> dict[str, float]:
+  client = memory_client(scenario, recordings)
+  responses = len(recordings[scenario])
+
+  await run_turn(client, scenario)  # warm up imports and caches
+  await run_sdk(client, scenario, responses)
+
+  # built outside the timing, the per-turn prompt building in chat() is counted
+  prebuilt = [build_llm(client) for _ in range(rounds)]
+  start = time.process_time()
+  for turn in prebuilt:
+    chunks = await run_turn(client, scenario, prebuilt=turn)
+  llm_cpu = time.process_time() - start
+
+  start = time.process_time()
+  for _ in range(rounds):
+    events = await run_sdk(client, scenario, responses)
+  sdk_cpu = time.process_time() - start
+
+  # allocations of a single turn, chunks are kept alive like the assistant does
+  kept = []
+  tracemalloc.start()
+  await run_turn(client, scenario, kept.append)
+  _, llm_peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  await client.close()
+  # per Anthropic event, LLMStream yields a chunk per clause rather than per delta
+  return {
+    "chunks_per_turn": chunks,
+    "events_per_turn": events,
+    "events_per_sec": rounds * events / llm_cpu,
+    "llm_us_per_event": llm_cpu / (rounds * events) * 1e6,
+    "sdk_us_per_event": sdk_cpu / (rounds * events) * 1e6,
+    "overhead_us_per_event": (llm_cpu - sdk_cpu) / (rounds * events) * 1e6,
+    "alloc_bytes_per_event": llm_peak / events,
+  }
+
+
+async def bench_latency(
+  scenario: str, http: httpx.AsyncClient, base_url: str, rounds: int
+) -> dict[str, float]:
+  client = anthropic.AsyncAnthropic(
+    api_key="bench",
+    base_url=f"{base_url}/{scenario}",
+    http_client=httpx.AsyncClient(timeout=anthropic.DEFAULT_TIMEOUT),
+  )
+  await run_turn(client, scenario)  # open the connection
+
+  added_latencies: list[float] = []
+  tool_roundtrips: list[float] = []
+  for _ in range(rounds):
+    await http.post(f"{base_url}/_bench/reset")
+    # (time, characters received so far)
+    received: list[tuple[float, int]] = []
+
+    def _on_chunk(chunk: llm.ChatChunk) -> None:
+      content = chunk.choices[0].delta.content if chunk.choices else None
+      if content:
+        total = received[-1][1] if received else 0
+        received.append((time.perf_counter(), total + len(content)))
+
+    await run_turn(client, scenario, _on_chunk)
+
+    trace = (await http.get(f"{base_url}/_bench/trace")).json()
+    sent = _text_delta_times(trace, scenario)
+    added_latencies.extend(_added_latencies(received, sent))
+    stops = [t for kind, _, _, t in trace if kind == "stop"]
+    requests = [t for kind, _, _, t in trace if kind == "request"]
+    tool_roundtrips.extend(r - s for s, r in zip(stops, requests[1:]))
+
+  await client.close()
+  result = {
+    "added_latency_p50_ms": _percentile(added_latencies, 0.5) * 1e3,
+    "added_latency_p95_ms": _percentile(added_latencies, 0.95) * 1e3,
+  }
+  if tool_roundtrips:
+    result["tool_roundtrip_p50_ms"] = _percentile(tool_roundtrips, 0.5) * 1e3
+    result["tool_roundtrip_p95_ms"] = _percentile(tool_roundtrips, 0.95) * 1e3
+  return result
+
+
+_recordings_cache: dict[str, list[list[bytes]]] = {}
+
+
+def _text_delta_times(trace: list, scenario: str) -> list[tuple[float, int]]:
+  """(time, characters sent so far) of every text delta the server wrote."""
+  # the server traces tool input deltas too, keep the text ones in order
+  if not _recordings_cache:
+    _recordings_cache.update(fake_anthropic.load_recordings())
+
+  text_lengths: dict[int, list[int | None]] = {}
+  for index, events in enumerate(_recordings_cache[scenario]):
+    text_lengths[index] = [
+      _text_length(e) for e in events if fake_anthropic.is_content_delta(e)
+    ]
+
+  deltas = []
+  total = 0
+  positions: dict[int, int] = {}
+  for kind, _, index, t in trace:
+    if kind != "delta":
+      continue
+    position = positions.get(index, 0)
+    positions[index] = position + 1
+    length = text_lengths[index][position]
+    if length is not None:
+      total += length
+      deltas.append((t, total))
+  return deltas
+
+
+def _text_length(event: bytes) -> int | None:
+  if b'"text_delta"' not in event:
+    return None
+  return len(json.loads(event.split(b"data: ", 1)[1])["delta"]["text"])
+
+
+def _added_latencies(
+  received: list[tuple[float, int]], sent: list[tuple[float, int]]
+) -> list[float]:
+  # each chunk against the delta holding its last character
+  latencies = []
+  i = 0
+  for t, total in received:
+    while i < len(sent) - 1 and sent[i][1] < total:
+      i += 1
+    if sent:
+      latencies.append(t - sent[i][0])
+  return latencies
+
+
+def _percentile(values: list[float], q: float) -> float:
+  if not values:
+    return 0.0
+  if len(values) == 1:
+    return values[0]
+  return statistics.quantiles(values, n=100, method="inclusive")[round(q * 100) - 1]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+  regressions = []
+  for scenario, metrics in results["scenarios"].items():
+    base = baseline["scenarios"].get(scenario, {})
+    for name in COMPARED_METRICS:
+      if name in metrics and base.get(name):
+        change = metrics[name] / base[name] - 1
+        if change > tolerance:
+          regressions.append(
+            f"{scenario}.{name}: {base[name]:.2f} -> {metrics[name]:.2f} ({change:+.0%})"
+          )
+  return regressions
+
+
+async def main(args: argparse.Namespace) -> dict:
+  recordings = fake_anthropic.load_recordings()
+  scenarios = args.scenarios or list(recordings)
+  pacing = fake_anthropic.Pacing(
+    first_token=args.first_token,
+    tokens_per_sec=args.tokens_per_sec,
+    jitter=args.jitter,
+    seed=args.seed,
+  )
+
+  results: dict[str, dict[str, float]] = {}
+  for scenario in scenarios:
+    results[scenario] = await bench_cpu(scenario, recordings, args.rounds)
+
+  server = fake_anthropic.start_process(pacing, port=args.port)
+  base_url = f"http://127.0.0.1:{args.port}"
+  try:
+    async with httpx.AsyncClient() as http:
+      for scenario in scenarios:
+        results[scenario].update(
+          await bench_latency(scenario, http, base_url, args.latency_rounds)
+        )
+  finally:
+    server.kill()
+
+  return {
+    "meta": {
+      "python": platform.python_version(),
+      "anthropic": anthropic.__version__,
+      "rounds": args.rounds,
+      "latency_rounds": args.latency_rounds,
+      "pacing": {
+        "first_token": pacing.first_token,
+        "tokens_per_sec": pacing.tokens_per_sec,
+        "jitter": pacing.jitter,
+      },
+    },
+    "scenarios": results,
+  }
+
+
+def print_results(results: dict) -> None:
+  for scenario, metrics in results["scenarios"].items():
+    print(scenario)
+    for name, value in metrics.items():
+      print(f"  {name:<26} {value:>12.2f}")
+
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+  )
+  arg_parser.add_argument("--scenarios", nargs="*")
+  arg_parser.add_argument("--rounds", type=int, default=200)
+  arg_parser.add_argument("--latency-rounds", type=int, default=5)
+  arg_parser.add_argument("--first-token", type=float, default=0.05)
+  arg_parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+  arg_parser.add_argument("--jitter", type=float, default=0.3)
+  arg_parser.add_argument("--seed", type=int, default=0)
+  arg_parser.add_argument("--port", type=int, default=8787)
+  arg_parser.add_argument("--json", help="write the results to this file")
+  arg_parser.add_argument("--compare", help="fail on regressions against these results")
+  arg_parser.add_argument("--tolerance", type=float, default=0.25)
+  args = arg_parser.parse_args()
+
+  results = asyncio.run(main(args))
+  print_results(results)
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(results, f, indent=2)
+
+  if args.compare:
+    with open(args.compare) as f:
+      regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print(f"regression: {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,646 @@
+"""Load test: concurrent agent sessions in one process, like a worker's jobs.
+
+Every session runs main.run_session, so the VoiceAssistant, the Silero VAD,
+claude.LLM and the asset functions are the real ones. Around them:
+
+  room  A stand-in for rtc.Room. The simulated user publishes a microphone
+        track fed with scripted 48KHz PCM in real time, and the agent's audio
+        is played out in real time. publish_data calls are recorded.
+  STT   Emits interim transcripts while the scripted user speaks, then the
+        final transcript shortly after they stop.
+  LLM   claude.LLM against bench.fake_anthropic in another process.
+  TTS   Returns a tone after a first-byte delay, faster than real time.
+        --tts-cache wraps it in CachedTTS like main.build_tts does.
+  VAD   --vad-shared-inference runs the VAD windows of every session in the
+        inference server, like main.py with VAD_SHARED_INFERENCE=1.
+
+Sessions are ramped through --sessions. For each step it reports the turn
+latency from the end of the user's speech to the first frame of the answer,
+event loop lag, playout underruns (audible gaps), CPU (with the VAD inference
+server's) and RSS. The largest step within the --max-* limits is the capacity
+of one worker.
+
+  poetry run python -m bench.load_test --sessions 1 2 4 8 --json load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+import anthropic
+import httpx
+import numpy as np
+import psutil
+from livekit import rtc
+from livekit.agents import stt, tts, utils
+from livekit.agents.voice_assistant import assistant as assistant_module
+
+import main
+from bench import fake_anthropic
+from demospace.livekit import silero, tts_cache
+from demospace.llm import assets
+
+MIC_SAMPLE_RATE = 48000
+FRAME_DURATION = 0.01
+
+UTTERANCES = [
+  "We record a lot of customer calls, how would Otter help us?",
+  "How secure is our data with Otter?",
+  "How do you compare to the competition, and what does it cost?",
+  "Can it update our CRM after every sales call?",
+  "That sounds great, how do we get started with a trial?",
+]
+
+
+def _speech_frames(seconds: float, seed: int) -> list[bytes]:
+  # voiced harmonics with a syllable envelope, close enough to speech for the
+  # VAD to do the same work
+  rng = np.random.default_rng(seed)
+  t = np.arange(int(seconds * MIC_SAMPLE_RATE)) / MIC_SAMPLE_RATE
+  f0 = 140 + 25 * np.sin(2 * np.pi * 0.7 * t)
+  phase = 2 * np.pi * np.cumsum(f0) / MIC_SAMPLE_RATE
+  voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+  envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 0.5
+  audio = 0.25 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+  return _to_frames(audio)
+
+
+def _silence_frames(seconds: float, seed: int) -> list[bytes]:
+  rng = np.random.default_rng(seed)
+  return _to_frames(0.002 * rng.standard_normal(int(seconds * MIC_SAMPLE_RATE)))
+
+
+def _to_frames(audio: np.ndarray) -> list[bytes]:
+  pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+  samples = int(MIC_SAMPLE_RATE * FRAME_DURATION)
+  return [
+    pcm[i : i + samples].tobytes() for i in range(0, len(pcm) - samples + 1, samples)
+  ]
+
+
+class _Audio:
+  speech = _speech_frames(10.0, 0)
+  silence = _silence_frames(2.0, 1)
+
+
+# -- room ----------------------------------------------------------------------
+
+
+class FakeAudioSource:
+  """Plays captured frames out in real time, with up to 200ms buffered like
+  the native audio source."""
+
+  def __init__(self, sample_rate: int, num_channels: int) -> None:
+    self.sample_rate = sample_rate
+    self.on_playout_start = None
+    self.underruns = 0
+    self._play_until = 0.0
+    self._last_capture = 0.0
+
+  async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+    now = time.perf_counter()
+    if now - self._last_capture > 0.25:
+      # a new answer, the gap before it is expected
+      if self.on_playout_start is not None:
+        self.on_playout_start(now)
+    elif now > self._play_until + 0.02:
+      self.underruns += 1
+
+    self._last_capture = now
+    self._play_until = (
+      max(self._play_until, now) + frame.samples_per_channel / frame.sample_rate
+    )
+    await asyncio.sleep(max(0.0, self._play_until - now - 0.2))
+
+
+class FakeLocalAudioTrack:
+  def __init__(self, name: str, source: FakeAudioSource) -> None:
+    self.name = name
+    self.source = source
+    self.sid = f"TR_{name}"
+
+  @classmethod
+  def create_audio_track(
+    cls, name: str, source: FakeAudioSource
+  ) -> FakeLocalAudioTrack:
+    return cls(name, source)
+
+
+class FakeRemoteAudioTrack:
+  def __init__(self, sid: str) -> None:
+    self.sid = sid
+    self.kind = rtc.TrackKind.KIND_AUDIO
+    self.frames = asyncio.Queue[rtc.AudioFrame | None]()
+
+
+class FakeAudioStream:
+  def __init__(self, track: FakeRemoteAudioTrack, **kwargs) -> None:
+    self._track = track
+
+  def __aiter__(self) -> FakeAudioStream:
+    return self
+
+  async def __anext__(self) -> rtc.AudioFrameEvent:
+    frame = await self._track.frames.get()
+    if frame is None:
+      raise StopAsyncIteration
+    return rtc.AudioFrameEvent(frame)
+
+
+class FakePublication:
+  def __init__(self, track) -> None:
+    self.sid = track.sid
+    self.track = track
+    self.kind = rtc.TrackKind.KIND_AUDIO
+    self.source = rtc.TrackSource.SOURCE_MICROPHONE
+    self.subscribed = True
+
+
+class FakeLocalParticipant:
+  def __init__(self, on_track_published) -> None:
+    self.identity = "agent"
+    self.sid = "PA_agent"
+    self.tracks: dict[str, FakePublication] = {}
+    self.data: list[tuple[str | None, str]] = []
+    self.transcriptions = 0
+    self._on_track_published = on_track_published
+
+  async def publish_data(self, payload, topic: str | None = None, **kwargs) -> None:
+    self.data.append((topic, payload))
+
+  async def publish_track(self, track, options=None) -> FakePublication:
+    publication = FakePublication(track)
+    self.tracks[publication.sid] = publication
+    self._on_track_published(track)
+    return publication
+
+  async def publish_transcription(self, transcription) -> None:
+    self.transcriptions += 1
+
+
+class FakeRemoteParticipant:
+  def __init__(self, identity: str, mic: FakeRemoteAudioTrack) -> None:
+    self.identity = identity
+    self.sid = f"PA_{identity}"
+    publication = FakePublication(mic)
+    self.tracks = {publication.sid: publication}
+
+
+class FakeRoom(utils.EventEmitter):
+  """Stand-in for rtc.Room with one user whose microphone is already subscribed."""
+
+  def __init__(self, index: int) -> None:
+    super().__init__()
+    self.name = f"load-test-{index}"
+    self.mic = FakeRemoteAudioTrack(f"TR_mic_{index}")
+    self.user = FakeRemoteParticipant(f"user-{index}", self.mic)
+    self.participants = {self.user.sid: self.user}
+    self.participants_by_identity = {self.user.identity: self.user}
+    self.agent_audio: FakeAudioSource | None = None
+    self.local_participant = FakeLocalParticipant(self._on_track_published)
+
+  def _on_track_published(self, track) -> None:
+    if isinstance(track, FakeLocalAudioTrack):
+      self.agent_audio = track.source
+
+
+def install_fake_rtc() -> None:
+  # the objects VoiceAssistant creates itself need a connected room, everything
+  # else is the real rtc module
+  fake_rtc = types.SimpleNamespace(**vars(rtc))
+  fake_rtc.AudioSource = FakeAudioSource
+  fake_rtc.LocalAudioTrack = FakeLocalAudioTrack
+  fake_rtc.AudioStream = FakeAudioStream
+  assistant_module.rtc = fake_rtc
+
+
+# -- providers -----------------------------------------------------------------
+
+
+class _Utterance:
+  def __init__(self, text: str) -> None:
+    self.text = text
+    self.words = text.split()
+    self.ended = False
+
+
+class FakeSTT(stt.STT):
+  def __init__(self, *, final_delay: float) -> None:
+    super().__init__(streaming_supported=True)
+    self.final_delay = final_delay
+    self.utterance: _Utterance | None = None
+    self.streams: list[FakeSpeechStream] = []
+
+  async def recognize(self, *, buffer, language: str | None = None) -> stt.SpeechEvent:
+    raise NotImplementedError
+
+  def stream(self, *, language: str | None = None) -> FakeSpeechStream:
+    stream = FakeSpeechStream(self)
+    self.streams.append(stream)
+    return stream
+
+
+class FakeSpeechStream(stt.SpeechStream):
+  """Transcribes the utterance the session is speaking, a word every 250ms of
+  speech and the final transcript `final_delay` after the speech ended."""
+
+  def __init__(self, fake_stt: FakeSTT) -> None:
+    self._stt = fake_stt
+    self._events = asyncio.Queue[stt.SpeechEvent | None]()
+    self._speech_frames = 0
+    self._utterance: _Utterance | None = None
+
+  def push_frame(self, frame: rtc.AudioFrame) -> None:
+    utterance = self._stt.utterance
+    if utterance is None or utterance is self._utterance:
+      return
+
+    if utterance.ended:
+      self._utterance = utterance
+      self._speech_frames = 0
+      asyncio.get_running_loop().call_later(
+        self._stt.final_delay, self._final, utterance
+      )
+      return
+
+    self._speech_frames += 1
+    if self._speech_frames % 25 == 0:
+      words = utterance.words[: self._speech_frames // 25]
+      self._put(stt.SpeechEventType.INTERIM_TRANSCRIPT, " ".join(words))
+
+  def _final(self, utterance: _Utterance) -> None:
+    self._put(stt.SpeechEventType.FINAL_TRANSCRIPT, utterance.text)
+    self._events.put_nowait(stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH))
+
+  def _put(self, event_type: stt.SpeechEventType, text: str) -> None:
+    self._events.put_nowait(
+      stt.SpeechEvent(
+        type=event_type, alternatives=[stt.SpeechData(language="en", text=text)]
+      )
+    )
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    self._events.put_nowait(None)
+
+  async def __anext__(self) -> stt.SpeechEvent:
+    ev = await self._events.get()
+    if ev is None:
+      raise StopAsyncIteration
+    return ev
+
+
+class FakeTTS(tts.TTS):
+  def __init__(self, *, first_byte: float, speed: float) -> None:
+    super().__init__(streaming_supported=False, sample_rate=22050, num_channels=1)
+    self.first_byte = first_byte
+    self.speed = speed
+
+  def synthesize(self, text: str) -> FakeChunkedStream:
+    return FakeChunkedStream(text, self)
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+  # ~15 characters per second of speech, 10ms frames like the ElevenLabs plugin
+  _frame = (
+    ((0.1 * np.sin(2 * np.pi * 220 * np.arange(220) / 22050)) * 32767)
+    .astype(np.int16)
+    .tobytes()
+  )
+
+  def __init__(self, text: str, fake_tts: FakeTTS) -> None:
+    self._text = text
+    self._tts = fake_tts
+    self._frames = max(1, int(len(text) / 15 / FRAME_DURATION))
+    self._sent = 0
+
+  async def __anext__(self) -> tts.SynthesizedAudio:
+    if self._sent >= self._frames:
+      raise StopAsyncIteration
+    if self._sent == 0:
+      await asyncio.sleep(self._tts.first_byte)
+    elif self._sent % 10 == 0:
+      await asyncio.sleep(10 * FRAME_DURATION / self._tts.speed)
+
+    self._sent += 1
+    frame = rtc.AudioFrame(
+      data=self._frame, sample_rate=22050, num_channels=1, samples_per_channel=220
+    )
+    return tts.SynthesizedAudio(text=self._text, data=frame)
+
+  async def aclose(self) -> None:
+    self._sent = self._frames
+
+
+# -- sessions ------------------------------------------------------------------
+
+
+class Session:
+  def __init__(self, index: int, base_url: str, args: argparse.Namespace) -> None:
+    self.index = index
+    self.room = FakeRoom(index)
+    scenarios = list(fake_anthropic.load_recordings())
+    self.client = anthropic.AsyncAnthropic(
+      api_key="load-test",
+      base_url=f"{base_url}/{scenarios[index % len(scenarios)]}",
+      http_client=httpx.AsyncClient(timeout=anthropic.DEFAULT_TIMEOUT),
+    )
+    self.stt = FakeSTT(final_delay=args.stt_final_delay)
+    self.tts = FakeTTS(first_byte=args.tts_first_byte, speed=args.tts_speed)
+    if args.tts_cache:
+      self.tts = tts_cache.CachedTTS(self.tts, voice="load-test", model="fake")
+    self.args = args
+    self.latencies: list[float] = []
+    self.failed_turns = 0
+    self._speech_ended_at: float | None = None
+    self._answered = asyncio.Event()
+    self._utterance_frames = iter(())
+    self._utterance_done: asyncio.Event | None = None
+    self._rng = random.Random(index)
+
+  @property
+  def underruns(self) -> int:
+    return self.room.agent_audio.underruns if self.room.agent_audio else 0
+
+  async def run(self, turns: int) -> None:
+    mic_task = asyncio.create_task(self._mic())
+    assistant = None
+    try:
+      assistant = await main.run_session(
+        self.room, stt=self.stt, tts=self.tts, anthropic_client=self.client
+      )
+      self.room.agent_audio.on_playout_start = self._on_playout_start
+
+      for i in range(turns):
+        await asyncio.sleep(self._rng.uniform(0.5, 1.5))
+        await self._speak(UTTERANCES[(self.index + i) % len(UTTERANCES)])
+        try:
+          await asyncio.wait_for(self._answered.wait(), self.args.turn_timeout)
+          # let the answer play out before the next question
+          await asyncio.sleep(self.args.listen)
+        except asyncio.TimeoutError:
+          self.failed_turns += 1
+    finally:
+      mic_task.cancel()
+      self.room.mic.frames.put_nowait(None)
+      if assistant is not None:
+        await assistant.aclose(wait=False)
+      await self.client.close()
+
+  async def _speak(self, text: str) -> None:
+    utterance = _Utterance(text)
+    # about 2.5 words per second
+    frames = int(len(utterance.words) / 2.5 / FRAME_DURATION)
+    done = asyncio.Event()
+    self._answered.clear()
+    self.stt.utterance = utterance
+    self._utterance_frames = iter(_Audio.speech[:frames])
+    self._utterance_done = done
+    await done.wait()
+    utterance.ended = True
+    self._speech_ended_at = time.perf_counter()
+
+  async def _mic(self) -> None:
+    # a microphone sends frames all the time, silence between utterances
+    samples = int(MIC_SAMPLE_RATE * FRAME_DURATION)
+    start = time.perf_counter()
+    for n in range(sys.maxsize):
+      data = next(self._utterance_frames, None)
+      if data is None:
+        if self._utterance_done is not None:
+          self._utterance_done.set()
+          self._utterance_done = None
+        data = _Audio.silence[n % len(_Audio.silence)]
+
+      self.room.mic.frames.put_nowait(
+        rtc.AudioFrame(
+          data=data,
+          sample_rate=MIC_SAMPLE_RATE,
+          num_channels=1,
+          samples_per_channel=samples,
+        )
+      )
+      await asyncio.sleep(
+        max(0.0, start + (n + 1) * FRAME_DURATION - time.perf_counter())
+      )
+
+  def _on_playout_start(self, now: float) -> None:
+    if self._speech_ended_at is not None:
+      self.latencies.append(now - self._speech_ended_at)
+      self._speech_ended_at = None
+      self._answered.set()
+
+
+async def _monitor_loop_lag(lags: list[float], stop: asyncio.Event) -> None:
+  interval = 0.01
+  while not stop.is_set():
+    start = time.perf_counter()
+    await asyncio.sleep(interval)
+    lags.append(time.perf_counter() - start - interval)
+
+
+async def _sample_process(
+  samples: list[tuple[float, int]], stop: asyncio.Event, vad_server_pid: int | None
+) -> None:
+  process = psutil.Process()
+  process.cpu_percent()
+  vad_server = psutil.Process(vad_server_pid) if vad_server_pid else None
+  if vad_server is not None:
+    vad_server.cpu_percent()
+  while not stop.is_set():
+    await asyncio.sleep(0.5)
+    cpu = process.cpu_percent()
+    if vad_server is not None:
+      cpu += vad_server.cpu_percent()
+    samples.append((cpu, process.memory_info().rss))
+
+
+async def run_step(n: int, base_url: str, args: argparse.Namespace) -> dict:
+  sessions = [Session(i, base_url, args) for i in range(n)]
+  stop = asyncio.Event()
+  lags: list[float] = []
+  process_samples: list[tuple[float, int]] = []
+  monitors = [
+    asyncio.create_task(_monitor_loop_lag(lags, stop)),
+    asyncio.create_task(_sample_process(process_samples, stop, args.vad_server_pid)),
+  ]
+
+  async def _run(session: Session) -> None:
+    # jobs don't all start at the same moment
+    await asyncio.sleep(session.index * args.stagger)
+    await session.run(args.turns)
+
+  started = time.perf_counter()
+  results = await asyncio.gather(*[_run(s) for s in sessions], return_exceptions=True)
+  elapsed = time.perf_counter() - started
+  stop.set()
+  await asyncio.gather(*monitors)
+
+  errors = [r for r in results if isinstance(r, Exception)]
+  for error in errors:
+    logging.error(f"session failed: {error!r}")
+
+  latencies = [lat for s in sessions for lat in s.latencies]
+  cpu = [c for c, _ in process_samples]
+  return {
+    "sessions": n,
+    "seconds": elapsed,
+    "turns": len(latencies),
+    "failed_turns": sum(s.failed_turns for s in sessions) + len(errors),
+    "turn_latency_p50_ms": _percentile(latencies, 0.5) * 1e3,
+    "turn_latency_p95_ms": _percentile(latencies, 0.95) * 1e3,
+    "turn_latency_p99_ms": _percentile(latencies, 0.99) * 1e3,
+    "loop_lag_p50_ms": _percentile(lags, 0.5) * 1e3,
+    "loop_lag_p99_ms": _percentile(lags, 0.99) * 1e3,
+    "loop_lag_max_ms": max(lags, default=0.0) * 1e3,
+    "underruns": sum(s.underruns for s in sessions),
+    "cpu_percent_avg": statistics.fmean(cpu) if cpu else 0.0,
+    "cpu_percent_max": max(cpu, default=0.0),
+    "rss_mb_max": max((rss for _, rss in process_samples), default=0) / 2**20,
+    "data_messages": sum(len(s.room.local_participant.data) for s in sessions),
+  }
+
+
+def _percentile(values: list[float], q: float) -> float:
+  if not values:
+    return 0.0
+  if len(values) == 1:
+    return values[0]
+  return statistics.quantiles(values, n=100, method="inclusive")[round(q * 100) - 1]
+
+
+def check_limits(step: dict, args: argparse.Namespace) -> list[str]:
+  violations = []
+  if step["failed_turns"] > 0:
+    violations.append(f"{step['failed_turns']} turns failed")
+  if step["turn_latency_p95_ms"] > args.max_latency_p95_ms:
+    violations.append(f"turn latency p95 {step['turn_latency_p95_ms']:.0f}ms")
+  if step["loop_lag_p99_ms"] > args.max_loop_lag_p99_ms:
+    violations.append(f"loop lag p99 {step['loop_lag_p99_ms']:.0f}ms")
+  if step["underruns"] > args.max_underruns:
+    violations.append(f"{step['underruns']} playout underruns")
+  return violations
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+  install_fake_rtc()
+  silero.prewarm()
+  assets.prewarm()
+
+  pacing = fake_anthropic.Pacing(
+    first_token=args.llm_first_token,
+    tokens_per_sec=args.tokens_per_sec,
+    jitter=args.jitter,
+  )
+  server = fake_anthropic.start_process(pacing, port=args.port, record_trace=False)
+  base_url = f"http://127.0.0.1:{args.port}"
+
+  steps = []
+  capacity = 0
+  try:
+    for n in args.sessions:
+      step = await run_step(n, base_url, args)
+      step["violations"] = check_limits(step, args)
+      steps.append(step)
+      print_step(step)
+      if step["violations"]:
+        if args.stop_on_violation:
+          break
+      else:
+        capacity = max(capacity, n)
+      gc.collect()
+  finally:
+    server.kill()
+
+  return {
+    "meta": {
+      "cpus": os.cpu_count(),
+      "turns": args.turns,
+      "limits": {
+        "max_latency_p95_ms": args.max_latency_p95_ms,
+        "max_loop_lag_p99_ms": args.max_loop_lag_p99_ms,
+        "max_underruns": args.max_underruns,
+      },
+    },
+    "steps": steps,
+    "capacity": capacity,
+  }
+
+
+def print_step(step: dict) -> None:
+  print(
+    f"{step['sessions']:>3} sessions: turns={step['turns']} failed={step['failed_turns']} "
+    f"latency p50/p95/p99={step['turn_latency_p50_ms']:.0f}/"
+    f"{step['turn_latency_p95_ms']:.0f}/{step['turn_latency_p99_ms']:.0f}ms "
+    f"loop lag p99/max={step['loop_lag_p99_ms']:.1f}/{step['loop_lag_max_ms']:.1f}ms "
+    f"underruns={step['underruns']} cpu={step['cpu_percent_avg']:.0f}% "
+    f"rss={step['rss_mb_max']:.0f}MB"
+    + (f"  [{', '.join(step['violations'])}]" if step["violations"] else "")
+  )
+
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+  )
+  arg_parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+  arg_parser.add_argument("--turns", type=int, default=3)
+  arg_parser.add_argument("--stagger", type=float, default=0.2)
+  arg_parser.add_argument("--listen", type=float, default=1.0)
+  arg_parser.add_argument("--turn-timeout", type=float, default=20.0)
+  arg_parser.add_argument("--stt-final-delay", type=float, default=0.2)
+  arg_parser.add_argument("--llm-first-token", type=float, default=0.4)
+  arg_parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+  arg_parser.add_argument("--jitter", type=float, default=0.3)
+  arg_parser.add_argument("--tts-first-byte", type=float, default=0.2)
+  arg_parser.add_argument("--tts-speed", type=float, default=3.0)
+  arg_parser.add_argument(
+    "--tts-cache", action="store_true", help="wrap the TTS in CachedTTS"
+  )
+  arg_parser.add_argument(
+    "--vad-shared-inference",
+    action="store_true",
+    help="batch the VAD windows of every session in the inference server",
+  )
+  arg_parser.add_argument("--port", type=int, default=8788)
+  arg_parser.add_argument("--max-latency-p95-ms", type=float, default=4000.0)
+  arg_parser.add_argument("--max-loop-lag-p99-ms", type=float, default=50.0)
+  arg_parser.add_argument("--max-underruns", type=int, default=0)
+  arg_parser.add_argument("--stop-on-violation", action="store_true")
+  arg_parser.add_argument(
+    "--min-capacity", type=int, help="exit 1 below this many sessions"
+  )
+  arg_parser.add_argument("--json", help="write the results to this file")
+  args = arg_parser.parse_args()
+
+  logging.basicConfig(level=logging.WARNING)
+  # --tts-cache starts from an empty cache
+  os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="load_test_tts_"))
+
+  args.vad_server_pid = None
+  if args.vad_shared_inference:
+    # forked before the event loop starts, like main.py does
+    silero.prewarm()
+    args.vad_server_pid = silero.start_inference_server(
+      silero.inference_options(enabled=True)
+    ).pid
+
+  results = asyncio.run(main_async(args))
+  print(f"capacity: {results['capacity']} sessions")
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(results, f, indent=2)
+
+  if args.min_capacity is not None and results["capacity"] < args.min_capacity:
+    sys.exit(1)
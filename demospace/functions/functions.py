@@ -6,35 +6,49 @@ from livekit.agents import (
   llm,
 )
 
+from demospace.livekit import claude
+from demospace.llm import assets
+
 
 class Functions(
   llm.FunctionContext,
 ):
-  def __init__(self, room: rtc.Room):
+  def __init__(self, room: rtc.Room, catalog: assets.AssetCatalog | None = None):
     self._room = room
+    self._catalog = catalog or assets.load_catalog()
     super().__init__()
 
+  async def publish_manifest(self) -> None:
+    # lets the frontend prefetch every asset and look them up by the assetId of
+    # the asset events. Frontends not subscribed to the topic ignore it.
+    await self._room.local_participant.publish_data(
+      payload=json.dumps(self._catalog.manifest()),
+      topic="asset_manifest",
+    )
+
+  # the slide shows up while the model is still streaming the rest of the call,
+  # and the model goes on without waiting for the data channel
+  @claude.early_dispatch
+  @claude.optimistic(result="asset sent")
   @llm.ai_callable(desc="Send a visual asset to the customer's application.")
   async def send_asset(
     self,
-    assetUrl: Annotated[
+    assetId: Annotated[
       str,
       llm.TypeInfo(
-        desc="The URL of the visual asset. Taken from the Assets section of the prompt."
-      ),
-    ],
-    alt: Annotated[
-      str,
-      llm.TypeInfo(
-        desc="The alt text of the visual asset. Taken from the Assets section of the prompt."
+        desc="The id of the visual asset. Taken from the Assets section of the customer's latest message."
       ),
     ],
   ):
+    asset = self._catalog.get(assetId)  # rejects made up ids before publishing
+
+    # assetUrl and alt for the frontends that don't read the manifest
     await self._room.local_participant.publish_data(
       payload=json.dumps(
         {
-          "assetUrl": assetUrl,
-          "alt": alt,
+          "assetUrl": asset.url,
+          "alt": asset.alt,
+          "assetId": asset.id,
         }
       ),
       topic="asset",
@@ -1,7 +1,29 @@
+from demospace.livekit.claude.coalesce import (
+  CoalesceOptions,
+)
 from demospace.livekit.claude.llm import (
   LLM,
 )
+from demospace.livekit.claude.pool import (
+  prewarm,
+)
+from demospace.livekit.claude.speculation import (
+  SpeculativeSTT,
+)
+from demospace.livekit.claude.tool_calling import (
+  early_dispatch,
+  optimistic,
+)
+from demospace.livekit.claude.window import (
+  WindowOptions,
+)
 
 __all__ = [
+  "CoalesceOptions",
   "LLM",
+  "SpeculativeSTT",
+  "WindowOptions",
+  "early_dispatch",
+  "optimistic",
+  "prewarm",
 ]
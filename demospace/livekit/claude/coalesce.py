@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import re
+import time
+
+from attrs import define
+
+__all__ = [
+  "CoalesceOptions",
+  "TextCoalescer",
+]
+
+# end of a clause or sentence, with the closing quotes or brackets after it
+_BOUNDARY = re.compile(r"[.!?;:,]+[\"')\]]*(?:\s+|$)|\n+")
+
+
+@define(kw_only=True)
+class CoalesceOptions:
+  # text is held until the end of a clause, at most this long after its first
+  # delta arrived. 0 releases every delta.
+  max_hold: float = 0.3
+  max_chars: int = 200
+
+
+class TextCoalescer:
+  """Buffers the text deltas of a response and releases them at the end of a
+  clause or sentence.
+
+  Consumers get a chunk per clause instead of one per token. The TTS sentence
+  tokenizer holds back incomplete sentences anyway, so releasing at clause
+  boundaries doesn't delay the audio. The hold deadline is checked as deltas
+  arrive, the stream flushes what's left at the end of each text block.
+  """
+
+  def __init__(self, opts: CoalesceOptions | None = None) -> None:
+    self._opts = opts or CoalesceOptions()
+    self._parts: list[str] = []
+    self._size = 0
+    self._held_since = 0.0
+    # offset in the buffered text up to which it can be released
+    self._release_at = 0
+
+  def push(self, text: str) -> None:
+    if not text:
+      return
+    if not self._parts:
+      self._held_since = time.perf_counter()
+
+    end = 0
+    for match in _BOUNDARY.finditer(text):
+      end = match.end()
+    if end:
+      self._release_at = self._size + end
+
+    self._parts.append(text)
+    self._size += len(text)
+
+  def push_boundary(self) -> None:
+    """Marks everything buffered so far as ready, e.g. at the end of a block."""
+    self._release_at = self._size
+
+  def take(self) -> str | None:
+    """Returns the text ready to be released, if any."""
+    if not self._parts:
+      return None
+
+    if self._release_at:
+      text = "".join(self._parts)
+      released, rest = text[: self._release_at], text[self._release_at :]
+      self._parts = [rest] if rest else []
+      self._size = len(rest)
+      self._release_at = 0
+      # the rest was received with the boundary, it's held from now
+      self._held_since = time.perf_counter()
+      return released
+
+    if (
+      self._size >= self._opts.max_chars
+      or time.perf_counter() - self._held_since >= self._opts.max_hold
+    ):
+      return self.flush()
+    return None
+
+  def flush(self) -> str | None:
+    if not self._parts:
+      return None
+    text = "".join(self._parts) if len(self._parts) > 1 else self._parts[0]
+    self._parts = []
+    self._size = 0
+    self._release_at = 0
+    return text
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from typing import Any
+
+from attrs import define
+from livekit.agents import llm
+
+__all__ = [
+  "ContextConverter",
+]
+
+
+@define
+class _ConvertedMessage:
+  role: llm.ChatRole
+  text: str
+  spoken_before_tools: str
+  # None when nothing is left to send, e.g. an assistant message whose text was
+  # all spoken before a tool call
+  message: dict[str, Any] | None
+
+
+@define
+class _ToolExchange:
+  anchor: str  # text of the chat message this exchange followed
+  text: str  # assistant text streamed before the tool call
+  tool_uses: list[dict[str, Any]]
+  tool_results: list[dict[str, Any]]
+
+
+class ContextConverter:
+  """Converts a session's ChatContext to Anthropic messages incrementally.
+
+  VoiceAssistant hands chat() a fresh copy of the context every turn, so
+  converted messages are cached by position and reused while the role and text
+  are unchanged. Tool round-trips are recorded against the message they
+  followed and replayed in later turns.
+  """
+
+  def __init__(self) -> None:
+    self._converted: list[_ConvertedMessage | None] = []
+    self._exchanges: dict[int, list[_ToolExchange]] = {}
+    self._tool_failures: dict[str, str] = {}
+
+  def convert(
+    self, chat_ctx: llm.ChatContext, *, turn_context: str | None = None
+  ) -> list[dict[str, Any]]:
+    """`turn_context` is added to the latest user message for this request only."""
+    messages: list[dict[str, Any]] = []
+    spoken_before_tools = ""
+    last_index = len(chat_ctx.messages) - 1
+    for i, msg in enumerate(chat_ctx.messages):
+      converted = self._converted_message(i, msg, spoken_before_tools)
+      if converted.message is not None:
+        if turn_context and i == last_index and msg.role == llm.ChatRole.USER:
+          messages.append(_with_text(converted.message, turn_context))
+        else:
+          messages.append(converted.message)
+
+      spoken_before_tools = ""
+      for exchange in self._matching_exchanges(i, msg):
+        messages.extend(_build_tool_exchange(exchange, self._tool_failures))
+        spoken_before_tools += exchange.text
+
+    return messages
+
+  def add_tool_exchange(
+    self,
+    chat_ctx: llm.ChatContext,
+    *,
+    text: str,
+    tool_uses: list[dict[str, Any]],
+    tool_results: list[dict[str, Any]],
+  ) -> None:
+    index = len(chat_ctx.messages) - 1
+    if index < 0:
+      return
+
+    anchor = chat_ctx.messages[index].text
+    exchanges = [e for e in self._exchanges.get(index, []) if e.anchor == anchor]
+    exchanges.append(
+      _ToolExchange(
+        anchor=anchor, text=text, tool_uses=tool_uses, tool_results=tool_results
+      )
+    )
+    self._exchanges[index] = exchanges
+
+  def add_tool_failure(self, tool_use_id: str, note: str) -> None:
+    """Replaces the result of a tool that failed after its result was sent."""
+    self._tool_failures[tool_use_id] = note
+
+  def _matching_exchanges(
+    self, index: int, msg: llm.ChatMessage
+  ) -> list[_ToolExchange]:
+    return [e for e in self._exchanges.get(index, []) if e.anchor == msg.text]
+
+  def _converted_message(
+    self, index: int, msg: llm.ChatMessage, spoken_before_tools: str
+  ) -> _ConvertedMessage:
+    if index < len(self._converted):
+      cached = self._converted[index]
+      if (
+        cached is not None
+        and cached.role is msg.role
+        and (cached.text is msg.text or cached.text == msg.text)
+        and cached.spoken_before_tools == spoken_before_tools
+      ):
+        return cached
+    else:
+      self._converted.extend([None] * (index + 1 - len(self._converted)))
+
+    text = msg.text
+    if (
+      spoken_before_tools
+      and msg.role == llm.ChatRole.ASSISTANT
+      and isinstance(text, str)
+      and text.startswith(spoken_before_tools)
+    ):
+      # already part of the assistant turns carrying the tool calls
+      text = text[len(spoken_before_tools) :]
+
+    converted = _ConvertedMessage(
+      role=msg.role,
+      text=msg.text,
+      spoken_before_tools=spoken_before_tools,
+      message=_build_anthropic_message(msg.role, text) if text else None,
+    )
+    self._converted[index] = converted
+    return converted
+
+
+def _build_tool_exchange(
+  exchange: _ToolExchange, tool_failures: dict[str, str]
+) -> list[dict[str, Any]]:
+  assistant_content: list[dict[str, Any]] = []
+  if exchange.text:
+    assistant_content.append(
+      {
+        "type": "text",
+        "text": exchange.text,
+      }
+    )
+  assistant_content.extend(exchange.tool_uses)
+
+  return [
+    {
+      "role": "assistant",
+      "content": assistant_content,
+    },
+    {
+      "role": "user",
+      "content": [
+        _with_tool_failure(result, tool_failures) for result in exchange.tool_results
+      ],
+    },
+  ]
+
+
+def _with_tool_failure(
+  tool_result: dict[str, Any], tool_failures: dict[str, str]
+) -> dict[str, Any]:
+  note = tool_failures.get(tool_result["tool_use_id"])
+  if note is None:
+    return tool_result
+
+  return {**tool_result, "content": note, "is_error": True}
+
+
+def _with_text(anthropic_msg: dict[str, Any], text: str) -> dict[str, Any]:
+  # converted messages are cached, don't mutate them
+  content = anthropic_msg["content"]
+  if isinstance(content, str):
+    content = [{"type": "text", "text": content}]
+  return {**anthropic_msg, "content": [*content, {"type": "text", "text": text}]}
+
+
+def _build_anthropic_message(role: llm.ChatRole, text: str | list) -> dict[str, Any]:
+  anthropic_msg: dict = {
+    "role": role.value,
+  }
+
+  # add content if provided
+  if isinstance(text, str):
+    anthropic_msg["content"] = text
+  elif isinstance(text, list):
+    anthropic_content = []
+    for content in text:
+      if isinstance(content, str):
+        anthropic_content.append(
+          {
+            "type": "text",
+            "text": content,
+          }
+        )
+
+    anthropic_msg["content"] = anthropic_content
+
+  return anthropic_msg
@@ -10,10 +10,35 @@ from attrs import define
 from livekit import rtc
 from livekit.agents import llm
 
-from demospace.livekit.claude import tool_calling
+from demospace.livekit.claude import (
+  coalesce,
+  context,
+  pool,
+  speculation,
+  tool_calling,
+  window,
+)
+from demospace.llm import partial_json
+from demospace.utils import metrics, tracing
 
 ChatModels = Literal["claude-3-5-sonnet-20240620",]
 
+_PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+_input_tokens = metrics.counter(
+  "llm_input_tokens_total", "Uncached input tokens sent to Anthropic."
+)
+_cache_creation_input_tokens = metrics.counter(
+  "llm_cache_creation_input_tokens_total", "Input tokens written to the prompt cache."
+)
+_cache_read_input_tokens = metrics.counter(
+  "llm_cache_read_input_tokens_total", "Input tokens read from the prompt cache."
+)
+_output_tokens = metrics.counter(
+  "llm_output_tokens_total", "Output tokens generated by Anthropic."
+)
+
 
 @define
 class LLMOptions:
@@ -29,12 +54,28 @@ class LLM(llm.LLM):
     client: anthropic.AsyncClient | None = None,
     max_tokens: int = 1024,
     system: str | None = None,
+    prompt_caching: bool = True,
+    tool_timeout: float | None = 5.0,
+    turn_context: Callable[[llm.ChatContext], str | None] | None = None,
+    context_window: window.WindowOptions | None = None,
+    text_coalescing: coalesce.CoalesceOptions | None = None,
   ) -> None:
     self._room: rtc.Room = room
     self._opts: LLMOptions = LLMOptions(model=model)
-    self._client: anthropic.AsyncClient = client or anthropic.AsyncAnthropic()
+    self._client: anthropic.AsyncClient = client or pool.get_client()
     self._max_tokens: int = max_tokens
     self._system: str | None = system
+    self._prompt_caching: bool = prompt_caching
+    self._tool_timeout: float | None = tool_timeout
+    # extra text for the latest user message, e.g. the assets relevant to it
+    self._turn_context = turn_context
+    self._converter = context.ContextConverter()
+    # bounds the prompt of long sessions, older turns are summarized
+    self._window = window.ContextWindow(self._client, context_window)
+    # text is handed to the assistant a clause at a time rather than per token
+    self._coalesce_opts = text_coalescing
+    self._speculation: speculation.Speculation | None = None
+    self._background_tasks: MutableSet[asyncio.Task[None]] = set()
 
   async def chat(
     self,
@@ -43,89 +84,173 @@ class LLM(llm.LLM):
     temperature: float | None = None,
     n: int | None = None,
   ) -> "LLMStream":
-    tools = []
-    if fnc_ctx and len(fnc_ctx.ai_functions) > 0:
-      for fnc in fnc_ctx.ai_functions.values():
-        tools.append(tool_calling.build_function_description(fnc))
-
-    stream = await self._client.messages.create(
-      max_tokens=self._max_tokens,
-      model=self._opts.model,
-      tools=tools,
-      messages=_build_anthropic_context(history),
-      system=self._system,
-      stream=True,
-    )
+    tracing.mark(tracing.Stage.LLM_REQUEST)
+    request = self._request_options(fnc_ctx)
+
+    stream = self._take_speculation(history, fnc_ctx)
+    if stream is None:
+      stream = await self._client.messages.create(
+        **request, messages=self._build_messages(history), stream=True
+      )
 
-    async def _send_tool_result(
+    async def _send_tool_results(
       message_text: str,
-      fnc_name: str,
-      fnc_raw_arguments: str,
-      tool_use_id: str,
-      result: str,
+      tool_uses: list[dict[str, Any]],
+      tool_results: list[dict[str, Any]],
     ):
-      args = json.loads(fnc_raw_arguments)
-      messages = _build_anthropic_context(history)
-      messages.extend(
-        [
-          {
-            "role": "assistant",
-            "content": [
-              {
-                "type": "text",
-                "text": message_text,
-              },
-              {
-                "type": "tool_use",
-                "id": tool_use_id,
-                "name": fnc_name,
-                "input": args,
-              },
-            ],
-          },
-          {
-            "role": "user",
-            "content": [
-              {
-                "type": "tool_result",
-                "tool_use_id": tool_use_id,
-                "content": result,
-              }
-            ],
-          },
-        ]
+      # kept by the converter so later turns still see the tool calls
+      self._converter.add_tool_exchange(
+        history, text=message_text, tool_uses=tool_uses, tool_results=tool_results
       )
       return await self._client.messages.create(
-        max_tokens=self._max_tokens,
-        model=self._opts.model,
-        tools=tools,
-        messages=messages,
-        system=self._system,
-        stream=True,
+        **request, messages=self._build_messages(history), stream=True
       )
 
-    return LLMStream(stream, _send_tool_result, fnc_ctx)
+    return LLMStream(
+      stream,
+      _send_tool_results,
+      fnc_ctx,
+      tool_timeout=self._tool_timeout,
+      run_in_background=self._run_tool_in_background,
+      coalesce_opts=self._coalesce_opts,
+    )
+
+  def _run_tool_in_background(
+    self, tool_use_id: str, fnc_name: str, task: asyncio.Task[Any]
+  ) -> None:
+    async def _wait() -> None:
+      try:
+        await asyncio.wait_for(task, self._tool_timeout)
+      except Exception as e:
+        error = str(e) or type(e).__name__
+        logging.warning(f"AI function {fnc_name} failed in the background: {error}")
+        # seen by the model from the next request on
+        self._converter.add_tool_failure(
+          tool_use_id,
+          f"System note: {fnc_name} failed after this result was returned ({error}), "
+          "the user didn't see its effect.",
+        )
+
+    t = asyncio.create_task(_wait())
+    self._background_tasks.add(t)
+    t.add_done_callback(self._background_tasks.discard)
+
+  def speculate(
+    self,
+    history: llm.ChatContext,
+    fnc_ctx: llm.FunctionContext | None = None,
+  ) -> None:
+    """Starts generating an answer to a context chat() is expected to receive.
+
+    The generation is buffered and used by the next chat() call if its context
+    matches, otherwise it's cancelled.
+    """
+    key = speculation.speculation_key(history, fnc_ctx)
+    text = speculation.user_text(history)
+    if self._speculation is not None:
+      if self._speculation.key == key and self._speculation.text == text:
+        return
+      self._speculation.discard()
+
+    self._speculation = speculation.Speculation(
+      key,
+      text,
+      self._client.messages.create(
+        **self._request_options(fnc_ctx),
+        messages=self._build_messages(history),
+        stream=True,
+      ),
+    )
+
+  def _take_speculation(
+    self, history: llm.ChatContext, fnc_ctx: llm.FunctionContext | None
+  ) -> speculation.Speculation | None:
+    spec, self._speculation = self._speculation, None
+    if spec is None:
+      return None
+
+    # only used when it answers the final transcript, not just the same context
+    key = speculation.speculation_key(history, fnc_ctx)
+    if spec.key != key or spec.text != speculation.user_text(history):
+      spec.discard()
+      return None
+
+    spec.promote()
+    return spec
+
+  def discard_speculation(self) -> None:
+    spec, self._speculation = self._speculation, None
+    if spec is not None:
+      spec.discard()
+
+  def _request_options(self, fnc_ctx: llm.FunctionContext | None) -> dict[str, Any]:
+    tools = []
+    if fnc_ctx and len(fnc_ctx.ai_functions) > 0:
+      tools = tool_calling.compile_function_context(fnc_ctx).tools
+
+    # Tools, system prompt and the first user message (task + assets) don't
+    # change during a session. Cache breakpoints after each of them let every
+    # turn and tool round-trip reuse that prefix.
+    system = self._system
+    extra_headers = None
+    if self._prompt_caching:
+      if tools:
+        tools = [*tools[:-1], {**tools[-1], "cache_control": _CACHE_CONTROL}]
+      if system is not None:
+        system = [{"type": "text", "text": system, "cache_control": _CACHE_CONTROL}]
+      extra_headers = {"anthropic-beta": _PROMPT_CACHING_BETA}
+
+    return {
+      "max_tokens": self._max_tokens,
+      "model": self._opts.model,
+      "tools": tools,
+      "system": system,
+      "extra_headers": extra_headers,
+    }
+
+  def _build_messages(self, history: llm.ChatContext) -> list[dict[str, Any]]:
+    turn_context = self._turn_context(history) if self._turn_context else None
+    messages = self._converter.convert(history, turn_context=turn_context)
+    if self._prompt_caching and messages:
+      messages[0] = _with_cache_breakpoint(messages[0])
+    return self._window.apply(messages)
+
+
+@define
+class _ToolUse:
+  id: str
+  name: str
+  raw_arguments: list[str]
+  task: asyncio.Task[str] | None = None
+  # set for early_dispatch functions, until the function is started
+  early_parser: partial_json.PartialObjectParser | None = None
 
 
 class LLMStream(llm.LLMStream):
   def __init__(
     self,
     anthropic_stream: anthropic.AsyncStream[anthropic.types.RawMessageStreamEvent],
-    send_tool_result: Callable,
+    send_tool_results: Callable,
     fnc_ctx: llm.FunctionContext | None,
+    *,
+    tool_timeout: float | None = None,
+    run_in_background: Callable[[str, str, asyncio.Task[Any]], None] | None = None,
+    coalesce_opts: coalesce.CoalesceOptions | None = None,
   ) -> None:
     super().__init__()
     self._anthropic_stream = anthropic_stream
-    self._send_tool_result = send_tool_result
+    self._send_tool_results = send_tool_results
     self._fnc_ctx = fnc_ctx
+    self._tool_timeout = tool_timeout
+    self._run_in_background = run_in_background
     self._running_tasks: MutableSet[asyncio.Task[Any]] = set()
 
     self._message_text: str = ""
+    self._coalescer = coalesce.TextCoalescer(coalesce_opts)
 
-    # current function call that we're waiting for full completion (args are streamed)
-    self._tool_use_id: str | None = None
-    self._fnc_name: str | None = None
-    self._fnc_raw_arguments: str | None = None
+    # tool_use blocks of the current message by content block index, they run
+    # as soon as their block is complete and are answered together
+    self._tool_uses: dict[int, _ToolUse] = {}
 
   async def gather_function_results(self) -> list[llm.CalledFunction]:
     await asyncio.gather(*self._running_tasks, return_exceptions=True)
@@ -142,151 +267,222 @@ class LLMStream(llm.LLMStream):
 
     await asyncio.gather(*self._running_tasks, return_exceptions=True)
 
-  async def __anext__(self):
-    async for chunk in self._anthropic_stream:
-      chat_chunk = await self._parse_chunk(chunk)
-      if chat_chunk is not None:
-        return chat_chunk
-
-    raise StopAsyncIteration
-
-  async def _parse_chunk(
-    self, chunk: anthropic.types.RawMessageStreamEvent
-  ) -> llm.ChatChunk | None:
+  async def __anext__(self) -> llm.ChatChunk:
+    # only text reaches the assistant, events without any are consumed here
+    while True:
+      try:
+        event = await self._anthropic_stream.__anext__()
+      except StopAsyncIteration:
+        text = self._coalescer.flush()
+        if text is None:
+          raise
+        return _text_chunk(text)
+
+      if event.type == "message_stop" and self._tool_uses:
+        # text blocks end before the tool calls, their text is already out
+        await self._send_tool_results_and_continue()
+        continue
+
+      self._parse_chunk(event)
+      text = self._coalescer.take()
+      if text is not None:
+        return _text_chunk(text)
+
+  def _parse_chunk(self, chunk: anthropic.types.RawMessageStreamEvent) -> None:
     match chunk.type:
       case "message_start":
-        return llm.ChatChunk(
-          choices=[
-            llm.Choice(
-              delta=llm.ChoiceDelta(
-                role="assistant",
-              )
-            )
-          ]
-        )
+        _record_input_usage(chunk.message.usage)
       case "message_delta":
-        return llm.ChatChunk(
-          choices=[
-            llm.Choice(
-              delta=llm.ChoiceDelta(
-                role="assistant",
-              )
-            )
-          ]
-        )
-      case "message_stop":
-        return None
+        _output_tokens.inc(chunk.usage.output_tokens)
       case "content_block_start":
         if chunk.content_block.type == "text":
           self._message_text += chunk.content_block.text
-          return llm.ChatChunk(
-            choices=[
-              llm.Choice(
-                delta=llm.ChoiceDelta(
-                  role="assistant",
-                  content=chunk.content_block.text,
-                )
-              )
-            ]
-          )
+          self._coalescer.push(chunk.content_block.text)
         elif chunk.content_block.type == "tool_use":
-          self._tool_use_id = chunk.content_block.id
-          self._fnc_name = chunk.content_block.name
+          tool_use = _ToolUse(
+            id=chunk.content_block.id,
+            name=chunk.content_block.name,
+            raw_arguments=[],
+          )
+          if self._early_dispatch(tool_use.name):
+            tool_use.early_parser = partial_json.PartialObjectParser()
+          self._tool_uses[chunk.index] = tool_use
         else:
           logging.warning(f"unhandled content block type {chunk.content_block.type}")
       case "content_block_delta":
         if chunk.delta.type == "text_delta":
+          tracing.mark(tracing.Stage.LLM_FIRST_TOKEN)
           self._message_text += chunk.delta.text
-          return llm.ChatChunk(
-            choices=[
-              llm.Choice(
-                delta=llm.ChoiceDelta(
-                  role="assistant",
-                  content=chunk.delta.text,
-                )
-              )
-            ]
-          )
+          self._coalescer.push(chunk.delta.text)
         elif chunk.delta.type == "input_json_delta":
-          if self._fnc_raw_arguments is not None:
-            self._fnc_raw_arguments += chunk.delta.partial_json
-          else:
-            self._fnc_raw_arguments = chunk.delta.partial_json
+          tool_use = self._tool_uses.get(chunk.index)
+          if tool_use is not None:
+            tool_use.raw_arguments.append(chunk.delta.partial_json)
+            if tool_use.early_parser is not None:
+              self._try_dispatch_early(tool_use, chunk.delta.partial_json)
         else:
           logging.warning(f"unhandled content block delta type {chunk.delta.type}")
       case "content_block_stop":
-        if self._fnc_name is not None:
-          return await self._try_run_function()
-        return None
+        tool_use = self._tool_uses.get(chunk.index)
+        if tool_use is not None:
+          if tool_use.task is None:
+            self._start_tool(tool_use)
+        else:
+          # end of a text block, nothing is held past it
+          self._coalescer.push_boundary()
 
-  async def _try_run_function(
-    self,
-  ) -> llm.ChatChunk | None:
+  def _early_dispatch(self, fnc_name: str) -> bool:
     if not self._fnc_ctx:
-      logging.warning("anthropic stream tried to run function without function context")
-      return None
-
-    if self._fnc_name is None or self._fnc_raw_arguments is None:
-      logging.warning(
-        "anthropic stream tried to call a function but raw_arguments and fnc_name are not set"
-      )
-      return None
-
-    task, called_function = tool_calling.create_function_task(
-      self._fnc_ctx, self._fnc_name, self._fnc_raw_arguments
+      return False
+    compiled = tool_calling.compile_function_context(self._fnc_ctx).functions.get(
+      fnc_name
     )
+    return compiled is not None and compiled.early_dispatch
+
+  def _try_dispatch_early(self, tool_use: _ToolUse, partial: str) -> None:
+    compiled = tool_calling.compile_function_context(self._fnc_ctx).functions[
+      tool_use.name
+    ]
+    try:
+      tool_use.early_parser.feed(partial)
+      arguments = dict(tool_use.early_parser.values)
+      if not compiled.has_required_arguments(arguments):
+        return
+      compiled.validate(arguments)
+    except ValueError:
+      # leave it to content_block_stop, which reports the error to the model
+      tool_use.early_parser = None
+      return
+
+    tool_use.early_parser = None
+    logging.debug(f"dispatching {tool_use.name} before its input is complete")
+    self._start_tool(tool_use, arguments)
+
+  def _start_tool(
+    self, tool_use: _ToolUse, arguments: dict[str, Any] | None = None
+  ) -> None:
+    tracing.mark(tracing.Stage.TOOL_START)
+    tool_use.task = asyncio.create_task(self._run_tool(tool_use, arguments))
+    self._running_tasks.add(tool_use.task)
+    tool_use.task.add_done_callback(self._running_tasks.discard)
+
+  async def _run_tool(
+    self, tool_use: _ToolUse, arguments: dict[str, Any] | None
+  ) -> str:
+    if not self._fnc_ctx:
+      raise ValueError(
+        "anthropic stream tried to run function without function context"
+      )
 
+    if arguments is not None:
+      task, called_function = tool_calling.create_function_task_from_arguments(
+        self._fnc_ctx, tool_use.name, arguments
+      )
+    else:
+      task, called_function = tool_calling.create_function_task(
+        self._fnc_ctx, tool_use.name, "".join(tool_use.raw_arguments)
+      )
     self._called_functions.append(called_function)
 
-    await asyncio.wait_for(task, None)
-
-    new_stream = await self._send_tool_result(
+    compiled = tool_calling.compile_function_context(self._fnc_ctx).functions[
+      tool_use.name
+    ]
+    if compiled.optimistic_result is not None and self._run_in_background is not None:
+      # let the function run until it first suspends, errors raised before
+      # that (e.g. argument checks) still go back to the model
+      await asyncio.sleep(0)
+      if task.done():
+        return await task
+
+      self._run_in_background(tool_use.id, tool_use.name, task)
+      return compiled.optimistic_result
+
+    # wait_for cancels the function when it times out
+    return await asyncio.wait_for(task, self._tool_timeout)
+
+  async def _send_tool_results_and_continue(self) -> None:
+    tool_uses = list(self._tool_uses.values())
+    self._tool_uses = {}
+    for tool_use in tool_uses:
+      if tool_use.task is None:  # block never completed
+        self._start_tool(tool_use)
+
+    await asyncio.wait([t.task for t in tool_uses])
+    tracing.mark(tracing.Stage.TOOL_END)
+
+    new_stream = await self._send_tool_results(
       self._message_text,
-      self._fnc_name,
-      self._fnc_raw_arguments,
-      self._tool_use_id,
-      task.result(),
+      [_build_tool_use_block(t) for t in tool_uses],
+      [_build_tool_result_block(t) for t in tool_uses],
     )
     self._anthropic_stream = new_stream
+    self._message_text = ""
 
-    self._tool_use_id = self._fnc_name = self._fnc_raw_arguments = None
 
-    return llm.ChatChunk(
-      choices=[
-        llm.Choice(
-          delta=llm.ChoiceDelta(
-            role="assistant",
-          ),
-        )
-      ]
-    )
+def _text_chunk(text: str) -> llm.ChatChunk:
+  return llm.ChatChunk(
+    choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=text))]
+  )
 
 
-def _build_anthropic_context(
-  chat_ctx: llm.ChatContext,
-) -> list[anthropic.types.Message]:
-  return [_build_anthropic_message(msg) for msg in chat_ctx.messages]  # type: ignore
+def _build_tool_use_block(tool_use: _ToolUse) -> dict[str, Any]:
+  try:
+    arguments = json.loads("".join(tool_use.raw_arguments) or "{}")
+  except json.JSONDecodeError:
+    arguments = {}
 
-
-def _build_anthropic_message(msg: llm.ChatMessage):
-  anthropic_msg: dict = {
-    "role": msg.role.value,
+  return {
+    "type": "tool_use",
+    "id": tool_use.id,
+    "name": tool_use.name,
+    "input": arguments,
   }
 
-  # add content if provided
-  if isinstance(msg.text, str):
-    anthropic_msg["content"] = msg.text
-  elif isinstance(msg.text, list):
-    anthropic_content = []
-    for content in msg.text:
-      if isinstance(content, str):
-        anthropic_content.append(
-          {
-            "type": "text",
-            "text": content,
-          }
-        )
 
-    anthropic_msg["content"] = anthropic_content
+def _build_tool_result_block(tool_use: _ToolUse) -> dict[str, Any]:
+  block = {
+    "type": "tool_result",
+    "tool_use_id": tool_use.id,
+  }
 
-  return anthropic_msg
+  e = (
+    asyncio.CancelledError() if tool_use.task.cancelled() else tool_use.task.exception()
+  )
+  if e is None:
+    block["content"] = str(tool_use.task.result())
+  elif isinstance(e, asyncio.TimeoutError):
+    logging.warning(f"AI function {tool_use.name} timed out")
+    block["content"] = f"{tool_use.name} timed out"
+    block["is_error"] = True
+  else:
+    logging.warning(f"AI function {tool_use.name} failed: {e}")
+    block["content"] = str(e)
+    block["is_error"] = True
+
+  return block
+
+
+def _record_input_usage(usage: anthropic.types.Usage) -> None:
+  # the cache fields are only returned with the prompt caching beta
+  cache_creation = getattr(usage, "cache_creation_input_tokens", None) or 0
+  cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+
+  _input_tokens.inc(usage.input_tokens)
+  _cache_creation_input_tokens.inc(cache_creation)
+  _cache_read_input_tokens.inc(cache_read)
+
+  logging.debug(
+    f"anthropic usage: input={usage.input_tokens} "
+    f"cache_creation={cache_creation} cache_read={cache_read}"
+  )
+
+
+def _with_cache_breakpoint(anthropic_msg: dict) -> dict:
+  # converted messages are cached by the ContextConverter, don't mutate them
+  content = anthropic_msg.get("content")
+  if isinstance(content, str):
+    content = [{"type": "text", "text": content, "cache_control": _CACHE_CONTROL}]
+  elif content:
+    content = [*content[:-1], {**content[-1], "cache_control": _CACHE_CONTROL}]
+
+  return {**anthropic_msg, "content": content}
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import importlib.util
+import logging
+import time
+from typing import Any
+
+import anthropic
+import httpx
+from attrs import define
+
+from demospace.utils import metrics
+
+__all__ = [
+  "ClientPool",
+  "PoolOptions",
+  "PoolStats",
+  "get_client",
+  "get_pool",
+  "prewarm",
+]
+
+_connections_in_use = metrics.gauge(
+  "anthropic_pool_connections_in_use", "Anthropic connections serving a request."
+)
+_connections_idle = metrics.gauge(
+  "anthropic_pool_connections_idle", "Idle keep-alive Anthropic connections."
+)
+_handshakes = metrics.counter(
+  "anthropic_pool_handshakes_total", "TLS handshakes made to the Anthropic API."
+)
+
+
+@define(kw_only=True)
+class PoolOptions:
+  max_connections: int = 20
+  max_keepalive_connections: int = 10
+  keepalive_expiry: float = 60.0
+  # connections opened at startup and kept open while the pool is idle
+  warm_connections: int = 2
+  # HTTP/2 needs the optional h2 package
+  http2: bool = importlib.util.find_spec("h2") is not None
+
+
+@define(kw_only=True)
+class PoolStats:
+  in_use: int
+  idle: int
+  handshakes: int
+
+
+class ClientPool:
+  def __init__(self, opts: PoolOptions | None = None) -> None:
+    self._opts = opts or PoolOptions()
+    self._http_client = httpx.AsyncClient(
+      http2=self._opts.http2,
+      limits=httpx.Limits(
+        max_connections=self._opts.max_connections,
+        max_keepalive_connections=self._opts.max_keepalive_connections,
+        keepalive_expiry=self._opts.keepalive_expiry,
+      ),
+      timeout=anthropic.DEFAULT_TIMEOUT,
+      event_hooks={"request": [self._on_request], "response": [self._on_response]},
+    )
+    self._client = anthropic.AsyncAnthropic(http_client=self._http_client)
+    self._handshakes = 0
+    self._last_request_time = 0.0
+    self._rewarm_task: asyncio.Task | None = None
+
+  @property
+  def client(self) -> anthropic.AsyncAnthropic:
+    return self._client
+
+  def stats(self) -> PoolStats:
+    in_use = idle = 0
+    # httpx doesn't expose its connection pool, fall back to zeros if that changes
+    pool = getattr(getattr(self._http_client, "_transport", None), "_pool", None)
+    for conn in getattr(pool, "connections", []):
+      with contextlib.suppress(AttributeError):
+        if conn.is_idle():
+          idle += 1
+        elif not conn.is_closed():
+          in_use += 1
+
+    return PoolStats(in_use=in_use, idle=idle, handshakes=self._handshakes)
+
+  def _update_gauges(self) -> None:
+    # the metrics endpoint runs in another process and can't ask the pool, the
+    # gauges are set whenever a connection is taken or given back instead
+    stats = self.stats()
+    _connections_in_use.set(stats.in_use)
+    _connections_idle.set(stats.idle)
+
+  async def warm(self) -> None:
+    missing = self._opts.warm_connections - self.stats().idle
+    if missing <= 0:
+      return
+
+    start_time = time.perf_counter()
+    await self._open_connections(missing)
+    logging.info(
+      f"warmed {missing} anthropic connections in {time.perf_counter() - start_time:.2f}s"
+    )
+
+  async def _open_connections(self, count: int) -> None:
+    # concurrent requests each take their own connection, reusing idle ones
+    # first. Any request will do, the response itself doesn't matter.
+    results = await asyncio.gather(
+      *[self._http_client.head(str(self._client.base_url)) for _ in range(count)],
+      return_exceptions=True,
+    )
+    for result in results:
+      if isinstance(result, Exception):
+        logging.warning(f"failed to warm anthropic connection: {result}")
+
+  def start(self) -> None:
+    if self._rewarm_task is None:
+      self._rewarm_task = asyncio.create_task(self._rewarm_loop())
+
+  async def aclose(self) -> None:
+    if self._rewarm_task is not None:
+      self._rewarm_task.cancel()
+      with contextlib.suppress(asyncio.CancelledError):
+        await self._rewarm_task
+      self._rewarm_task = None
+
+    await self._client.close()
+
+  async def _rewarm_loop(self) -> None:
+    # touch the warm connections before the keep-alive expiry drops them, so the
+    # next model call after a long pause doesn't pay for a new handshake
+    interval = self._opts.keepalive_expiry * 0.5
+    while True:
+      await asyncio.sleep(interval)
+      if time.monotonic() - self._last_request_time >= interval:
+        await self._open_connections(self._opts.warm_connections)
+      # drops the connections the keep-alive expiry closed
+      self._update_gauges()
+
+  async def _on_request(self, request: httpx.Request) -> None:
+    if request.method != "HEAD":  # warm-up requests don't count as activity
+      self._last_request_time = time.monotonic()
+    request.extensions["trace"] = self._trace
+    self._update_gauges()
+
+  async def _on_response(self, response: httpx.Response) -> None:
+    # the connection is in use until the response is closed
+    self._update_gauges()
+
+  async def _trace(self, event_name: str, info: dict[str, Any]) -> None:
+    if event_name == "connection.start_tls.complete":
+      self._handshakes += 1
+      _handshakes.inc()
+    elif event_name.endswith(".response_closed.complete"):
+      self._update_gauges()
+
+
+# One pool per process, shared by every claude.LLM. Connections can't be shared
+# with forked job processes, so each job process creates and warms its own.
+_pool: ClientPool | None = None
+
+
+def get_pool() -> ClientPool:
+  global _pool
+  if _pool is None:
+    _pool = ClientPool()
+  return _pool
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+  return get_pool().client
+
+
+async def prewarm() -> None:
+  pool = get_pool()
+  pool.start()
+  await pool.warm()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import re
+from typing import TYPE_CHECKING, Any, Awaitable, Hashable
+
+import anthropic
+from livekit.agents import llm, stt
+
+from demospace.utils import metrics, tracing
+
+if TYPE_CHECKING:
+  from demospace.livekit.claude.llm import LLM
+
+__all__ = [
+  "Speculation",
+  "SpeculativeSTT",
+  "speculation_key",
+  "user_text",
+]
+
+_speculations = metrics.counter(
+  "llm_speculations_total", "Speculative generations started from interim transcripts."
+)
+_speculation_hits = metrics.counter(
+  "llm_speculation_hits_total", "Speculative generations promoted to the answer."
+)
+_wasted_input_tokens = metrics.counter(
+  "llm_speculation_wasted_input_tokens_total",
+  "Input tokens of speculative generations that were thrown away.",
+)
+_wasted_output_tokens = metrics.counter(
+  "llm_speculation_wasted_output_tokens_total",
+  "Output tokens of speculative generations that were thrown away. Estimated from "
+  "the number of streamed deltas when the generation was cancelled early.",
+)
+
+
+class Speculation:
+  """A generation started before the user's turn was final.
+
+  Events are buffered until the generation is promoted, then replayed to the
+  LLMStream before it continues with the live stream. A discarded speculation
+  closes its stream, which releases the connection.
+  """
+
+  def __init__(
+    self,
+    key: Hashable,
+    text: str,
+    create_stream: Awaitable[
+      anthropic.AsyncStream[anthropic.types.RawMessageStreamEvent]
+    ],
+  ) -> None:
+    self.key = key
+    # the normalized user message it answers
+    self.text = text
+    self._queue = asyncio.Queue[Any]()
+    self._promoted = False
+    self._discarded = False
+    self._done = False
+    self._input_tokens = 0
+    self._output_tokens: int | None = None
+    self._deltas = 0
+    self._pump_task = asyncio.create_task(self._pump(create_stream))
+    _speculations.inc()
+
+  def promote(self) -> None:
+    self._promoted = True
+    _speculation_hits.inc()
+
+  def discard(self) -> None:
+    if self._discarded:
+      return
+    self._discarded = True
+    self._pump_task.cancel()
+    # once the stream is closed, with what was streamed until then
+    self._pump_task.add_done_callback(lambda _: self._record_waste())
+
+  async def close(self) -> None:
+    self._pump_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+      await self._pump_task
+
+  def __aiter__(self) -> "Speculation":
+    return self
+
+  async def __anext__(self) -> anthropic.types.RawMessageStreamEvent:
+    if self._done:
+      raise StopAsyncIteration
+
+    event = await self._queue.get()
+    if event is None:
+      self._done = True
+      raise StopAsyncIteration
+    if isinstance(event, BaseException):
+      self._done = True
+      raise event
+
+    return event
+
+  async def _pump(self, create_stream: Awaitable) -> None:
+    stream = None
+    try:
+      stream = await create_stream
+      async for event in stream:
+        self._track_usage(event)
+        self._queue.put_nowait(event)
+      self._queue.put_nowait(None)
+    except asyncio.CancelledError:
+      self._queue.put_nowait(None)
+      raise
+    except Exception as e:
+      self._queue.put_nowait(e)
+    finally:
+      if stream is not None:
+        await stream.close()
+
+  def _track_usage(self, event: anthropic.types.RawMessageStreamEvent) -> None:
+    match event.type:
+      case "message_start":
+        usage = event.message.usage
+        self._input_tokens = usage.input_tokens + (
+          getattr(usage, "cache_creation_input_tokens", None) or 0
+        )
+      case "content_block_delta":
+        self._deltas += 1
+      case "message_delta":
+        self._output_tokens = event.usage.output_tokens
+
+  def _record_waste(self) -> None:
+    output_tokens = (
+      self._output_tokens if self._output_tokens is not None else self._deltas
+    )
+    _wasted_input_tokens.inc(self._input_tokens)
+    _wasted_output_tokens.inc(output_tokens)
+    logging.debug(
+      f"discarded speculative generation: input={self._input_tokens} output~={output_tokens}"
+    )
+
+
+def speculation_key(
+  history: llm.ChatContext, fnc_ctx: llm.FunctionContext | None
+) -> Hashable:
+  # the context before the user's message
+  return (
+    id(fnc_ctx),
+    tuple((msg.role, _normalize_text(msg.text)) for msg in history.messages[:-1]),
+  )
+
+
+def user_text(history: llm.ChatContext) -> str:
+  # interim and final transcripts of the same speech often differ only in
+  # casing and punctuation, the answer is the same for both
+  return _normalize_text(history.messages[-1].text) if history.messages else ""
+
+
+def _normalize_text(text: str | list) -> str:
+  if not isinstance(text, str):
+    text = " ".join(t for t in text if isinstance(t, str))
+  return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+class SpeculativeSTT(stt.STT):
+  """Wraps a streaming STT and starts speculative generations on the LLM.
+
+  Once an interim transcript hasn't changed for `stable_for` seconds, the
+  context VoiceAssistant will send on the final transcript is predicted and
+  generated ahead of time. `chat_ctx` must be the ChatContext given to the
+  VoiceAssistant, which it keeps updating during the session, and
+  user_speech_committed() must be called on its event of the same name.
+  """
+
+  def __init__(
+    self,
+    stt: stt.STT,
+    *,
+    llm: LLM,
+    chat_ctx: llm.ChatContext,
+    fnc_ctx: llm.FunctionContext | None = None,
+    stable_for: float = 0.3,
+  ) -> None:
+    super().__init__(streaming_supported=True)
+    self._stt = stt
+    self._llm = llm
+    self._chat_ctx = chat_ctx
+    self._fnc_ctx = fnc_ctx
+    self._stable_for = stable_for
+    self._commits = 0
+
+  def user_speech_committed(self) -> None:
+    """The user's message was added to the context, a new one starts."""
+    self._commits += 1
+
+  async def recognize(self, *, buffer, language: str | None = None) -> stt.SpeechEvent:
+    return await self._stt.recognize(buffer=buffer, language=language)
+
+  def stream(self, *, language: str | None = None) -> "SpeculativeSpeechStream":
+    return SpeculativeSpeechStream(self._stt.stream(language=language), self)
+
+
+class SpeculativeSpeechStream(stt.SpeechStream):
+  def __init__(self, stream: stt.SpeechStream, speculative_stt: SpeculativeSTT) -> None:
+    self._stream = stream
+    self._stt = speculative_stt
+    self._interim_text = ""
+    # VoiceAssistant joins the final transcripts until the answer is validated,
+    # and adds them to the context as one user message
+    self._transcribed_text = ""
+    self._commits = speculative_stt._commits
+    self._timer: asyncio.TimerHandle | None = None
+
+  def push_frame(self, frame) -> None:
+    self._stream.push_frame(frame)
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    self._cancel_timer()
+    # a speculation on this stream's speech isn't used anymore
+    self._stt._llm.discard_speculation()
+    await self._stream.aclose(wait=wait)
+
+  async def __anext__(self) -> stt.SpeechEvent:
+    try:
+      ev = await self._stream.__anext__()
+    except StopAsyncIteration:
+      self._cancel_timer()
+      raise
+
+    text = ev.alternatives[0].text if ev.alternatives else ""
+    if ev.type == stt.SpeechEventType.INTERIM_TRANSCRIPT:
+      if text.strip() and text != self._interim_text:
+        self._interim_text = text
+        self._cancel_timer()
+        self._timer = asyncio.get_running_loop().call_later(
+          self._stt._stable_for, self._speculate
+        )
+    elif ev.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+      tracing.mark(tracing.Stage.STT_FINAL)
+      self._cancel_timer()
+      self._interim_text = ""
+      self._sync_transcribed_text()
+      self._transcribed_text += text
+
+    return ev
+
+  def _sync_transcribed_text(self) -> None:
+    # reset when VoiceAssistant resets its own, adding the assistant's answer
+    # to the context doesn't end the user's message
+    if self._commits != self._stt._commits:
+      self._commits = self._stt._commits
+      self._transcribed_text = ""
+
+  def _speculate(self) -> None:
+    self._timer = None
+    self._sync_transcribed_text()
+
+    chat_ctx = self._stt._chat_ctx.copy()
+    chat_ctx.messages.append(
+      llm.ChatMessage(
+        text=self._transcribed_text + self._interim_text,
+        role=llm.ChatRole.USER,
+      )
+    )
+    self._stt._llm.speculate(chat_ctx, fnc_ctx=self._stt._fnc_ctx)
+
+  def _cancel_timer(self) -> None:
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
@@ -1,27 +1,132 @@
 from __future__ import annotations
 
 import asyncio
+import enum
 import functools
 import inspect
 import json
-import typing
-from typing import Any
+import weakref
+from typing import Any, Callable
 
+from attrs import define
 from livekit.agents.llm import function_context, llm
 
 __all__ = [
+  "CompiledFunction",
+  "CompiledFunctionContext",
+  "compile_function_context",
   "create_function_task",
+  "create_function_task_from_arguments",
+  "early_dispatch",
+  "optimistic",
 ]
 
+_Coercer = Callable[[Any], Any]
+
+_EARLY_DISPATCH_ATTR = "__demospace_early_dispatch__"
+_OPTIMISTIC_RESULT_ATTR = "__demospace_optimistic_result__"
+
+
+def early_dispatch(f: Callable) -> Callable:
+  """Lets the Claude stream call this ai_callable as soon as its required
+  arguments are complete, before the model finishes streaming the tool input.
+
+  Optional arguments that aren't complete by then are left to their defaults.
+  """
+  setattr(f, _EARLY_DISPATCH_ATTR, True)
+  return f
+
+
+def optimistic(*, result: str) -> Callable:
+  """Marks a side-effect-only ai_callable. The Claude stream answers the model
+  with `result` right away and lets the function finish in the background.
+
+  Errors raised before the function first awaits are still returned to the
+  model. Later failures are added to the conversation as a note on the tool
+  result.
+  """
+
+  def deco(f: Callable) -> Callable:
+    setattr(f, _OPTIMISTIC_RESULT_ATTR, result)
+    return f
+
+  return deco
+
+
+@define(frozen=True)
+class _CompiledArg:
+  name: str
+  required: bool
+  coerce: _Coercer
+
+
+@define(frozen=True)
+class CompiledFunction:
+  info: function_context.AIFunction
+  description: dict[str, Any]
+  args: tuple[_CompiledArg, ...]
+  early_dispatch: bool
+  optimistic_result: str | None
+
+  def has_required_arguments(self, arguments: dict[str, Any]) -> bool:
+    return all(arg.name in arguments for arg in self.args if arg.required)
+
+  def validate(self, arguments: dict[str, Any]) -> dict[str, Any]:
+    fnc_name = self.info.metadata.name
+
+    # Ensure all necessary arguments are present and of the correct type.
+    sanitized_arguments: dict[str, Any] = {}
+    for arg in self.args:
+      if arg.name not in arguments:
+        if arg.required:
+          raise ValueError(
+            f"AI function {fnc_name} missing required argument {arg.name}"
+          )
+        continue
+
+      try:
+        sanitized_arguments[arg.name] = arg.coerce(arguments[arg.name])
+      except ValueError as e:
+        raise ValueError(f"AI function {fnc_name} argument {arg.name}: {e}")
+
+    return sanitized_arguments
+
+
+@define(frozen=True)
+class CompiledFunctionContext:
+  tools: list[dict[str, Any]]
+  functions: dict[str, CompiledFunction]
+
+
+# compiled once per FunctionContext, the ai functions don't change after init
+_compiled: weakref.WeakKeyDictionary[
+  function_context.FunctionContext, CompiledFunctionContext
+] = weakref.WeakKeyDictionary()
+
+
+def compile_function_context(
+  fnc_ctx: function_context.FunctionContext,
+) -> CompiledFunctionContext:
+  compiled = _compiled.get(fnc_ctx)
+  if compiled is None:
+    functions = {
+      name: _compile_function(fnc_info)
+      for name, fnc_info in fnc_ctx.ai_functions.items()
+    }
+    compiled = CompiledFunctionContext(
+      tools=[fnc.description for fnc in functions.values()],
+      functions=functions,
+    )
+    _compiled[fnc_ctx] = compiled
+
+  return compiled
+
 
 def create_function_task(
   fnc_ctx: function_context.FunctionContext,
   fnc_name: str,
   raw_arguments: str,  # JSON string
 ) -> tuple[asyncio.Task[Any], llm.CalledFunction]:
-  if fnc_name not in fnc_ctx.ai_functions:
-    raise ValueError(f"AI function {fnc_name} not found")
-
   parsed_arguments: dict[str, Any] = {}
   try:
     if raw_arguments:  # ignore empty string
@@ -31,36 +136,21 @@ def create_function_task(
       f"AI function {fnc_name} received invalid JSON arguments - {raw_arguments}"
     )
 
-  fnc_info = fnc_ctx.ai_functions[fnc_name]
-
-  # Ensure all necessary arguments are present and of the correct type.
-  sanitized_arguments: dict[str, Any] = {}
-  for arg_info in fnc_info.args.values():
-    if arg_info.name not in parsed_arguments:
-      if arg_info.default is inspect.Parameter.empty:
-        raise ValueError(
-          f"AI function {fnc_name} missing required argument {arg_info.name}"
-        )
-      continue
-
-    arg_value = parsed_arguments[arg_info.name]
-    if typing.get_origin(arg_info.type) is not None:
-      if not isinstance(arg_value, list):
-        raise ValueError(
-          f"AI function {fnc_name} argument {arg_info.name} should be a list"
-        )
-
-      inner_type = typing.get_args(arg_info.type)[0]
-      sanitized_value = [
-        _sanitize_primitive(value=v, expected_type=inner_type) for v in arg_value
-      ]
-    else:
-      sanitized_value = _sanitize_primitive(
-        value=arg_value, expected_type=arg_info.type
-      )
+  return create_function_task_from_arguments(fnc_ctx, fnc_name, parsed_arguments)
+
+
+def create_function_task_from_arguments(
+  fnc_ctx: function_context.FunctionContext,
+  fnc_name: str,
+  arguments: dict[str, Any],
+) -> tuple[asyncio.Task[Any], llm.CalledFunction]:
+  compiled = compile_function_context(fnc_ctx).functions.get(fnc_name)
+  if compiled is None:
+    raise ValueError(f"AI function {fnc_name} not found")
 
-    sanitized_arguments[arg_info.name] = sanitized_value
+  sanitized_arguments = compiled.validate(arguments)
 
+  fnc_info = compiled.info
   func = functools.partial(fnc_info.fnc, **sanitized_arguments)
   if asyncio.iscoroutinefunction(fnc_info.fnc):
     task = asyncio.create_task(func())
@@ -80,14 +170,18 @@ def create_function_task(
 def build_function_description(
   fnc_info: function_context.AIFunction,
 ) -> dict[str, Any]:
-  arg_names = [key for key in fnc_info.args.keys()]
-  properties_info = {
-    arg_name: {
-      "type": "string",
-      "description": arg_info.desc,
-    }
+  properties_info = {}
+  for arg_name, arg_info in fnc_info.args.items():
+    schema = _build_type_schema(arg_info.type)
+    if arg_info.desc:
+      schema["description"] = arg_info.desc
+    properties_info[arg_name] = schema
+
+  required = [
+    arg_name
     for arg_name, arg_info in fnc_info.args.items()
-  }
+    if arg_info.default is inspect.Parameter.empty
+  ]
 
   return {
     "name": fnc_info.metadata.name,
@@ -95,29 +189,103 @@ def build_function_description(
     "input_schema": {
       "type": "object",
       "properties": properties_info,
-      "required": arg_names,
+      "required": required,
     },
   }
 
 
-def _sanitize_primitive(*, value: Any, expected_type: type) -> Any:
-  if expected_type is str:
-    if not isinstance(value, str):
-      raise ValueError(f"expected str, got {type(value)}")
-  elif expected_type in (int, float):
-    if not isinstance(value, (int, float)):
-      raise ValueError(f"expected number, got {type(value)}")
+def _compile_function(fnc_info: function_context.AIFunction) -> CompiledFunction:
+  return CompiledFunction(
+    info=fnc_info,
+    description=build_function_description(fnc_info),
+    args=tuple(
+      _CompiledArg(
+        name=arg_info.name,
+        required=arg_info.default is inspect.Parameter.empty,
+        coerce=_build_coercer(arg_info.type),
+      )
+      for arg_info in fnc_info.args.values()
+    ),
+    early_dispatch=getattr(fnc_info.fnc, _EARLY_DISPATCH_ATTR, False),
+    optimistic_result=getattr(fnc_info.fnc, _OPTIMISTIC_RESULT_ATTR, None),
+  )
+
+
+# The argument types ai_callable accepts in livekit-agents 0.7, lists and
+# optionals are rejected when the function is registered.
+
 
-    if expected_type is int:
-      if value % 1 != 0:
-        raise ValueError("expected int, got float")
+def _build_type_schema(t: Any) -> dict[str, Any]:
+  if isinstance(t, type) and issubclass(t, enum.Enum):
+    return {"type": "string", "enum": [e.value for e in t]}
 
-      value = int(value)
-    elif expected_type is float:
-      value = float(value)
+  if t is bool:
+    return {"type": "boolean"}
+  if t is int:
+    return {"type": "integer"}
+  if t is float:
+    return {"type": "number"}
+  if t is str:
+    return {"type": "string"}
 
-  elif expected_type is bool:
-    if not isinstance(value, bool):
-      raise ValueError(f"expected bool, got {type(value)}")
+  raise ValueError(f"unsupported type {t} for AI function argument")
 
+
+def _build_coercer(t: Any) -> _Coercer:
+  if isinstance(t, type) and issubclass(t, enum.Enum):
+    return functools.partial(_coerce_enum, enum_type=t)
+  if t is bool:
+    return _coerce_bool
+  if t is int:
+    return _coerce_int
+  if t is float:
+    return _coerce_float
+  if t is str:
+    return _coerce_str
+
+  raise ValueError(f"unsupported type {t} for AI function argument")
+
+
+def _coerce_str(value: Any) -> str:
+  if not isinstance(value, str):
+    raise ValueError(f"expected str, got {type(value)}")
   return value
+
+
+def _coerce_number(value: Any) -> int | float:
+  if isinstance(value, bool):
+    raise ValueError(f"expected number, got {type(value)}")
+  if isinstance(value, (int, float)):
+    return value
+  if isinstance(value, str):
+    try:
+      return float(value)
+    except ValueError:
+      pass
+  raise ValueError(f"expected number, got {type(value)}")
+
+
+def _coerce_int(value: Any) -> int:
+  value = _coerce_number(value)
+  if value % 1 != 0:
+    raise ValueError("expected int, got float")
+  return int(value)
+
+
+def _coerce_float(value: Any) -> float:
+  return float(_coerce_number(value))
+
+
+def _coerce_bool(value: Any) -> bool:
+  if isinstance(value, bool):
+    return value
+  if isinstance(value, str) and value.lower() in ("true", "false"):
+    return value.lower() == "true"
+  raise ValueError(f"expected bool, got {type(value)}")
+
+
+def _coerce_enum(value: Any, *, enum_type: type[enum.Enum]) -> enum.Enum:
+  try:
+    return enum_type(value)
+  except ValueError:
+    raise ValueError(f"expected one of {[e.value for e in enum_type]}, got {value!r}")
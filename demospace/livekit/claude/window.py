@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any
+
+import anthropic
+from attrs import define
+
+from demospace.utils import metrics
+
+__all__ = [
+  "ContextWindow",
+  "WindowOptions",
+]
+
+_SUMMARY_PROMPT = """Below is the earlier part of a voice conversation between an assistant and a user.
+
+{transcript}
+
+Write a summary the assistant can use to continue the conversation without the transcript. Keep what the user needs, the questions they asked and how they were answered, the tools the assistant used and anything it promised. Write it in the third person, in under 200 words, with no preamble."""
+
+_summaries = metrics.counter(
+  "llm_context_summaries_total", "Rolling summaries generated for long conversations."
+)
+_folded_turns = metrics.counter(
+  "llm_context_folded_turns_total", "Conversation turns folded into a rolling summary."
+)
+
+
+@define(kw_only=True)
+class WindowOptions:
+  # estimated tokens of the messages sent each turn, system prompt and tools
+  # excluded
+  max_tokens: int = 8000
+  # most recent turns always sent verbatim
+  keep_turns: int = 6
+  summary_model: str = "claude-3-haiku-20240307"
+  summary_max_tokens: int = 512
+
+
+@define
+class _Summary:
+  turns: int  # number of turns, from the first, the summary covers
+  text: str
+
+
+class ContextWindow:
+  """Keeps the messages sent each turn within a token budget.
+
+  The first message (the task prompt) is pinned and the latest turns are sent
+  verbatim. Once the conversation outgrows the budget, everything older is
+  folded into a rolling summary, generated in the background and sent after
+  the pinned message. Until the summary is ready the older turns are still
+  sent in full, so no turn waits on it.
+
+  A turn starts with an assistant reply to a user message, so the verbatim part
+  always follows the pinned user message with an assistant message.
+  """
+
+  def __init__(
+    self, client: anthropic.AsyncClient, opts: WindowOptions | None = None
+  ) -> None:
+    self._client = client
+    self._opts = opts or WindowOptions()
+    self._summary: _Summary | None = None
+    self._summary_task: asyncio.Task[None] | None = None
+
+  def apply(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    if len(messages) < 2:
+      return messages
+
+    pinned, rest = messages[0], messages[1:]
+    starts = _turn_starts(rest)
+
+    summary = self._summary
+    if summary is not None and summary.turns > len(starts):
+      # the history was replaced with a shorter one
+      summary = self._summary = None
+
+    folded = summary.turns if summary is not None else 0
+    verbatim = rest[_turn_offset(starts, folded) :]
+
+    if summary is not None:
+      pinned = _with_summary(pinned, summary.text)
+
+    fold_to = len(starts) - self._opts.keep_turns
+    if (
+      fold_to > folded and _estimate_tokens([pinned, *verbatim]) > self._opts.max_tokens
+    ):
+      self._fold(rest, starts, fold_to)
+
+    return [pinned, *verbatim]
+
+  def _fold(self, rest: list[dict[str, Any]], starts: list[int], fold_to: int) -> None:
+    if self._summary_task is not None and not self._summary_task.done():
+      return
+
+    previous = self._summary
+    folded = previous.turns if previous is not None else 0
+    transcript = _render_transcript(
+      rest[_turn_offset(starts, folded) : _turn_offset(starts, fold_to)]
+    )
+    if previous is not None:
+      transcript = (
+        f"Summary of the conversation before that:\n{previous.text}\n\n{transcript}"
+      )
+
+    self._summary_task = asyncio.create_task(
+      self._summarize(transcript, fold_to - folded, fold_to)
+    )
+
+  async def _summarize(self, transcript: str, new_turns: int, turns: int) -> None:
+    try:
+      response = await self._client.messages.create(
+        model=self._opts.summary_model,
+        max_tokens=self._opts.summary_max_tokens,
+        messages=[
+          {"role": "user", "content": _SUMMARY_PROMPT.format(transcript=transcript)}
+        ],
+      )
+    except Exception as e:
+      # tried again on the next turn, older turns are sent in full until then
+      logging.warning(f"failed to summarize the conversation: {e}")
+      return
+
+    text = "".join(block.text for block in response.content if block.type == "text")
+    self._summary = _Summary(turns=turns, text=text.strip())
+    _summaries.inc()
+    _folded_turns.inc(new_turns)
+    logging.info(f"folded {new_turns} turns into the conversation summary")
+
+
+def _turn_starts(messages: list[dict[str, Any]]) -> list[int]:
+  # assistant messages answering a user message rather than a tool result
+  starts = []
+  for i, msg in enumerate(messages):
+    if msg["role"] != "assistant":
+      continue
+    if i == 0 or not _is_tool_result(messages[i - 1]):
+      starts.append(i)
+  return starts
+
+
+def _turn_offset(starts: list[int], turns: int) -> int:
+  # anything before the first turn is folded along with it
+  return starts[turns] if turns > 0 else 0
+
+
+def _is_tool_result(msg: dict[str, Any]) -> bool:
+  content = msg["content"]
+  return (
+    msg["role"] == "user"
+    and isinstance(content, list)
+    and any(block.get("type") == "tool_result" for block in content)
+  )
+
+
+def _estimate_tokens(messages: list[dict[str, Any]]) -> int:
+  # ~4 characters per token, close enough to bound the prompt without a
+  # round-trip to the token counting API
+  chars = sum(len(json.dumps(msg["content"], ensure_ascii=False)) for msg in messages)
+  return chars // 4
+
+
+def _render_transcript(messages: list[dict[str, Any]]) -> str:
+  lines = []
+  for msg in messages:
+    speaker = "Assistant" if msg["role"] == "assistant" else "User"
+    content = msg["content"]
+    if isinstance(content, str):
+      content = [{"type": "text", "text": content}]
+
+    for block in content:
+      match block.get("type"):
+        case "text":
+          lines.append(f"{speaker}: {block['text']}")
+        case "tool_use":
+          lines.append(
+            f"(Assistant called {block['name']}({json.dumps(block['input'])}))"
+          )
+
+  return "\n".join(lines)
+
+
+def _with_summary(anthropic_msg: dict[str, Any], summary: str) -> dict[str, Any]:
+  # after the pinned content, so its cache breakpoint stays valid
+  content = anthropic_msg["content"]
+  if isinstance(content, str):
+    content = [{"type": "text", "text": content}]
+  return {
+    **anthropic_msg,
+    "content": [
+      *content,
+      {"type": "text", "text": f"[Summary of the conversation so far]\n{summary}"},
+    ],
+  }
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
-from typing import Literal, MutableSet, Optional
+from typing import Any, Awaitable, Callable, Coroutine, Literal, MutableSet, Optional
 
 import openai
 from attrs import define
 from livekit import rtc
 from livekit.agents import llm
 
-from demospace.openai.functions import send_asset
+from demospace.livekit.claude import tool_calling
+from demospace.llm import inline_calls
 
 ChatModels = Literal[
   "gpt-4o",
@@ -17,7 +19,8 @@ ChatModels = Literal[
   "gpt-4-turbo",
   "gpt-4-turbo-2024-04-09",
   "gpt-4-turbo-preview",
-  "gpt-4-0125-preview" "gpt-4-1106-preview",
+  "gpt-4-0125-preview",
+  "gpt-4-1106-preview",
   "gpt-4-vision-preview",
   "gpt-4-1106-vision-preview",
   "gpt-4",
@@ -114,24 +117,6 @@ class LLM(llm.LLM):
       )
       return self._thread
 
-  def _add_chunk_to_stream(
-    self, llm_stream: LLMStream, chunk: openai.ThreadMessageDelta
-  ) -> None:
-    choice = chunk.data.delta.content[0]
-    llm_stream.push_text(
-      llm.ChatChunk(
-        choices=[
-          llm.Choice(
-            delta=llm.ChoiceDelta(
-              content=choice.text.value,
-              role=chunk.data.delta.role,
-            ),
-            index=0,
-          )
-        ]
-      )
-    )
-
   def _add_text_to_stream(self, llm_stream: LLMStream, text: str, role: str) -> None:
     llm_stream.push_text(
       llm.ChatChunk(
@@ -147,63 +132,74 @@ class LLM(llm.LLM):
       )
     )
 
+  async def _call_function(
+    self, fnc_ctx: llm.FunctionContext | None, name: str, raw_arguments: str
+  ) -> str:
+    # arguments are validated like the Claude path's, and Functions.send_asset
+    # rejects asset ids that aren't in the catalog
+    if fnc_ctx is None:
+      raise ValueError(f"AI function {name} called without function context")
+    task, _ = tool_calling.create_function_task(fnc_ctx, name, raw_arguments)
+    return str(await task)
+
+  async def _handle_parsed_item(
+    self,
+    llm_stream: LLMStream,
+    fnc_ctx: llm.FunctionContext | None,
+    item: str | inline_calls.InlineCall,
+  ) -> None:
+    if isinstance(item, str):
+      self._add_text_to_stream(llm_stream, item, "assistant")
+      return
+
+    # end the current sentence so it's spoken while the function runs
+    self._add_text_to_stream(llm_stream, "\n", "assistant")
+    logging.info(f"Calling inline function {item.name}: {item.raw_arguments}")
+    try:
+      await self._call_function(fnc_ctx, item.name, item.raw_arguments)
+    except Exception as e:
+      logging.warning(f"Inline function {item.name} failed: {e}")
+
   async def _handle_response_stream(
-    self, stream: openai.AsyncAssistantEventHandler, llm_stream: LLMStream
+    self,
+    stream: openai.AsyncAssistantEventHandler,
+    llm_stream: LLMStream,
+    fnc_ctx: llm.FunctionContext | None,
   ) -> None:
-    gathering_function_call = False
-    function_args = ""
-    prev_word = ""
+    parser = inline_calls.InlineCallParser()
     async for chunk in stream:
       self._active_run = stream.current_run
       if chunk.event == "thread.message.delta":
-        if "functions" in chunk.data.delta.content[0].text.value:
-          prev_word = "functions"
-        elif prev_word != "":
-          if prev_word == "functions":
-            if ".send" in chunk.data.delta.content[0].text.value:
-              prev_word = ".send"
-            else:
-              # False alarm, the word "functions" was just said as a regular word
-              self._add_text_to_stream(llm_stream, "functions", "assistant")
-              self._add_chunk_to_stream(llm_stream, chunk)
-              prev_word = ""
-          elif prev_word == ".send":
-            prev_word = ""
-        elif "({" in chunk.data.delta.content[0].text.value:
-          self._add_text_to_stream(llm_stream, "\n", "assistant")
-          function_args += "{"
-          gathering_function_call = True
-        elif "})" in chunk.data.delta.content[0].text.value:
-          function_args += "}"
-          logging.info(f"Manually sending asset: {function_args}")
-          await send_asset(function_args, self._room)
-          function_args = ""
-          gathering_function_call = False
-        elif gathering_function_call:
-          function_args += chunk.data.delta.content[0].text.value
-        else:
-          self._add_chunk_to_stream(llm_stream, chunk)
+        for item in parser.feed(chunk.data.delta.content[0].text.value):
+          await self._handle_parsed_item(llm_stream, fnc_ctx, item)
       elif chunk.event == "thread.run.completed":
+        for item in parser.flush():
+          await self._handle_parsed_item(llm_stream, fnc_ctx, item)
         self._active_run = None
         llm_stream.push_text(None)
       elif chunk.event == "thread.run.requires_action":
+        for item in parser.flush():
+          await self._handle_parsed_item(llm_stream, fnc_ctx, item)
         tool_calls = chunk.data.required_action.submit_tool_outputs.tool_calls
         outputs = []
         for tool_call in tool_calls:
-          match tool_call.function.name:
-            case "send_asset":
-              logging.info(f"Sending asset: {tool_call.function.arguments}")
-              await send_asset(tool_call.function.arguments, self._room)
-              outputs.append({"tool_call_id": tool_call.id, "output": "OK"})
-            case _:
-              logging.info(f"Unrecognized function name: {tool_call.function.name}")
-              continue
+          name = tool_call.function.name
+          logging.info(f"Calling function {name}: {tool_call.function.arguments}")
+          try:
+            output = await self._call_function(
+              fnc_ctx, name, tool_call.function.arguments
+            )
+          except Exception as e:
+            # seen by the model, which can retry with other arguments
+            logging.warning(f"AI function {name} failed: {e}")
+            output = f"Error: {e}"
+          outputs.append({"tool_call_id": tool_call.id, "output": output})
         async with self._client.beta.threads.runs.submit_tool_outputs_stream(
           thread_id=self._thread.id,
           run_id=self._active_run.id,
           tool_outputs=outputs,
         ) as new_stream:
-          await self._handle_response_stream(new_stream, llm_stream)
+          await self._handle_response_stream(new_stream, llm_stream, fnc_ctx)
 
   async def chat(
     self,
@@ -212,33 +208,61 @@ class LLM(llm.LLM):
     temperature: float | None = None,
     n: int | None = None,
   ) -> "LLMStream":
-    thread = await self._add_messages_and_get_thread(history)
-    llm_stream = LLMStream()
-    stream: openai.AsyncAssistantEventHandler
-    async with self._client.beta.threads.runs.stream(
-      thread_id=thread.id,
-      assistant_id=self.assistant_id,
-      model=self._opts.model,
-      temperature=temperature,
-    ) as stream:
-      await self._handle_response_stream(stream, llm_stream)
-
+    # return right away, the run is streamed into llm_stream as it progresses so
+    # TTS can start on the first chunk
+    llm_stream = LLMStream(cancel_run=self._cancel_active_runs)
+    llm_stream.start(self._run(history, fnc_ctx, temperature, llm_stream))
     return llm_stream
 
+  async def _run(
+    self,
+    history: llm.ChatContext,
+    fnc_ctx: llm.FunctionContext | None,
+    temperature: float | None,
+    llm_stream: LLMStream,
+  ) -> None:
+    try:
+      thread = await self._add_messages_and_get_thread(history)
+      stream: openai.AsyncAssistantEventHandler
+      async with self._client.beta.threads.runs.stream(
+        thread_id=thread.id,
+        assistant_id=self.assistant_id,
+        model=self._opts.model,
+        temperature=temperature,
+      ) as stream:
+        await self._handle_response_stream(stream, llm_stream, fnc_ctx)
+    except Exception:
+      logging.exception("openai assistant run failed")
+    finally:
+      llm_stream.end()
+
 
 class LLMStream(llm.LLMStream):
-  def __init__(self) -> None:
+  def __init__(self, *, cancel_run: Callable[[], Awaitable[None]]) -> None:
     super().__init__()
     self._event_queue = asyncio.Queue[Optional[str]]()
     self._closed = False
+    self._ended = False
     self._running_fncs: MutableSet[asyncio.Task] = set()
+    self._cancel_run = cancel_run
+    self._run_task: asyncio.Task | None = None
+
+  def start(self, run: Coroutine[Any, Any, None]) -> None:
+    self._run_task = asyncio.create_task(run)
 
   def push_text(self, text: llm.ChatChunk) -> None:
     if self._closed:
       raise ValueError("cannot push text to a closed stream")
 
+    if text is None:
+      self._ended = True
     self._event_queue.put_nowait(text)
 
+  def end(self) -> None:
+    if not self._ended:
+      self._ended = True
+      self._event_queue.put_nowait(None)
+
   def __aiter__(self) -> "LLMStream":
     return self
 
@@ -252,6 +276,13 @@ class LLMStream(llm.LLMStream):
   async def aclose(self, wait: bool = True) -> None:
     self._closed = True
 
+    if self._run_task is not None and not self._run_task.done():
+      self._run_task.cancel()
+      with contextlib.suppress(asyncio.CancelledError):
+        await self._run_task
+      # the run keeps going on OpenAI's side until it's cancelled
+      await self._cancel_run()
+
     if not wait:
       for task in self._running_fncs:
         task.cancel()
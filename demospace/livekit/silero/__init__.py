@@ -1,7 +1,21 @@
+from demospace.livekit.silero.inference import (
+  InferenceOptions,
+  inference_options,
+  start_inference_server,
+)
+from demospace.livekit.silero.model import (
+  prewarm,
+)
 from demospace.livekit.silero.vad import (
   VAD,
+  VADStream,
 )
 
 __all__ = [
+  "InferenceOptions",
   "VAD",
+  "VADStream",
+  "inference_options",
+  "prewarm",
+  "start_inference_server",
 ]
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+from attrs import define
+
+from demospace.livekit.silero.model import OnnxModel
+from demospace.utils import metrics
+
+__all__ = [
+  "BatchScheduler",
+]
+
+_batch_size = metrics.gauge(
+  "vad_batch_size",
+  "Number of windows in the last batched VAD inference.",
+  aggregate="max",
+)
+_batches = metrics.counter("vad_batches_total", "Batched VAD inferences run.")
+
+
+@define
+class _PendingWindow:
+  inputs: np.ndarray
+  state: np.ndarray
+  sample_rate: int
+  future: asyncio.Future[tuple[float, np.ndarray]]
+
+
+class BatchScheduler:
+  """Gathers the windows of every stream the inference server serves and runs
+  them as a single inference.
+
+  A batch runs as soon as every registered stream has a window pending, when
+  max_batch_size windows are queued, or max_wait seconds after the first window
+  of the batch arrived, whichever comes first.
+  """
+
+  def __init__(
+    self,
+    model: OnnxModel,
+    *,
+    max_batch_size: int = 32,
+    max_wait: float = 0.01,
+  ) -> None:
+    self._model = model
+    self._max_batch_size = max(1, max_batch_size)
+    self._max_wait = max_wait
+    self._active_streams = 0
+    self._pending: list[_PendingWindow] = []
+    self._deadline: asyncio.TimerHandle | None = None
+    self._running_tasks: set[asyncio.Task] = set()
+
+  def register(self) -> None:
+    self._active_streams += 1
+
+  def unregister(self) -> None:
+    self._active_streams -= 1
+    # a closing stream may be the one the pending batch was waiting for
+    if self._pending and len(self._pending) >= self._active_streams:
+      self._flush()
+
+  async def run(
+    self, inputs: np.ndarray, state: np.ndarray, sample_rate: int
+  ) -> tuple[float, np.ndarray]:
+    """Returns the speech probability and the new state of a stream's window.
+
+    inputs is (1, context + window) and state (2, 1, 128), like OnnxModel.run
+    takes them for a single stream.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[tuple[float, np.ndarray]] = loop.create_future()
+    self._pending.append(_PendingWindow(inputs, state, sample_rate, future))
+
+    if (
+      len(self._pending) >= self._max_batch_size
+      or len(self._pending) >= self._active_streams
+    ):
+      self._flush()
+    elif self._deadline is None:
+      self._deadline = loop.call_later(self._max_wait, self._flush)
+
+    return await future
+
+  def _flush(self) -> None:
+    if self._deadline is not None:
+      self._deadline.cancel()
+      self._deadline = None
+
+    pending, self._pending = self._pending, []
+    if not pending:
+      return
+
+    # the model takes a single sample rate per call
+    by_sample_rate: dict[int, list[_PendingWindow]] = {}
+    for window in pending:
+      by_sample_rate.setdefault(window.sample_rate, []).append(window)
+
+    for sample_rate, windows in by_sample_rate.items():
+      task = asyncio.create_task(self._run_batch(sample_rate, windows))
+      self._running_tasks.add(task)
+      task.add_done_callback(self._running_tasks.discard)
+
+  async def _run_batch(self, sample_rate: int, windows: list[_PendingWindow]) -> None:
+    try:
+      inputs = np.concatenate([w.inputs for w in windows], axis=0)
+      states = np.concatenate([w.state for w in windows], axis=1)
+
+      probs, new_states = await asyncio.to_thread(
+        self._model.run, inputs, states, sample_rate
+      )
+    except Exception as e:
+      for w in windows:
+        if not w.future.done():
+          w.future.set_exception(e)
+      return
+
+    _batch_size.set(len(windows))
+    _batches.inc()
+
+    for i, w in enumerate(windows):
+      if not w.future.done():
+        w.future.set_result((float(probs[i]), new_states[:, i : i + 1]))
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+
+import numpy as np
+from attrs import define
+
+from demospace.livekit.silero import batch, model
+
+__all__ = [
+  "InferenceClient",
+  "InferenceOptions",
+  "inference_options",
+  "server_address",
+  "start_inference_server",
+]
+
+# kind, request id, sample rate and payload size, followed by the payload
+_REQUEST = struct.Struct("<BIII")
+# request id, speech probability and state size, followed by the new state
+_RESPONSE = struct.Struct("<IfI")
+_INFER, _REGISTER, _UNREGISTER = range(3)
+
+
+@define(frozen=True)
+class InferenceOptions:
+  enabled: bool
+  max_batch_size: int
+  # added latency of a window at most, the batch runs once every stream has a
+  # window pending otherwise
+  max_batch_wait: float
+
+
+def inference_options(
+  *,
+  enabled: bool | None = None,
+  max_batch_size: int | None = None,
+  max_batch_wait: float | None = None,
+) -> InferenceOptions:
+  if enabled is None:
+    enabled = os.environ.get("VAD_SHARED_INFERENCE", "0") == "1"
+  if max_batch_size is None:
+    max_batch_size = int(os.environ.get("VAD_MAX_BATCH_SIZE", "32"))
+  if max_batch_wait is None:
+    max_batch_wait = float(os.environ.get("VAD_MAX_BATCH_WAIT_MS", "10")) / 1000
+
+  return InferenceOptions(
+    enabled=enabled,
+    max_batch_size=max_batch_size,
+    max_batch_wait=max_batch_wait,
+  )
+
+
+# Set by start_inference_server() before the workers and their jobs are forked,
+# they inherit it.
+_address: str | None = None
+
+
+def server_address() -> str | None:
+  return _address
+
+
+def start_inference_server(
+  opts: InferenceOptions | None = None,
+) -> multiprocessing.Process:
+  """Runs the VAD inference of every process forked from this one afterwards in
+  a single process, which batches the windows of all their streams.
+
+  Jobs are processes of their own, batching in a job would only ever batch
+  its own room. The model loaded by prewarm() is inherited by the server.
+  """
+  global _address
+  opts = opts or inference_options()
+  address = os.path.join(tempfile.mkdtemp(prefix="demospace_vad_"), "inference.sock")
+  ready = multiprocessing.Event()
+  process = multiprocessing.Process(
+    target=_serve, args=(address, opts, ready), name="vad-inference", daemon=True
+  )
+  process.start()
+  if not ready.wait(10):
+    process.kill()
+    raise RuntimeError("VAD inference server didn't start")
+
+  logging.info(f"vad inference server listening on {address}")
+  _address = address
+  return process
+
+
+def _serve(address: str, opts: InferenceOptions, ready) -> None:
+  asyncio.run(_InferenceServer(opts).serve(address, ready))
+
+
+class _InferenceServer:
+  def __init__(self, opts: InferenceOptions) -> None:
+    self._scheduler = batch.BatchScheduler(
+      model.load_model(),
+      max_batch_size=opts.max_batch_size,
+      max_wait=opts.max_batch_wait,
+    )
+    self._tasks: set[asyncio.Task] = set()
+
+  async def serve(self, address: str, ready) -> None:
+    server = await asyncio.start_unix_server(self._handle, address)
+    ready.set()
+    async with server:
+      await server.serve_forever()
+
+  async def _handle(
+    self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+  ) -> None:
+    # a connection per job process
+    registered = 0
+    try:
+      while True:
+        kind, request_id, sample_rate, size = _REQUEST.unpack(
+          await reader.readexactly(_REQUEST.size)
+        )
+        if kind == _REGISTER:
+          registered += 1
+          self._scheduler.register()
+        elif kind == _UNREGISTER:
+          registered -= 1
+          self._scheduler.unregister()
+        else:
+          payload = await reader.readexactly(size)
+          task = asyncio.create_task(
+            self._infer(writer, request_id, sample_rate, payload)
+          )
+          self._tasks.add(task)
+          task.add_done_callback(self._tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+      pass  # the job exited
+    finally:
+      for _ in range(registered):
+        self._scheduler.unregister()
+      writer.close()
+
+  async def _infer(
+    self,
+    writer: asyncio.StreamWriter,
+    request_id: int,
+    sample_rate: int,
+    payload: bytes,
+  ) -> None:
+    # the window with the context in front of it, then the state
+    size = model.context_size(sample_rate) + model.window_size(sample_rate)
+    inputs = np.frombuffer(payload, dtype=np.float32, count=size).reshape(1, size)
+    state = np.frombuffer(payload, dtype=np.float32, offset=size * 4)
+    try:
+      probability, state = await self._scheduler.run(
+        inputs, state.reshape(2, 1, -1), sample_rate
+      )
+    except Exception:
+      logging.exception("vad inference failed")
+      # the job runs its inference itself from now on
+      writer.close()
+      return
+
+    if not writer.is_closing():
+      state = state.tobytes()
+      writer.write(_RESPONSE.pack(request_id, probability, len(state)) + state)
+
+
+class InferenceClient:
+  """Sends the windows of a job's VADStreams to the inference server.
+
+  The recurrent state stays with the stream and is sent with every window, so
+  the streams run their inference in the job when the server can't be reached
+  or goes away.
+  """
+
+  def __init__(self, address: str) -> None:
+    self._address = address
+    self._streams = 0
+    self._connect_task: asyncio.Task | None = None
+    self._read_task: asyncio.Task | None = None
+    self._writer: asyncio.StreamWriter | None = None
+    self._pending: dict[int, asyncio.Future[tuple[float, np.ndarray]]] = {}
+    self._next_id = 0
+
+  def register(self) -> None:
+    self._streams += 1
+    if self._connect_task is None:
+      self._connect_task = asyncio.create_task(self._connect())
+    self._send(_REGISTER)
+
+  def unregister(self) -> None:
+    self._streams -= 1
+    self._send(_UNREGISTER)
+    if self._streams == 0:
+      self._disconnect()
+
+  async def infer(self, stream_model: model.StreamModel, audio: np.ndarray) -> float:
+    inputs = stream_model.next_input(audio)
+    if self._connect_task is not None:
+      await self._connect_task
+
+    if self._writer is not None:
+      try:
+        probability, stream_model.state = await self._request(
+          inputs, stream_model.state, stream_model.sample_rate
+        )
+        return probability
+      except ConnectionError:
+        pass
+
+    probs, stream_model.state = await asyncio.to_thread(
+      stream_model.model.run, inputs, stream_model.state, stream_model.sample_rate
+    )
+    return float(probs[0])
+
+  async def _connect(self) -> None:
+    try:
+      reader, self._writer = await asyncio.open_unix_connection(self._address)
+    except OSError as e:
+      logging.warning(f"vad inference server unavailable, running it in the job: {e}")
+      return
+
+    # the streams registered while connecting
+    for _ in range(self._streams):
+      self._send(_REGISTER)
+    self._read_task = asyncio.create_task(self._read(reader, self._writer))
+
+  def _disconnect(self) -> None:
+    # every stream of the job is closed, the next one connects again
+    for task in (self._connect_task, self._read_task):
+      if task is not None:
+        task.cancel()
+    self._connect_task = self._read_task = None
+    if self._writer is not None:
+      self._writer.close()
+      self._writer = None
+
+  async def _read(
+    self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+  ) -> None:
+    try:
+      while True:
+        request_id, probability, size = _RESPONSE.unpack(
+          await reader.readexactly(_RESPONSE.size)
+        )
+        state = np.frombuffer(await reader.readexactly(size), dtype=np.float32)
+        future = self._pending.pop(request_id, None)
+        if future is not None and not future.done():
+          future.set_result((probability, state.reshape(2, 1, -1)))
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+      logging.warning(f"lost the vad inference server, running it in the job: {e!r}")
+    finally:
+      writer.close()
+      if self._writer is writer:
+        self._writer = None
+      pending, self._pending = self._pending, {}
+      for future in pending.values():
+        if not future.done():
+          future.set_exception(ConnectionError("vad inference server went away"))
+
+  async def _request(
+    self, inputs: np.ndarray, state: np.ndarray, sample_rate: int
+  ) -> tuple[float, np.ndarray]:
+    request_id = self._next_id
+    self._next_id = (self._next_id + 1) % 2**32
+    future: asyncio.Future[tuple[float, np.ndarray]] = (
+      asyncio.get_running_loop().create_future()
+    )
+    self._pending[request_id] = future
+
+    payload = inputs.tobytes() + state.tobytes()
+    self._writer.write(
+      _REQUEST.pack(_INFER, request_id, sample_rate, len(payload)) + payload
+    )
+    return await future
+
+  def _send(self, kind: int) -> None:
+    if self._writer is not None:
+      self._writer.write(_REQUEST.pack(kind, 0, 0, 0))
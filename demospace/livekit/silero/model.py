@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+import time
+from typing import Literal
+
+import numpy as np
+import onnxruntime
+from attrs import define
+
+from demospace.utils import metrics
+
+__all__ = [
+  "ModelOptions",
+  "OnnxModel",
+  "StreamModel",
+  "load_model",
+  "model_options",
+  "prewarm",
+  "stream_model",
+]
+
+GraphOptimizationLevel = Literal["disable", "basic", "extended", "all"]
+
+_GRAPH_OPTIMIZATION_LEVELS = {
+  "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+  "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+  "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+  "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+# Silero VAD v5, MIT licensed (https://github.com/snakers4/silero-vad).
+_BUNDLED_MODEL_PATH = os.path.join(
+  os.path.dirname(__file__), "resources", "silero_vad.onnx"
+)
+
+_STATE_SIZE = 128
+
+_load_duration = metrics.gauge(
+  "vad_model_load_seconds",
+  "Time spent loading the shared Silero VAD model.",
+  aggregate="max",
+)
+
+
+@define(frozen=True)
+class ModelOptions:
+  model_path: str
+  intra_op_threads: int
+  inter_op_threads: int
+  graph_optimization_level: GraphOptimizationLevel
+
+
+def model_options(
+  *,
+  model_path: str | None = None,
+  intra_op_threads: int | None = None,
+  inter_op_threads: int | None = None,
+  graph_optimization_level: GraphOptimizationLevel | None = None,
+) -> ModelOptions:
+  if model_path is None:
+    model_path = os.environ.get("VAD_MODEL_PATH", _BUNDLED_MODEL_PATH)
+  if intra_op_threads is None:
+    intra_op_threads = int(os.environ.get("VAD_INTRA_OP_THREADS", "1"))
+  if inter_op_threads is None:
+    inter_op_threads = int(os.environ.get("VAD_INTER_OP_THREADS", "1"))
+  if graph_optimization_level is None:
+    graph_optimization_level = os.environ.get("VAD_GRAPH_OPTIMIZATION_LEVEL", "all")
+
+  if graph_optimization_level not in _GRAPH_OPTIMIZATION_LEVELS:
+    raise ValueError(
+      f"unknown graph optimization level {graph_optimization_level}, "
+      f"expected one of {list(_GRAPH_OPTIMIZATION_LEVELS)}"
+    )
+
+  return ModelOptions(
+    model_path=model_path,
+    intra_op_threads=intra_op_threads,
+    inter_op_threads=inter_op_threads,
+    graph_optimization_level=graph_optimization_level,
+  )
+
+
+def window_size(sample_rate: int) -> int:
+  return 512 if sample_rate == 16000 else 256
+
+
+def context_size(sample_rate: int) -> int:
+  return 64 if sample_rate == 16000 else 32
+
+
+class OnnxModel:
+  def __init__(self, opts: ModelOptions) -> None:
+    sess_opts = onnxruntime.SessionOptions()
+    sess_opts.intra_op_num_threads = opts.intra_op_threads
+    sess_opts.inter_op_num_threads = opts.inter_op_threads
+    sess_opts.graph_optimization_level = _GRAPH_OPTIMIZATION_LEVELS[
+      opts.graph_optimization_level
+    ]
+    sess_opts.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+
+    self._opts = opts
+    self._session = onnxruntime.InferenceSession(
+      opts.model_path,
+      sess_options=sess_opts,
+      providers=["CPUExecutionProvider"],
+    )
+
+  @property
+  def opts(self) -> ModelOptions:
+    return self._opts
+
+  def run(
+    self, audio: np.ndarray, state: np.ndarray, sample_rate: int
+  ) -> tuple[np.ndarray, np.ndarray]:
+    # audio is (batch, context + window) float32, state is (2, batch, 128)
+    probs, new_state = self._session.run(
+      None,
+      {
+        "input": audio,
+        "state": state,
+        "sr": np.array(sample_rate, dtype=np.int64),
+      },
+    )
+    return probs[:, 0], new_state
+
+
+class StreamModel:
+  """Per-stream recurrent state on top of a shared OnnxModel."""
+
+  def __init__(self, model: OnnxModel, sample_rate: int) -> None:
+    if sample_rate not in (8000, 16000):
+      raise ValueError("Silero VAD only supports 8KHz and 16KHz sample rates")
+
+    self._model = model
+    self._sample_rate = sample_rate
+    self._window_size = window_size(sample_rate)
+    self._context_size = context_size(sample_rate)
+    self.reset_states()
+
+  @property
+  def model(self) -> OnnxModel:
+    return self._model
+
+  @property
+  def sample_rate(self) -> int:
+    return self._sample_rate
+
+  @property
+  def window_size(self) -> int:
+    return self._window_size
+
+  @property
+  def state(self) -> np.ndarray:
+    return self._state
+
+  @state.setter
+  def state(self, state: np.ndarray) -> None:
+    self._state = state
+
+  def reset_states(self) -> None:
+    self._state = np.zeros((2, 1, _STATE_SIZE), dtype=np.float32)
+    # the model expects the tail of the previous window in front of each window
+    self._input = np.zeros(
+      (1, self._context_size + self._window_size), dtype=np.float32
+    )
+
+  def next_input(self, audio: np.ndarray) -> np.ndarray:
+    self._input[0, : self._context_size] = self._input[0, -self._context_size :]
+    self._input[0, self._context_size :] = audio
+    return self._input
+
+  def __call__(self, audio: np.ndarray) -> float:
+    probs, self._state = self._model.run(
+      self.next_input(audio), self._state, self._sample_rate
+    )
+    return float(probs[0])
+
+
+# Loaded once per process and shared by every VAD/VADStream. Job processes
+# are forked from the worker, so a model loaded by prewarm() is inherited.
+_models: dict[ModelOptions, OnnxModel] = {}
+_lock = threading.Lock()
+
+
+def load_model(opts: ModelOptions | None = None) -> OnnxModel:
+  opts = opts or model_options()
+  with _lock:
+    model = _models.get(opts)
+    if model is not None:
+      return model
+
+    start_time = time.perf_counter()
+    model = OnnxModel(opts)
+    load_duration = time.perf_counter() - start_time
+
+    _load_duration.set(load_duration)
+    logging.info(f"loaded silero vad model {opts.model_path} in {load_duration:.2f}s")
+
+    _models[opts] = model
+    return model
+
+
+def stream_model(model: OnnxModel, sample_rate: int) -> StreamModel:
+  return StreamModel(model, sample_rate)
+
+
+def prewarm(**kwargs) -> None:
+  load_model(model_options(**kwargs))
@@ -1,23 +1,46 @@
-import torch
-from livekit.plugins import silero
+from __future__ import annotations
 
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import List, Optional
 
-class VAD(silero.VAD):
+import numpy as np
+from livekit import agents, rtc
+
+from demospace.livekit.silero import inference, model
+
+
+class VAD(agents.vad.VAD):
   def __init__(
     self,
     *,
     min_silence_duration: float = 0.8,
-    use_onnx: bool = True,
+    model_path: str | None = None,
+    intra_op_threads: int | None = None,
+    inter_op_threads: int | None = None,
+    graph_optimization_level: model.GraphOptimizationLevel | None = None,
   ) -> None:
     self._min_silence_duration = min_silence_duration
 
-    self._model, _ = torch.hub.load(
-      repo_or_dir="snakers4/silero-vad",
-      model="silero_vad",
-      onnx=use_onnx,
-      trust_repo=True,
+    self._model = model.load_model(
+      model.model_options(
+        model_path=model_path,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+        graph_optimization_level=graph_optimization_level,
+      )
     )
 
+    # windows are batched with every other job's by the inference server, when
+    # the worker runs one
+    self._scheduler: inference.InferenceClient | None = None
+    address = inference.server_address()
+    if address is not None:
+      self._scheduler = inference.InferenceClient(address)
+
   def stream(
     self,
     *,
@@ -27,16 +50,237 @@ class VAD(silero.VAD):
     sample_rate: int = 16000,
     max_buffered_speech: float = 45.0,
     threshold: float = 0.2,
-  ) -> silero.VADStream:
+  ) -> "VADStream":
     if min_silence_duration is None:
       min_silence_duration = self._min_silence_duration
 
-    return silero.VADStream(
-      self._model,
+    return VADStream(
+      model.stream_model(self._model, sample_rate),
       min_speaking_duration=min_speaking_duration,
       min_silence_duration=min_silence_duration,
       padding_duration=padding_duration,
       sample_rate=sample_rate,
       max_buffered_speech=max_buffered_speech,
       threshold=threshold,
+      scheduler=self._scheduler,
     )
+
+
+# Same event logic as livekit.plugins.silero.VADStream, without torch. Audio is
+# fed to the model in the fixed windows Silero v5 expects (512 samples at 16KHz).
+class VADStream(agents.vad.VADStream):
+  def __init__(
+    self,
+    stream_model: model.StreamModel,
+    *,
+    min_speaking_duration: float,
+    min_silence_duration: float,
+    padding_duration: float,
+    sample_rate: int,
+    max_buffered_speech: float,
+    threshold: float,
+    scheduler: inference.InferenceClient | None = None,
+  ) -> None:
+    self._min_speaking_duration = min_speaking_duration
+    self._min_silence_duration = min_silence_duration
+    self._padding_duration = padding_duration
+    self._sample_rate = sample_rate
+    self._max_buffered_speech = max_buffered_speech
+    self._threshold = threshold
+
+    self._queue = asyncio.Queue[Optional[rtc.AudioFrame]]()
+    self._event_queue = asyncio.Queue[Optional[agents.vad.VADEvent]]()
+    self._model = stream_model
+    self._scheduler = scheduler
+
+    self._closed = False
+    self._speaking = False
+    self._waiting_start = False
+    self._waiting_end = False
+    self._current_sample = 0
+    self._filter = agents.utils.ExpFilter(0.8)
+    self._min_speaking_samples = min_speaking_duration * sample_rate
+    self._min_silence_samples = min_silence_duration * sample_rate
+    self._padding_duration_samples = padding_duration * sample_rate
+    self._max_buffered_samples = max_buffered_speech * sample_rate
+
+    # resampled int16 audio waiting for a full window
+    self._pending_audio = bytearray()
+    # original frames with their resampled length, released once fully consumed
+    self._original_frames: deque[tuple[rtc.AudioFrame, int]] = deque()
+    self._consumed_samples = 0
+    self._buffered_frames: List[rtc.AudioFrame] = []
+
+    if self._scheduler is not None:
+      self._scheduler.register()
+    self._main_task = asyncio.create_task(self._run())
+
+  def push_frame(self, frame: rtc.AudioFrame) -> None:
+    if self._closed:
+      raise ValueError("cannot push frame to closed stream")
+
+    self._queue.put_nowait(frame)
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    self._closed = True
+    if not wait:
+      self._main_task.cancel()
+
+    self._queue.put_nowait(None)
+    with contextlib.suppress(asyncio.CancelledError):
+      await self._main_task
+
+  async def _run(self) -> None:
+    window_bytes = self._model.window_size * 2
+    try:
+      while True:
+        frame = await self._queue.get()
+        if frame is None:
+          break  # None is sent inside aclose
+
+        if frame.sample_rate != self._sample_rate or frame.num_channels != 1:
+          resampled_frame = frame.remix_and_resample(self._sample_rate, 1)
+        else:
+          resampled_frame = frame
+
+        self._pending_audio += resampled_frame.data.cast("B")
+        self._original_frames.append((frame, resampled_frame.samples_per_channel))
+
+        while len(self._pending_audio) >= window_bytes:
+          window = bytes(self._pending_audio[:window_bytes])
+          del self._pending_audio[:window_bytes]
+          await asyncio.shield(self._run_inference(window))
+
+    except Exception:
+      logging.exception("silero stream failed")
+    finally:
+      if self._scheduler is not None:
+        self._scheduler.unregister()
+      self._event_queue.put_nowait(None)
+
+  async def _run_inference(self, window: bytes) -> None:
+    audio = np.frombuffer(window, dtype=np.int16).astype(np.float32) / 32768.0
+
+    start_time = time.time()
+    if self._scheduler is not None:
+      raw_prob = await self._scheduler.infer(self._model, audio)
+    else:
+      raw_prob = await asyncio.to_thread(self._model, audio)
+    probability = self._filter.apply(1.0, raw_prob)
+    inference_duration = time.time() - start_time
+
+    self._dispatch_event(
+      self._pop_original_frames(len(audio)),
+      probability,
+      raw_prob,
+      inference_duration,
+    )
+    self._current_sample += len(audio)
+
+  def _pop_original_frames(self, samples: int) -> List[rtc.AudioFrame]:
+    self._consumed_samples += samples
+    original_frames = []
+    while (
+      self._original_frames and self._original_frames[0][1] <= self._consumed_samples
+    ):
+      frame, frame_samples = self._original_frames.popleft()
+      self._consumed_samples -= frame_samples
+      original_frames.append(frame)
+
+    return original_frames
+
+  def _dispatch_event(
+    self,
+    original_frames: List[rtc.AudioFrame],
+    probability: float,
+    raw_inference_prob: float,
+    inference_duration: float,
+  ) -> None:
+    samples_10ms = self._sample_rate / 100
+    padding_count = int(
+      self._padding_duration_samples // samples_10ms
+    )  # number of frames to keep for the padding (one side)
+
+    self._buffered_frames.extend(original_frames)
+    if (
+      not self._speaking
+      and not self._waiting_start
+      and len(self._buffered_frames) > padding_count
+    ):
+      self._buffered_frames = self._buffered_frames[
+        len(self._buffered_frames) - padding_count :
+      ]
+
+    max_buffer_len = padding_count + max(
+      int(self._max_buffered_samples // samples_10ms),
+      int(self._min_speaking_samples // samples_10ms),
+    )
+    if len(self._buffered_frames) > max_buffer_len:
+      self._buffered_frames = self._buffered_frames[
+        len(self._buffered_frames) - max_buffer_len :
+      ]
+
+    if probability >= self._threshold:
+      # speaking, wait for min_speaking_duration to trigger START_OF_SPEECH
+      self._waiting_end = False
+      if not self._waiting_start and not self._speaking:
+        self._waiting_start = True
+        self._start_speech = self._current_sample
+
+      if self._waiting_start and (
+        self._current_sample - self._start_speech >= self._min_speaking_samples
+      ):
+        self._waiting_start = False
+        self._speaking = True
+
+        # put the speech that was used to trigger the start in the event
+        self._event_queue.put_nowait(
+          agents.vad.VADEvent(
+            type=agents.vad.VADEventType.START_OF_SPEECH,
+            samples_index=self._start_speech,
+            frames=self._buffered_frames[padding_count:],
+            speaking=True,
+          )
+        )
+
+    self._event_queue.put_nowait(
+      agents.vad.VADEvent(
+        type=agents.vad.VADEventType.INFERENCE_DONE,
+        samples_index=self._current_sample,
+        frames=original_frames,
+        probability=probability,
+        raw_inference_prob=raw_inference_prob,
+        inference_duration=inference_duration,
+        speaking=self._speaking,
+      )
+    )
+
+    if probability < self._threshold:
+      # stopped speaking, wait for min_silence_duration to trigger END_OF_SPEECH
+      self._waiting_start = False
+      if not self._waiting_end and self._speaking:
+        self._waiting_end = True
+        self._end_speech = self._current_sample
+
+      if self._waiting_end and (
+        self._current_sample - self._end_speech
+        >= max(self._min_silence_samples, self._padding_duration_samples)
+      ):
+        self._waiting_end = False
+        self._speaking = False
+        self._event_queue.put_nowait(
+          agents.vad.VADEvent(
+            type=agents.vad.VADEventType.END_OF_SPEECH,
+            samples_index=self._end_speech,
+            duration=(self._end_speech - self._start_speech) / self._sample_rate,
+            frames=self._buffered_frames,
+            speaking=False,
+          )
+        )
+
+  async def __anext__(self) -> agents.vad.VADEvent:
+    evt = await self._event_queue.get()
+    if evt is None:
+      raise StopAsyncIteration
+
+    return evt
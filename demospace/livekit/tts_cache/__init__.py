@@ -0,0 +1,17 @@
+from demospace.livekit.tts_cache.cache import (
+  AudioCache,
+  CacheOptions,
+  CacheStats,
+  audio_cache,
+)
+from demospace.livekit.tts_cache.tts import (
+  CachedTTS,
+)
+
+__all__ = [
+  "AudioCache",
+  "CacheOptions",
+  "CacheStats",
+  "CachedTTS",
+  "audio_cache",
+]
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+from typing import Iterator
+
+from attrs import define
+from livekit import rtc
+
+from demospace.utils import metrics
+
+__all__ = [
+  "AudioCache",
+  "CacheOptions",
+  "CacheStats",
+  "audio_cache",
+  "cache_key",
+  "iter_frames",
+  "normalize_text",
+]
+
+_DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "demospace_tts_cache")
+
+_hits = metrics.counter("tts_cache_hits_total", "TTS requests served from the cache.")
+_misses = metrics.counter(
+  "tts_cache_misses_total", "TTS requests sent to the provider."
+)
+_bytes_saved = metrics.counter(
+  "tts_cache_bytes_saved_total",
+  "PCM bytes served from the cache instead of the provider.",
+)
+_memory_bytes = metrics.gauge(
+  "tts_cache_memory_bytes", "Audio held by the in-memory tier of the TTS cache."
+)
+
+
+def normalize_text(text: str) -> str:
+  # whitespace only, casing and punctuation change how the sentence is spoken
+  return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(*, voice: str, model: str, sample_rate: int, text: str) -> str:
+  return hashlib.sha256(
+    json.dumps([voice, model, sample_rate, text], ensure_ascii=False).encode()
+  ).hexdigest()
+
+
+@define(kw_only=True)
+class CacheOptions:
+  # audio kept mapped in this process, least recently used first out
+  max_memory_bytes: int = 32 * 1024 * 1024
+  # audio kept on disk, shared by every process using the directory
+  max_disk_bytes: int = 512 * 1024 * 1024
+
+
+@define(kw_only=True)
+class CacheStats:
+  hits: int
+  memory_hits: int
+  misses: int
+  bytes_saved: int
+
+  @property
+  def hit_rate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+
+class AudioCache:
+  """Synthesized speech stored as raw 16-bit mono PCM files, one per key.
+
+  Files are memory-mapped on read, so the audio lives in the page cache and is
+  shared by every job process instead of being copied into each of them. Both
+  the mapped files and the directory are bounded and evicted least recently
+  used first.
+  """
+
+  def __init__(self, directory: str, opts: CacheOptions | None = None) -> None:
+    self._directory = directory
+    self._opts = opts or CacheOptions()
+    self._mapped: collections.OrderedDict[str, mmap.mmap] = collections.OrderedDict()
+    self._mapped_bytes = 0
+    self._lock = threading.Lock()
+    self._hits = self._memory_hits = self._misses = self._bytes_saved = 0
+    os.makedirs(directory, exist_ok=True)
+
+  def stats(self) -> CacheStats:
+    return CacheStats(
+      hits=self._hits,
+      memory_hits=self._memory_hits,
+      misses=self._misses,
+      bytes_saved=self._bytes_saved,
+    )
+
+  def get(self, key: str) -> memoryview | None:
+    with self._lock:
+      mapped = self._mapped.get(key)
+      if mapped is not None:
+        self._mapped.move_to_end(key)
+        self._memory_hits += 1
+      else:
+        path = self._path(key)
+        try:
+          with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+          # the mtime orders the disk tier for eviction
+          os.utime(path)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file
+          self._misses += 1
+          _misses.inc()
+          return None
+        self._map(key, mapped)
+
+      self._hits += 1
+      self._bytes_saved += len(mapped)
+    _hits.inc()
+    _bytes_saved.inc(len(mapped))
+    return memoryview(mapped)
+
+  def _map(self, key: str, mapped: mmap.mmap) -> None:
+    self._mapped[key] = mapped
+    self._mapped_bytes += len(mapped)
+    while self._mapped_bytes > self._opts.max_memory_bytes and len(self._mapped) > 1:
+      # not closed, streams still playing it hold a view, the mapping goes away
+      # with the last of them
+      _, evicted = self._mapped.popitem(last=False)
+      self._mapped_bytes -= len(evicted)
+    _memory_bytes.set(self._mapped_bytes)
+
+  def put(self, key: str, pcm: bytes | bytearray) -> None:
+    if not pcm:
+      return
+
+    # write then rename, concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        f.write(pcm)
+      os.replace(tmp_path, self._path(key))
+    except OSError as e:
+      logging.warning(f"failed to write tts cache entry {key}: {e}")
+      with contextlib.suppress(OSError):
+        os.remove(tmp_path)
+      return
+
+    self._evict_disk()
+
+  def __contains__(self, key: str) -> bool:
+    return key in self._mapped or os.path.exists(self._path(key))
+
+  def _evict_disk(self) -> None:
+    # other processes write to the same directory, so sizes are read from disk
+    # rather than tracked here. Only runs on misses, after the provider call.
+    entries = []
+    total = 0
+    with os.scandir(self._directory) as it:
+      for entry in it:
+        if not entry.name.endswith(".pcm"):
+          continue
+        with contextlib.suppress(FileNotFoundError):
+          st = entry.stat()
+          entries.append((st.st_mtime, st.st_size, entry.path))
+          total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+      if total <= self._opts.max_disk_bytes:
+        break
+      # mapped copies stay readable after the unlink
+      with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+      total -= size
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self._directory, f"{key}.pcm")
+
+
+def iter_frames(
+  pcm: memoryview, *, sample_rate: int, frame_duration: float = 0.01
+) -> Iterator[rtc.AudioFrame]:
+  # same 10ms frames as the TTS plugins produce
+  bytes_per_frame = int(sample_rate * frame_duration) * 2
+  for start in range(0, len(pcm), bytes_per_frame):
+    data = pcm[start : start + bytes_per_frame]
+    yield rtc.AudioFrame(
+      data=data,
+      sample_rate=sample_rate,
+      num_channels=1,
+      samples_per_channel=len(data) // 2,
+    )
+
+
+_cache: AudioCache | None = None
+
+
+def audio_cache() -> AudioCache:
+  global _cache
+  if _cache is None:
+    _cache = AudioCache(os.environ.get("TTS_CACHE_DIR", _DEFAULT_CACHE_DIR))
+  return _cache
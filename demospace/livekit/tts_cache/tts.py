@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import re
+from typing import Iterable
+
+from attrs import define
+from livekit.agents import tts
+
+from demospace.livekit.tts_cache import cache
+from demospace.utils import tracing
+
+__all__ = [
+  "CachedTTS",
+]
+
+
+# end of a sentence, with the closing quotes or brackets and the space after it
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+
+# Normalized texts known to be in the cache, per voice, model and sample rate.
+# Warmed before the jobs are forked, so they inherit it.
+_cached_texts: dict[tuple[str, str, int], set[str]] = {}
+
+
+class CachedTTS(tts.TTS):
+  """Serves speech from the audio cache, filling it on first use.
+
+  `voice` and `model` are part of the cache key, they must identify what the
+  wrapped TTS is configured with. stream() keeps the wrapped TTS's stream, only
+  the cached phrases a segment starts with are played from the cache.
+  """
+
+  def __init__(
+    self,
+    tts: tts.TTS,
+    *,
+    voice: str,
+    model: str,
+    audio_cache: cache.AudioCache | None = None,
+  ) -> None:
+    super().__init__(
+      streaming_supported=tts.streaming_supported,
+      sample_rate=tts.sample_rate,
+      num_channels=tts.num_channels,
+    )
+    if tts.num_channels != 1:
+      raise ValueError("CachedTTS only supports mono audio")
+
+    self._tts = tts
+    self._voice = voice
+    self._model = model
+    self._cache = audio_cache or cache.audio_cache()
+    self._cached_texts = _cached_texts.setdefault(
+      (voice, model, tts.sample_rate), set()
+    )
+
+  @property
+  def audio_cache(self) -> cache.AudioCache:
+    return self._cache
+
+  def synthesize(self, text: str) -> tts.ChunkedStream:
+    text = cache.normalize_text(text)
+    key = self._key(text)
+    pcm = self._cache.get(key)
+    if pcm is not None:
+      return CachedChunkedStream(text, pcm, self.sample_rate)
+
+    return RecordingChunkedStream(
+      text, self._tts.synthesize(text), lambda audio: self._store(text, audio)
+    )
+
+  def stream(self) -> tts.SynthesizeStream:
+    return CachedSynthesizeStream(self, self._tts.stream())
+
+  async def warm(self, texts: Iterable[str]) -> None:
+    for text in texts:
+      text = cache.normalize_text(text)
+      if self._key(text) in self._cache:
+        self._cached_texts.add(text)
+        continue
+
+      stream = self.synthesize(text)
+      async for _ in stream:
+        pass
+      logging.info(f"cached tts audio for {text[:40]!r}")
+
+  def _lookup(self, text: str) -> memoryview | None:
+    return self._cache.get(self._key(text))
+
+  async def _store(self, text: str, audio: bytes) -> None:
+    if not audio:
+      return
+    # disk write off the event loop, playback may still be going on
+    await asyncio.to_thread(self._cache.put, self._key(text), audio)
+    # added on the loop, the streams iterate over the texts
+    self._cached_texts.add(text)
+
+  def _key(self, text: str) -> str:
+    return cache.cache_key(
+      voice=self._voice, model=self._model, sample_rate=self.sample_rate, text=text
+    )
+
+
+@define
+class _CachedPhrase:
+  text: str
+  pcm: memoryview
+
+
+@define
+class _StreamedText:
+  # set once the sentence was forwarded completely
+  text: str = ""
+
+
+class _SegmentStart: ...
+
+
+class _SegmentEnd: ...
+
+
+class CachedSynthesizeStream(tts.SynthesizeStream):
+  """Streams through the wrapped TTS's stream, except for the cached phrases a
+  segment or a sentence starts with.
+
+  The text is held while it's the beginning of a cached phrase and forwarded as
+  soon as it isn't, so uncached text only waits for the first word that tells
+  it apart. Complete cached phrases are played from the cache. Forwarded text
+  is a segment of the wrapped stream per sentence, the audio of each is stored
+  under the sentence once it's complete, so it's played from the cache the next
+  time it's said.
+  """
+
+  def __init__(self, cached_tts: CachedTTS, stream: tts.SynthesizeStream) -> None:
+    self._tts = cached_tts
+    self._stream = stream
+    self._closed = False
+    self._held = ""
+    self._in_segment = False
+    self._forwarding = False
+    # the sentence being forwarded, and its source
+    self._sentence = ""
+    self._streamed: _StreamedText | None = None
+    self._sources = asyncio.Queue[
+      _SegmentStart | _CachedPhrase | _StreamedText | _SegmentEnd | None
+    ]()
+    self._event_queue = asyncio.Queue[tts.SynthesisEvent | None]()
+    self._main_task = asyncio.create_task(self._run())
+
+  def push_text(self, token: str | None) -> None:
+    if self._closed:
+      raise ValueError("cannot push to a closed stream")
+
+    if token is None:
+      self._end_segment()
+      return
+    if not self._in_segment:
+      self._in_segment = True
+      self._sources.put_nowait(_SegmentStart())
+
+    if self._forwarding:
+      self._forward(token)
+      return
+
+    self._held += token
+    self._play_cached_phrases()
+
+  def _play_cached_phrases(self) -> None:
+    cached_texts = self._tts._cached_texts
+    while True:
+      text = cache.normalize_text(self._held)
+      if not text:
+        return
+
+      # a complete cached phrase followed by more text
+      phrase = next(
+        (
+          p
+          for p in cached_texts
+          if text.startswith(p) and text[len(p) : len(p) + 1] == " "
+        ),
+        None,
+      )
+      if phrase is None:
+        break
+      if not self._play(phrase):
+        break
+      rest = text[len(phrase) + 1 :]
+      self._held = rest + " " if self._held[-1:].isspace() else rest
+
+    if not any(p.startswith(text) for p in cached_texts):
+      held, self._held = self._held, ""
+      self._forwarding = True
+      self._forward(held)
+
+  def _play(self, text: str) -> bool:
+    pcm = self._tts._lookup(text)
+    if pcm is None:
+      # evicted from the disk tier by another process
+      self._tts._cached_texts.discard(text)
+      return False
+    self._sources.put_nowait(_CachedPhrase(text, pcm))
+    return True
+
+  def _forward(self, text: str) -> None:
+    if self._streamed is None:
+      if not text.strip():
+        return
+      self._streamed = _StreamedText()
+      self._sources.put_nowait(self._streamed)
+
+    start = len(self._sentence)
+    sentence = self._sentence + text
+    # the text so far has no sentence end, it would have been split at it
+    match = _SENTENCE_END.search(sentence)
+    if match is None:
+      self._sentence = sentence
+      self._stream.push_text(text)
+      return
+
+    self._sentence = sentence[: match.end()]
+    self._stream.push_text(sentence[start : match.end()])
+    self._end_sentence()
+    # the next sentence may be cached
+    self._held += sentence[match.end() :]
+    self._play_cached_phrases()
+
+  def _end_sentence(self) -> None:
+    self._streamed.text = cache.normalize_text(self._sentence)
+    self._stream.mark_segment_end()
+    self._streamed = None
+    self._sentence = ""
+    self._forwarding = False
+
+  def _end_segment(self) -> None:
+    if not self._in_segment:
+      return
+
+    # forwarding the held text can hold the sentences after it again
+    while text := cache.normalize_text(self._held):
+      self._held = ""
+      if not (text in self._tts._cached_texts and self._play(text)):
+        self._forwarding = True
+        self._forward(text)
+    self._held = ""
+
+    if self._streamed is not None:
+      self._end_sentence()
+    self._sources.put_nowait(_SegmentEnd())
+    self._in_segment = self._forwarding = False
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    self._closed = True
+    self._sources.put_nowait(None)
+    if not wait:
+      self._main_task.cancel()
+
+    await self._stream.aclose(wait=wait)
+    with contextlib.suppress(asyncio.CancelledError):
+      await self._main_task
+
+  async def _run(self) -> None:
+    # The sources of each segment in order. The wrapped stream's events of a
+    # segment are read once its cached phrases were played.
+    try:
+      while (source := await self._sources.get()) is not None:
+        if isinstance(source, _SegmentStart):
+          self._emit(tts.SynthesisEventType.STARTED)
+        elif isinstance(source, _SegmentEnd):
+          self._emit(tts.SynthesisEventType.FINISHED)
+        elif isinstance(source, _CachedPhrase):
+          tracing.mark(tracing.Stage.TTS_FIRST_BYTE)
+          for frame in cache.iter_frames(source.pcm, sample_rate=self._tts.sample_rate):
+            self._emit(
+              tts.SynthesisEventType.AUDIO, tts.SynthesizedAudio(source.text, frame)
+            )
+        elif not await self._forward_sentence(source):
+          break
+    except Exception:
+      logging.exception("cached tts stream failed")
+    finally:
+      self._event_queue.put_nowait(None)
+
+  async def _forward_sentence(self, source: _StreamedText) -> bool:
+    audio = bytearray()
+    async for event in self._stream:
+      if event.type == tts.SynthesisEventType.AUDIO:
+        if not audio:
+          tracing.mark(tracing.Stage.TTS_FIRST_BYTE)
+        self._event_queue.put_nowait(event)
+        audio += event.audio.data.data.cast("B")
+      elif event.type == tts.SynthesisEventType.FINISHED:
+        break
+    else:
+      # the wrapped stream closed, the audio may be incomplete
+      return False
+
+    await self._tts._store(source.text, bytes(audio))
+    return True
+
+  def _emit(
+    self, type: tts.SynthesisEventType, audio: tts.SynthesizedAudio | None = None
+  ) -> None:
+    self._event_queue.put_nowait(tts.SynthesisEvent(type=type, audio=audio))
+
+  async def __anext__(self) -> tts.SynthesisEvent:
+    event = await self._event_queue.get()
+    if event is None:
+      raise StopAsyncIteration
+    return event
+
+
+class CachedChunkedStream(tts.ChunkedStream):
+  def __init__(self, text: str, pcm: memoryview, sample_rate: int) -> None:
+    self._text = text
+    self._frames = cache.iter_frames(pcm, sample_rate=sample_rate)
+    self._started = False
+
+  async def __anext__(self) -> tts.SynthesizedAudio:
+    frame = next(self._frames, None)
+    if frame is None:
+      raise StopAsyncIteration
+
+    if not self._started:
+      self._started = True
+      tracing.mark(tracing.Stage.TTS_FIRST_BYTE)
+    return tts.SynthesizedAudio(text=self._text, data=frame)
+
+  async def aclose(self) -> None:
+    self._frames.close()
+
+
+class RecordingChunkedStream(tts.ChunkedStream):
+  """Passes a ChunkedStream through and stores its audio once it completes."""
+
+  def __init__(self, text: str, stream: tts.ChunkedStream, on_complete) -> None:
+    self._text = text
+    self._stream = stream
+    self._on_complete = on_complete
+    self._audio = bytearray()
+    self._closed = False
+
+  async def __anext__(self) -> tts.SynthesizedAudio:
+    try:
+      audio = await self._stream.__anext__()
+    except StopAsyncIteration:
+      if not self._closed:
+        await self._on_complete(bytes(self._audio))
+      self._closed = True
+      raise
+
+    if not self._audio:
+      tracing.mark(tracing.Stage.TTS_FIRST_BYTE)
+    self._audio += audio.data.data.cast("B")
+    return audio
+
+  async def aclose(self) -> None:
+    # closed early, the audio is incomplete and isn't stored
+    self._closed = True
+    await self._stream.aclose()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import collections
+import json
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Iterable
+
+from attrs import define
+from livekit.agents import llm
+
+__all__ = [
+  "Asset",
+  "AssetCatalog",
+  "AssetIndex",
+  "load_catalog",
+  "load_index",
+  "prewarm",
+]
+
+_BUNDLED_CATALOG_PATH = os.path.join(
+  os.path.dirname(__file__), "resources", "assets.json"
+)
+
+# words too common in titles and alt text to tell slides apart
+_STOPWORDS = frozenset(
+  "a an and are as at be by can for from how i in is it of on or our slide that the "
+  "their them they this to with you your".split()
+)
+
+_SUFFIXES = ("ations", "ation", "ities", "ity", "ing", "ies", "ed", "es", "s", "e")
+
+
+@define(frozen=True)
+class Asset:
+  id: str
+  title: str
+  url: str
+  alt: str
+  type: str
+
+
+class AssetCatalog:
+  def __init__(self, assets: Iterable[Asset]) -> None:
+    self._assets: dict[str, Asset] = {}
+    for asset in assets:
+      if asset.id in self._assets:
+        raise ValueError(f"duplicate asset id {asset.id}")
+      self._assets[asset.id] = asset
+
+  @property
+  def assets(self) -> list[Asset]:
+    return list(self._assets.values())
+
+  def get(self, asset_id: str) -> Asset:
+    asset = self._assets.get(asset_id)
+    if asset is None:
+      raise ValueError(f"unknown asset id {asset_id!r}")
+    return asset
+
+  def manifest(self) -> dict[str, Any]:
+    # published once per session so the frontend can prefetch every asset
+    return {
+      "assets": [
+        {"id": asset.id, "url": asset.url, "type": asset.type}
+        for asset in self._assets.values()
+      ]
+    }
+
+  def prompt_section(self, assets: Iterable[Asset] | None = None) -> str:
+    # URLs stay out of the prompt, the model only picks ids
+    return json.dumps(
+      {
+        "assets": [
+          {"id": asset.id, "title": asset.title, "alt": asset.alt, "type": asset.type}
+          for asset in (self._assets.values() if assets is None else assets)
+        ]
+      },
+      indent=2,
+    )
+
+
+class AssetIndex:
+  """BM25 index over asset titles and alt text.
+
+  Each turn only the assets relevant to the user's latest message are sent to
+  the model, so the prompt stays the same size however large the deck is.
+  """
+
+  def __init__(
+    self,
+    catalog: AssetCatalog,
+    *,
+    top_k: int = 5,
+    k1: float = 1.5,
+    b: float = 0.75,
+  ) -> None:
+    self._catalog = catalog
+    self._top_k = top_k
+    self._k1 = k1
+    self._b = b
+
+    self._assets = catalog.assets
+    # titles are counted twice, they describe the slide better than alt text
+    self._term_freqs = [
+      collections.Counter(_tokenize(f"{asset.title} {asset.title} {asset.alt}"))
+      for asset in self._assets
+    ]
+    self._doc_lens = [sum(tf.values()) for tf in self._term_freqs]
+    self._avg_doc_len = sum(self._doc_lens) / max(len(self._doc_lens), 1)
+
+    doc_freqs = collections.Counter(term for tf in self._term_freqs for term in tf)
+    n = len(self._assets)
+    self._idf = {
+      term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()
+    }
+
+  @property
+  def catalog(self) -> AssetCatalog:
+    return self._catalog
+
+  def search(self, query: str, k: int | None = None) -> list[Asset]:
+    k = self._top_k if k is None else k
+    terms = [t for t in set(_tokenize(query)) if t in self._idf]
+
+    scores: list[tuple[float, int]] = []
+    for i, tf in enumerate(self._term_freqs):
+      score = 0.0
+      norm = self._k1 * (1 - self._b + self._b * self._doc_lens[i] / self._avg_doc_len)
+      for term in terms:
+        freq = tf.get(term)
+        if freq:
+          score += self._idf[term] * freq * (self._k1 + 1) / (freq + norm)
+      if score > 0:
+        scores.append((score, i))
+
+    scores.sort(key=lambda s: (-s[0], s[1]))
+    selected = [i for _, i in scores[:k]]
+
+    # short answers ("yes", "sure") match nothing, fill up in deck order so
+    # the presentation can move on
+    for i in range(len(self._assets)):
+      if len(selected) >= k:
+        break
+      if i not in selected:
+        selected.append(i)
+
+    return [self._assets[i] for i in selected]
+
+  def turn_context(self, chat_ctx: llm.ChatContext) -> str | None:
+    if not chat_ctx.messages or chat_ctx.messages[-1].role != llm.ChatRole.USER:
+      return None
+
+    text = chat_ctx.messages[-1].text
+    if not isinstance(text, str):
+      text = " ".join(t for t in text if isinstance(t, str))
+    return "[Assets]\n" + self._catalog.prompt_section(self.search(text))
+
+
+def _tokenize(text: str) -> list[str]:
+  return [
+    _stem(t) for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS
+  ]
+
+
+def _stem(word: str) -> str:
+  # crude suffix stripping, enough for "secure"/"security" or "price"/"pricing"
+  for suffix in _SUFFIXES:
+    if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+      return word[: -len(suffix)]
+  return word
+
+
+_catalogs: dict[str, AssetCatalog] = {}
+_indexes: dict[str, AssetIndex] = {}
+_lock = threading.Lock()
+
+
+def _catalog_path(path: str | None) -> str:
+  if path is None:
+    path = os.environ.get("ASSET_CATALOG_PATH", _BUNDLED_CATALOG_PATH)
+  return path
+
+
+def load_catalog(path: str | None = None) -> AssetCatalog:
+  path = _catalog_path(path)
+  with _lock:
+    catalog = _catalogs.get(path)
+    if catalog is None:
+      with open(path) as f:
+        data = json.load(f)
+      catalog = AssetCatalog(Asset(**asset) for asset in data["assets"])
+      _catalogs[path] = catalog
+      logging.info(f"loaded {len(catalog.assets)} assets from {path}")
+
+  return catalog
+
+
+def load_index(path: str | None = None) -> AssetIndex:
+  path = _catalog_path(path)
+  catalog = load_catalog(path)
+  with _lock:
+    index = _indexes.get(path)
+    if index is None:
+      index = AssetIndex(catalog)
+      _indexes[path] = index
+
+  return index
+
+
+def prewarm(path: str | None = None) -> None:
+  load_index(path)
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import enum
+import json
+import logging
+from typing import Any
+
+from attrs import define
+
+__all__ = [
+  "InlineCall",
+  "InlineCallParser",
+]
+
+_MARKER = "functions."
+
+
+@define(frozen=True)
+class InlineCall:
+  name: str
+  arguments: dict[str, Any]
+  raw_arguments: str
+
+
+class _State(enum.Enum):
+  TEXT = enum.auto()
+  NAME = enum.auto()
+  ARGS_START = enum.auto()
+  ARGS = enum.auto()
+  CALL_END = enum.auto()
+
+
+class InlineCallParser:
+  """Splits streamed assistant text into speech and inline function calls.
+
+  The assistant sometimes writes `functions.send_asset({...})` in its answer
+  instead of calling the tool. Deltas can split that anywhere, so only the text
+  that may still turn out to be part of a call is held back, everything else is
+  returned right away.
+  """
+
+  def __init__(self) -> None:
+    self._state = _State.TEXT
+    self._pending = ""  # TEXT: tail of the last delta that could start a call
+    self._raw: list[str] = []  # text of the call so far, spoken if it isn't one
+    self._name: list[str] = []
+    self._args: list[str] = []
+    self._depth = 0
+    self._in_string = False
+    self._escaped = False
+
+  def feed(self, text: str) -> list[str | InlineCall]:
+    out: list[str | InlineCall] = []
+    i = 0
+    while i < len(text):
+      match self._state:
+        case _State.TEXT:
+          if self._pending:
+            # at most len(_MARKER) - 1 chars, only copied when a call may start
+            text, i, self._pending = self._pending + text[i:], 0, ""
+          i = self._feed_text(text, i, out)
+        case _State.NAME:
+          i = self._feed_name(text, i, out)
+        case _State.ARGS_START:
+          i = self._feed_args_start(text, i, out)
+        case _State.ARGS:
+          i = self._feed_args(text, i)
+        case _State.CALL_END:
+          i = self._feed_call_end(text, i, out)
+
+    return out
+
+  def flush(self) -> list[str | InlineCall]:
+    out: list[str | InlineCall] = []
+    match self._state:
+      case _State.TEXT:
+        if self._pending:
+          out.append(self._pending)
+      case _State.NAME | _State.ARGS_START:
+        out.append("".join(self._raw))
+      case _State.ARGS:
+        logging.warning(f"dropping unfinished inline call: {''.join(self._raw)}")
+      case _State.CALL_END:
+        self._emit_call(out)
+
+    self._reset()
+    return out
+
+  def _feed_text(self, text: str, i: int, out: list[str | InlineCall]) -> int:
+    start = text.find(_MARKER, i)
+    if start != -1:
+      if start > i:
+        out.append(text[i:start])
+      self._state = _State.NAME
+      self._raw = [_MARKER]
+      return start + len(_MARKER)
+
+    # hold back the longest suffix that is a prefix of the marker
+    end = len(text)
+    for n in range(min(len(_MARKER) - 1, end - i), 0, -1):
+      if text.endswith(_MARKER[:n]):
+        end -= n
+        break
+
+    if end > i:
+      out.append(text[i:end])
+    self._pending = text[end:]
+    return len(text)
+
+  def _feed_name(self, text: str, i: int, out: list[str | InlineCall]) -> int:
+    start = i
+    while i < len(text) and (text[i].isalnum() or text[i] == "_"):
+      i += 1
+    self._name.append(text[start:i])
+    self._raw.append(text[start:i])
+    if i == len(text):
+      return i
+
+    if text[i] == "(" and self._name_str():
+      self._raw.append("(")
+      self._state = _State.ARGS_START
+      return i + 1
+
+    # just the word "functions" followed by a period
+    self._fallback_to_text(out)
+    return i
+
+  def _feed_args_start(self, text: str, i: int, out: list[str | InlineCall]) -> int:
+    start = i
+    while i < len(text) and text[i].isspace():
+      i += 1
+    self._raw.append(text[start:i])
+    if i == len(text):
+      return i
+
+    if text[i] != "{":
+      self._fallback_to_text(out)
+      return i
+
+    self._state = _State.ARGS
+    self._depth = 0
+    return i
+
+  def _feed_args(self, text: str, i: int) -> int:
+    start = i
+    depth, in_string, escaped = self._depth, self._in_string, self._escaped
+    while i < len(text):
+      c = text[i]
+      i += 1
+      if in_string:
+        if escaped:
+          escaped = False
+        elif c == "\\":
+          escaped = True
+        elif c == '"':
+          in_string = False
+      elif c == '"':
+        in_string = True
+      elif c == "{":
+        depth += 1
+      elif c == "}":
+        depth -= 1
+        if depth == 0:
+          self._state = _State.CALL_END
+          break
+
+    self._depth, self._in_string, self._escaped = depth, in_string, escaped
+    self._args.append(text[start:i])
+    self._raw.append(text[start:i])
+    return i
+
+  def _feed_call_end(self, text: str, i: int, out: list[str | InlineCall]) -> int:
+    while i < len(text) and text[i].isspace():
+      i += 1
+    if i == len(text):
+      return i
+
+    if text[i] == ")":
+      i += 1
+    # a complete object without the closing parenthesis is still a call
+    self._emit_call(out)
+    self._reset()
+    return i
+
+  def _emit_call(self, out: list[str | InlineCall]) -> None:
+    raw_arguments = "".join(self._args)
+    try:
+      arguments = json.loads(raw_arguments)
+    except json.JSONDecodeError:
+      logging.warning(f"dropping inline call with invalid arguments: {raw_arguments}")
+      return
+
+    if not isinstance(arguments, dict):
+      logging.warning(f"dropping inline call with invalid arguments: {raw_arguments}")
+      return
+
+    out.append(
+      InlineCall(
+        name=self._name_str(), arguments=arguments, raw_arguments=raw_arguments
+      )
+    )
+
+  def _fallback_to_text(self, out: list[str | InlineCall]) -> None:
+    # not a call, speak the marker and parse what followed it as text again,
+    # e.g. "functions.functions.send_asset(" still contains a call
+    replay = "".join(self._raw)[len(_MARKER) :]
+    self._reset()
+    out.append(_MARKER)
+    out.extend(self.feed(replay))
+
+  def _name_str(self) -> str:
+    return "".join(self._name)
+
+  def _reset(self) -> None:
+    self._state = _State.TEXT
+    self._pending = ""
+    self._raw = []
+    self._name = []
+    self._args = []
+    self._depth = 0
+    self._in_string = False
+    self._escaped = False
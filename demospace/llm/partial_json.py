@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import enum
+import json
+from typing import Any
+
+__all__ = [
+  "PartialObjectParser",
+]
+
+
+class _State(enum.Enum):
+  OBJECT_START = enum.auto()
+  KEY_START = enum.auto()
+  KEY = enum.auto()
+  COLON = enum.auto()
+  VALUE_START = enum.auto()
+  VALUE = enum.auto()
+  SEPARATOR = enum.auto()
+  DONE = enum.auto()
+
+
+class PartialObjectParser:
+  """Parses a streamed JSON object and exposes each top-level member once its
+  value is complete.
+
+  Numbers, booleans and null only count as complete once the delimiter after
+  them is seen, "12" may still become "123".
+  """
+
+  def __init__(self) -> None:
+    self.values: dict[str, Any] = {}
+    self._state = _State.OBJECT_START
+    self._key: str | None = None
+    self._parts: list[str] = []  # text of the key or value being parsed
+    self._depth = 0
+    self._in_string = False
+    self._escaped = False
+
+  @property
+  def done(self) -> bool:
+    return self._state is _State.DONE
+
+  def feed(self, text: str) -> None:
+    i = 0
+    while i < len(text):
+      match self._state:
+        case _State.KEY | _State.VALUE:
+          i = self._feed_token(text, i)
+          continue
+        case _State.DONE:
+          return
+
+      c = text[i]
+      i += 1
+      if c.isspace():
+        continue
+
+      match self._state:
+        case _State.OBJECT_START:
+          self._expect(c, "{")
+          self._state = _State.KEY_START
+        case _State.KEY_START:
+          if c == "}":
+            self._state = _State.DONE
+          else:
+            self._expect(c, '"')
+            self._start_token(_State.KEY, c)
+        case _State.COLON:
+          self._expect(c, ":")
+          self._state = _State.VALUE_START
+        case _State.VALUE_START:
+          self._start_token(_State.VALUE, c)
+        case _State.SEPARATOR:
+          if c == ",":
+            self._state = _State.KEY_START
+          else:
+            self._expect(c, "}")
+            self._state = _State.DONE
+
+  def _start_token(self, state: _State, c: str) -> None:
+    self._state = state
+    self._parts = [c]
+    self._in_string = c == '"'
+    self._escaped = False
+    self._depth = 1 if c in "{[" else 0
+
+  def _feed_token(self, text: str, i: int) -> int:
+    start = i
+    depth, in_string, escaped = self._depth, self._in_string, self._escaped
+    scalar = not in_string and depth == 0  # number, true, false or null
+
+    while i < len(text):
+      c = text[i]
+      if scalar:
+        if c in ",}" or c.isspace():
+          self._parts.append(text[start:i])
+          self._end_token()
+          return i  # the delimiter is handled by the caller
+      elif in_string:
+        if escaped:
+          escaped = False
+        elif c == "\\":
+          escaped = True
+        elif c == '"':
+          in_string = False
+          if depth == 0:
+            self._parts.append(text[start : i + 1])
+            self._end_token()
+            return i + 1
+      elif c == '"':
+        in_string = True
+      elif c in "{[":
+        depth += 1
+      elif c in "}]":
+        depth -= 1
+        if depth == 0:
+          self._parts.append(text[start : i + 1])
+          self._end_token()
+          return i + 1
+      i += 1
+
+    self._parts.append(text[start:i])
+    self._depth, self._in_string, self._escaped = depth, in_string, escaped
+    return i
+
+  def _end_token(self) -> None:
+    token = json.loads("".join(self._parts))
+    self._parts = []
+    if self._state is _State.KEY:
+      self._key = token
+      self._state = _State.COLON
+    else:
+      self.values[self._key] = token
+      self._state = _State.SEPARATOR
+
+  def _expect(self, c: str, expected: str) -> None:
+    if c != expected:
+      raise ValueError(f"invalid JSON object, expected {expected!r} got {c!r}")
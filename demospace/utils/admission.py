@@ -0,0 +1,258 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import signal
+import time
+
+import psutil
+from attrs import define
+
+from demospace.utils import metrics, watchdog
+
+__all__ = [
+  "AdmissionController",
+  "AdmissionOptions",
+  "LoadSample",
+  "admission_options",
+  "controller",
+  "start",
+]
+
+# observed by the watchdog of every job
+_loop_lag = watchdog.lag_histogram()
+# the most loaded worker when the supervisor runs several
+_load = metrics.gauge(
+  "worker_load", "Load reported to LiveKit, full at 1.", aggregate="max"
+)
+_accepted = metrics.counter("jobs_accepted_total", "Job requests accepted.")
+_rejected = metrics.counter("jobs_rejected_total", "Job requests rejected.")
+
+# an accepted job gets its process once LiveKit assigns it, counted as a session
+# in the meantime
+_ASSIGNMENT_GRACE = 20.0
+# the machine's defaults, split between the workers of the supervisor
+_DEFAULT_MAX_SESSIONS = 8
+# share of the machine's memory the workers and their jobs may use
+_DEFAULT_RSS_RATIO = 0.8
+
+
+@define(frozen=True)
+class AdmissionOptions:
+  max_sessions: int
+  # p99 of the sessions' event loop lag over `lag_window` seconds
+  max_loop_lag: float
+  # system-wide, from 0 to 1
+  max_cpu: float
+  # worker and job processes together
+  max_rss_bytes: int
+  lag_window: float = 30.0
+
+
+def admission_options(
+  *,
+  max_sessions: int | None = None,
+  max_loop_lag: float | None = None,
+  max_cpu: float | None = None,
+  max_rss_bytes: int | None = None,
+  workers: int = 1,
+) -> AdmissionOptions:
+  """Limits of one worker. MAX_SESSIONS and MAX_RSS_MB are per worker, their
+  defaults are the machine's divided by `workers`."""
+  if max_sessions is None:
+    if "MAX_SESSIONS" in os.environ:
+      max_sessions = int(os.environ["MAX_SESSIONS"])
+    else:
+      max_sessions = max(_DEFAULT_MAX_SESSIONS // workers, 1)
+  if max_loop_lag is None:
+    max_loop_lag = float(os.environ.get("MAX_LOOP_LAG_MS", "100")) / 1000
+  if max_cpu is None:
+    max_cpu = float(os.environ.get("MAX_CPU_PERCENT", "80")) / 100
+  if max_rss_bytes is None:
+    if "MAX_RSS_MB" in os.environ:
+      max_rss_bytes = int(os.environ["MAX_RSS_MB"]) * 1024 * 1024
+    else:
+      max_rss_bytes = int(psutil.virtual_memory().total * _DEFAULT_RSS_RATIO / workers)
+
+  return AdmissionOptions(
+    max_sessions=max_sessions,
+    max_loop_lag=max_loop_lag,
+    max_cpu=max_cpu,
+    max_rss_bytes=max_rss_bytes,
+  )
+
+
+@define(kw_only=True)
+class LoadSample:
+  sessions: int
+  loop_lag: float
+  cpu: float
+  rss_bytes: int
+
+
+class AdmissionController:
+  """Decides whether the worker takes another session.
+
+  Lives in the worker process. Sessions run in its child processes, which report
+  their event loop lag through a shared histogram (see watchdog.LoopWatchdog).
+  CPU and lag are refreshed by load(), which the worker calls every few seconds
+  to report its status to LiveKit.
+  """
+
+  def __init__(self, opts: AdmissionOptions) -> None:
+    self._opts = opts
+    self._process = psutil.Process()
+    self._admitted: collections.deque[float] = collections.deque()
+    self._lag_snapshots = collections.deque([(time.monotonic(), _loop_lag.counts())])
+    self._loop_lag = 0.0
+    self._cpu = psutil.cpu_percent() / 100
+    self._draining = False
+
+  @property
+  def draining(self) -> bool:
+    return self._draining
+
+  def drain(self) -> None:
+    if self._draining:
+      return
+    logging.info("draining, rejecting new jobs")
+    self._draining = True
+    _load.set(1.0)
+
+  def drain_on_sigterm(self) -> None:
+    """Stops taking jobs on SIGTERM, must be called on the worker's event loop.
+
+    The CLI registers its own handler, which only ends the worker's run loop.
+    This one replaces it and ends the run loop the same way, the CLI then waits
+    up to `start --drain-timeout` seconds for the running sessions.
+    """
+
+    def _on_sigterm() -> None:
+      self.drain()
+      raise KeyboardInterrupt
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, _on_sigterm)
+
+  def sample(self) -> LoadSample:
+    sessions, rss_bytes = self._children()
+    return LoadSample(
+      sessions=sessions, loop_lag=self._loop_lag, cpu=self._cpu, rss_bytes=rss_bytes
+    )
+
+  def load(self) -> float:
+    """Load from 0 to 1, the highest of the sampled values relative to its limit."""
+    self._cpu = psutil.cpu_percent() / 100
+    self._loop_lag = self._lag_p99()
+
+    if self._draining:
+      load = 1.0
+    else:
+      load = min(max(self._ratios(self.sample()).values()), 1.0)
+    _load.set(load)
+    return load
+
+  def admit(self) -> str | None:
+    """Returns None if the worker takes another session, otherwise why not."""
+    if self._draining:
+      reason = "draining"
+    else:
+      sample = self.sample()
+      full = [name for name, ratio in self._ratios(sample).items() if ratio >= 1.0]
+      reason = ", ".join(f"{name} {_describe(name, sample)}" for name in full) or None
+
+    if reason is not None:
+      _rejected.inc()
+      return reason
+
+    self._admitted.append(time.time())
+    _accepted.inc()
+    return None
+
+  def _ratios(self, sample: LoadSample) -> dict[str, float]:
+    opts = self._opts
+    return {
+      "sessions": sample.sessions / opts.max_sessions,
+      "loop_lag": sample.loop_lag / opts.max_loop_lag,
+      "cpu": sample.cpu / opts.max_cpu,
+      "rss": sample.rss_bytes / opts.max_rss_bytes,
+    }
+
+  def _children(self) -> tuple[int, int]:
+    # The pages a job shares with the worker after the fork are in the RSS of
+    # both, only the memory unique to a job (USS) is added to the worker's RSS.
+    now = time.time()
+    while self._admitted and self._admitted[0] < now - _ASSIGNMENT_GRACE:
+      self._admitted.popleft()
+
+    sessions = recent = 0
+    rss_bytes = self._process.memory_info().rss
+    for child in self._process.children():
+      with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+        if child.status() == psutil.STATUS_ZOMBIE:
+          continue
+        sessions += 1
+        recent += child.create_time() >= now - _ASSIGNMENT_GRACE
+        rss_bytes += child.memory_full_info().uss
+
+    # accepted jobs whose process hasn't started yet
+    return sessions + max(len(self._admitted) - recent, 0), rss_bytes
+
+  def _lag_p99(self) -> float:
+    now = time.monotonic()
+    snapshots = self._lag_snapshots
+    snapshots.append((now, _loop_lag.counts()))
+    while len(snapshots) > 2 and snapshots[1][0] <= now - self._opts.lag_window:
+      snapshots.popleft()
+
+    counts = [new - old for new, old in zip(snapshots[-1][1], snapshots[0][1])]
+    total = sum(counts)
+    if total == 0:
+      return 0.0
+
+    # upper bound of the bucket holding the 99th percentile
+    cumulative = 0.0
+    for le, count in zip([*_loop_lag.buckets, float("inf")], counts):
+      cumulative += count
+      if cumulative >= 0.99 * total:
+        return le
+    return float("inf")
+
+
+def _describe(name: str, sample: LoadSample) -> str:
+  if name == "sessions":
+    return str(sample.sessions)
+  if name == "loop_lag":
+    return f"{sample.loop_lag * 1000:.0f}ms"
+  if name == "cpu":
+    return f"{sample.cpu:.0%}"
+  return f"{sample.rss_bytes / 2**20:.0f}MB"
+
+
+_controller: AdmissionController | None = None
+
+
+def controller() -> AdmissionController:
+  global _controller
+  if _controller is None:
+    _controller = AdmissionController(admission_options())
+  return _controller
+
+
+def start(opts: AdmissionOptions | None = None) -> AdmissionController:
+  """Creates the worker's controller, called before the CLI runs the worker on
+  the current event loop.
+
+  SIGTERM drains from the moment the loop runs, a worker stopped before its
+  first job request drains too.
+  """
+  global _controller
+  _controller = AdmissionController(opts or admission_options())
+  # runs once the CLI registered its own handler, and replaces it
+  asyncio.get_event_loop().call_soon(_install_drain_on_sigterm, _controller)
+  return _controller
+
+
+def _install_drain_on_sigterm(controller: AdmissionController) -> None:
+  with contextlib.suppress(NotImplementedError):
+    controller.drain_on_sigterm()
@@ -0,0 +1,288 @@
+import bisect
+import http.server
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Sequence
+
+__all__ = [
+  "Counter",
+  "Gauge",
+  "Histogram",
+  "counter",
+  "gauge",
+  "histogram",
+  "render",
+  "serve",
+]
+
+# Values live in shared memory. Job processes are forked from the worker, and
+# workers from the supervisor, so metrics registered at import time, before the
+# first fork, are aggregated across every session of the machine.
+#
+# Every process writes to a slot of its own and readers add the slots up, so
+# there's no lock shared between processes. A job killed in the middle of an
+# update can't block the worker, the metrics server or the next job.
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+# processes alive at the same time, the slots of exited ones are reused
+_MAX_PROCESSES = 256
+# shared by the processes that found no free slot, their updates may race
+_OVERFLOW_SLOT = 0
+
+# pid owning each slot, 0 if free
+_slot_owners = multiprocessing.RawArray("i", _MAX_PROCESSES)
+# only taken to claim a slot, once per process
+_claim_lock = multiprocessing.Lock()
+_CLAIM_TIMEOUT = 1.0
+_slot = _OVERFLOW_SLOT
+_slot_pid = 0
+# serializes the updates of the threads of a process
+_write_lock = threading.Lock()
+
+
+def _current_slot() -> int:
+  global _slot, _slot_pid
+  pid = os.getpid()
+  if _slot_pid != pid:
+    _slot = _claim_slot(pid)
+    _slot_pid = pid
+  return _slot
+
+
+def _claim_slot(pid: int) -> int:
+  if not _claim_lock.acquire(timeout=_CLAIM_TIMEOUT):
+    logging.warning("timed out claiming a metrics slot, sharing the overflow slot")
+    return _OVERFLOW_SLOT
+  try:
+    free = next((i for i in range(1, _MAX_PROCESSES) if _slot_owners[i] == 0), None)
+    if free is None:
+      free = next(
+        (i for i in range(1, _MAX_PROCESSES) if not _alive(_slot_owners[i])), None
+      )
+    if free is None:
+      logging.warning("no free metrics slot, sharing the overflow slot")
+      return _OVERFLOW_SLOT
+    _slot_owners[free] = pid
+  finally:
+    _claim_lock.release()
+
+  # counters and histograms keep the counts of the previous owner, gauges
+  # only hold the values of live processes
+  with _registry_lock:
+    metrics = list(_registry.values())
+  for metric in metrics:
+    if isinstance(metric, Gauge):
+      metric._values[free] = 0.0
+  return free
+
+
+def _alive(pid: int) -> bool:
+  if pid == 0:
+    return False
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def _reset_after_fork() -> None:
+  global _write_lock
+  # another thread of the parent may have held it during the fork
+  _write_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Counter:
+  def __init__(self, name: str, description: str) -> None:
+    self.name = name
+    self.description = description
+    self._values = multiprocessing.RawArray("d", _MAX_PROCESSES)
+
+  def inc(self, amount: float = 1.0) -> None:
+    slot = _current_slot()
+    with _write_lock:
+      self._values[slot] += amount
+
+  @property
+  def value(self) -> float:
+    return sum(self._values)
+
+  def _render(self) -> list[str]:
+    return [f"{self.name} {_format(self.value)}"]
+
+
+class Gauge:
+  """A value per process, reported as their sum or maximum over the live ones."""
+
+  def __init__(self, name: str, description: str, aggregate: str = "sum") -> None:
+    if aggregate not in ("sum", "max"):
+      raise ValueError(f"expected aggregate sum or max, got {aggregate}")
+    self.name = name
+    self.description = description
+    self.aggregate = aggregate
+    self._values = multiprocessing.RawArray("d", _MAX_PROCESSES)
+
+  def set(self, value: float) -> None:
+    self._values[_current_slot()] = value
+
+  def inc(self, amount: float = 1.0) -> None:
+    slot = _current_slot()
+    with _write_lock:
+      self._values[slot] += amount
+
+  def dec(self, amount: float = 1.0) -> None:
+    self.inc(-amount)
+
+  @property
+  def value(self) -> float:
+    values = [
+      value
+      for slot, value in enumerate(self._values)
+      if slot == _OVERFLOW_SLOT or _alive(_slot_owners[slot])
+    ]
+    if self.aggregate == "max":
+      return max(values)
+    return sum(values)
+
+  def _render(self) -> list[str]:
+    return [f"{self.name} {_format(self.value)}"]
+
+
+class Histogram:
+  def __init__(
+    self,
+    name: str,
+    description: str,
+    buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+  ) -> None:
+    self.name = name
+    self.description = description
+    self.buckets = tuple(sorted(buckets))
+    # per slot, one count per bucket plus +Inf, not cumulative, then the sum
+    self._width = len(self.buckets) + 2
+    self._values = multiprocessing.RawArray("d", _MAX_PROCESSES * self._width)
+
+  def observe(self, value: float) -> None:
+    offset = _current_slot() * self._width
+    i = bisect.bisect_left(self.buckets, value)
+    with _write_lock:
+      self._values[offset + i] += 1
+      self._values[offset + self._width - 1] += value
+
+  @property
+  def count(self) -> int:
+    return int(sum(self.counts()))
+
+  @property
+  def sum(self) -> float:
+    return self._totals()[-1]
+
+  def counts(self) -> list[float]:
+    """Observations per bucket, the last one above the largest bucket."""
+    return self._totals()[:-1]
+
+  def _totals(self) -> list[float]:
+    width = self._width
+    values = self._values[:]
+    return [sum(values[i::width]) for i in range(width)]
+
+  def _render(self) -> list[str]:
+    *counts, total = self._totals()
+
+    lines = []
+    cumulative = 0.0
+    for le, count in zip([*map(_format, self.buckets), "+Inf"], counts):
+      cumulative += count
+      lines.append(f'{self.name}_bucket{{le="{le}"}} {_format(cumulative)}')
+    lines.append(f"{self.name}_sum {_format(total)}")
+    lines.append(f"{self.name}_count {_format(cumulative)}")
+    return lines
+
+
+_registry: dict[str, Counter | Gauge | Histogram] = {}
+_registry_lock = threading.Lock()
+# forking while the metrics thread renders would leave the lock held in the child
+os.register_at_fork(
+  before=_registry_lock.acquire,
+  after_in_parent=_registry_lock.release,
+  after_in_child=_registry_lock.release,
+)
+
+
+def _get_or_create(cls: type, name: str, description: str, **kwargs):
+  with _registry_lock:
+    metric = _registry.get(name)
+    if metric is None:
+      metric = cls(name, description, **kwargs)
+      _registry[name] = metric
+    elif not isinstance(metric, cls):
+      raise ValueError(f"metric {name} already registered as {type(metric).__name__}")
+    return metric
+
+
+def counter(name: str, description: str) -> Counter:
+  return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str, aggregate: str = "sum") -> Gauge:
+  return _get_or_create(Gauge, name, description, aggregate=aggregate)
+
+
+def histogram(
+  name: str, description: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+) -> Histogram:
+  return _get_or_create(Histogram, name, description, buckets=buckets)
+
+
+_TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+
+def render() -> str:
+  """Renders every registered metric in the Prometheus text format."""
+  with _registry_lock:
+    metrics = list(_registry.values())
+
+  lines = []
+  for metric in sorted(metrics, key=lambda m: m.name):
+    lines.append(f"# HELP {metric.name} {metric.description}")
+    lines.append(f"# TYPE {metric.name} {_TYPES[type(metric)]}")
+    lines.extend(metric._render())
+  return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+  def do_GET(self) -> None:
+    if self.path not in ("/", "/metrics"):
+      self.send_error(404)
+      return
+
+    body = render().encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format: str, *args) -> None:
+    pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+  """Serves render() on /metrics from a background thread."""
+  server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+  logging.info(f"serving metrics on http://{host}:{port}/metrics")
+  return server
+
+
+def _format(value: float) -> str:
+  return str(int(value)) if value.is_integer() else repr(value)
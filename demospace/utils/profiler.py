@@ -0,0 +1,117 @@
+import collections
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+__all__ = [
+  "SamplingProfiler",
+]
+
+_DEFAULT_PROFILE_DIR = os.path.join(tempfile.gettempdir(), "demospace_profiles")
+
+
+class SamplingProfiler:
+  """Samples the stack of a thread from another thread while it's started.
+
+  Stops write the samples in the collapsed format of flamegraph.pl, one
+  `frame;frame;frame count` line per stack, which speedscope also opens.
+  Nothing runs while it's stopped.
+  """
+
+  def __init__(
+    self,
+    name: str,
+    *,
+    thread_id: int | None = None,
+    interval: float = 0.005,
+    directory: str | None = None,
+  ) -> None:
+    # room names end up in the file name
+    self._name = name.replace(os.sep, "_")
+    self._thread_id = thread_id if thread_id is not None else threading.get_ident()
+    self._interval = interval
+    self._directory = directory or os.environ.get("PROFILE_DIR", _DEFAULT_PROFILE_DIR)
+    self._labels: dict[types.CodeType, str] = {}
+    self._samples: collections.Counter[str] = collections.Counter()
+    self._stop: threading.Event | None = None
+    self._thread: threading.Thread | None = None
+    self._started_at = 0.0
+
+  @property
+  def running(self) -> bool:
+    return self._thread is not None
+
+  def start(self) -> None:
+    if self._thread is not None:
+      return
+    logging.info(f"profiling {self._name}")
+    self._samples.clear()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(
+      target=self._sample, args=(self._stop,), name="profiler", daemon=True
+    )
+    self._started_at = time.time()
+    self._thread.start()
+
+  def stop(self) -> str | None:
+    """Stops sampling and returns the path of the written profile."""
+    if self._thread is None:
+      return None
+    self._stop.set()
+    self._thread.join()
+    self._thread = None
+    return self._write()
+
+  def toggle(self) -> None:
+    if self.running:
+      self.stop()
+    else:
+      self.start()
+
+  def _sample(self, stop: threading.Event) -> None:
+    samples = self._samples
+    while not stop.wait(self._interval):
+      frame = sys._current_frames().get(self._thread_id)
+      if frame is not None:
+        samples[self._fold(frame)] += 1
+
+  def _fold(self, frame: types.FrameType) -> str:
+    labels = self._labels
+    stack = []
+    while frame is not None:
+      code = frame.f_code
+      label = labels.get(code)
+      if label is None:
+        filename = os.path.basename(code.co_filename)
+        # ";" separates frames in the collapsed format
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        labels[code] = label
+      stack.append(label)
+      frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+  def _write(self) -> str | None:
+    duration = time.time() - self._started_at
+    path = os.path.join(
+      self._directory,
+      f"profile-{self._name}-{os.getpid()}-{int(self._started_at)}.folded",
+    )
+    try:
+      os.makedirs(self._directory, exist_ok=True)
+      with open(path, "w") as f:
+        for stack, count in self._samples.most_common():
+          f.write(f"{stack} {count}\n")
+    except OSError as e:
+      logging.warning(f"failed to write profile {path}: {e}")
+      return None
+
+    logging.info(
+      f"wrote profile of {self._name} to {path}, "
+      f"{sum(self._samples.values())} samples over {duration:.1f}s"
+    )
+    return path
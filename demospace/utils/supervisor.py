@@ -0,0 +1,208 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable
+
+import psutil
+from attrs import define
+
+from demospace.utils import metrics
+
+__all__ = [
+  "Supervisor",
+  "SupervisorOptions",
+  "supervisor_options",
+]
+
+_restarts = metrics.counter(
+  "worker_restarts_total", "Worker processes restarted after exiting."
+)
+_recycled = metrics.counter(
+  "worker_recycled_total", "Worker processes replaced for using too much memory."
+)
+
+# a worker exiting sooner than this after its start is restarted with a backoff
+_MIN_UPTIME = 30.0
+_MAX_BACKOFF = 60.0
+
+
+@define(frozen=True)
+class SupervisorOptions:
+  processes: int
+  # memory unique to a worker process (USS), a worker above it is drained and
+  # replaced. Pages shared with the supervisor aren't counted. 0 disables it.
+  max_memory_bytes: int
+  # how long a drained or stopped worker gets to exit before it's killed, a bit
+  # more than the `start --drain-timeout` of the workers
+  stop_timeout: float
+  check_interval: float = 5.0
+
+
+def supervisor_options(
+  *,
+  processes: int | None = None,
+  max_memory_bytes: int | None = None,
+  stop_timeout: float | None = None,
+) -> SupervisorOptions:
+  if processes is None:
+    processes = int(os.environ.get("WORKER_PROCESSES", "1"))
+  if max_memory_bytes is None:
+    max_memory_bytes = int(os.environ.get("WORKER_MAX_MEMORY_MB", "1024")) * 1024 * 1024
+  if stop_timeout is None:
+    stop_timeout = float(os.environ.get("WORKER_STOP_TIMEOUT", "345"))
+
+  if processes < 1:
+    raise ValueError(f"expected at least one worker process, got {processes}")
+
+  return SupervisorOptions(
+    processes=processes,
+    max_memory_bytes=max_memory_bytes,
+    stop_timeout=stop_timeout,
+  )
+
+
+class _Worker:
+  def __init__(self, process: multiprocessing.Process, slot: int) -> None:
+    self.process = process
+    self.slot = slot
+    self.started_at = time.monotonic()
+    self.stopping_at: float | None = None
+
+
+class Supervisor:
+  """Runs `target(slot)` in forked worker processes and keeps them running.
+
+  Everything loaded before run() is inherited copy-on-write by the workers. A
+  worker that exits is restarted, with a backoff if it keeps exiting right
+  after its start. A worker using more than its memory budget gets a SIGTERM
+  to drain its sessions while its replacement already takes new ones.
+
+  Slots number the workers from 0 and are reused by the replacements, a
+  retiring worker and its replacement never share one.
+
+  It doesn't make jobs start sooner. Each worker still forks a process per
+  job when LiveKit assigns it, which already inherits what was loaded before
+  the fork, with or without the supervisor. What it adds is more workers
+  sharing those pages, restarts, and recycling on unique memory (USS).
+  """
+
+  def __init__(self, target: Callable[[int], None], opts: SupervisorOptions) -> None:
+    self._target = target
+    self._opts = opts
+    self._ctx = multiprocessing.get_context("fork")
+    self._workers: list[_Worker] = []
+    self._backoff: dict[int, float] = {}
+    self._restart_at: dict[int, float] = {}
+    self._stop = threading.Event()
+
+  def run(self) -> int:
+    for sig in (signal.SIGTERM, signal.SIGINT):
+      signal.signal(sig, self._on_signal)
+
+    for slot in range(self._opts.processes):
+      self._start(slot)
+
+    while not self._stop.wait(self._opts.check_interval):
+      self._check()
+
+    self._shutdown()
+    return 0
+
+  def _on_signal(self, signum: int, frame) -> None:
+    logging.info(f"received {signal.Signals(signum).name}, stopping the workers")
+    self._stop.set()
+
+  def _start(self, slot: int) -> None:
+    process = self._ctx.Process(
+      target=self._run_worker, args=(slot,), name=f"worker-{slot}", daemon=False
+    )
+    process.start()
+    self._workers.append(_Worker(process, slot))
+    logging.info(f"started worker {slot} (pid {process.pid})")
+
+  def _run_worker(self, slot: int) -> None:
+    # the supervisor forwards signals, a Ctrl-C on the terminal reaches it only
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # the worker sets up its own logging
+    logging.getLogger().handlers.clear()
+    self._target(slot)
+
+  def _check(self) -> None:
+    now = time.monotonic()
+    for worker in list(self._workers):
+      process = worker.process
+      if not process.is_alive():
+        process.join()
+        self._workers.remove(worker)
+        if worker.stopping_at is None:
+          self._schedule_restart(worker, now)
+        continue
+
+      if worker.stopping_at is not None:
+        if now - worker.stopping_at > self._opts.stop_timeout:
+          logging.warning(f"worker {worker.slot} didn't drain in time, killing it")
+          process.kill()
+        continue
+
+      memory = _unique_memory(process.pid)
+      if self._opts.max_memory_bytes and memory > self._opts.max_memory_bytes:
+        logging.warning(
+          f"worker {worker.slot} uses {memory / 2**20:.0f}MB, draining and replacing it"
+        )
+        _recycled.inc()
+        self._retire(worker, now)
+        self._start(self._free_slot())
+
+    for slot, restart_at in list(self._restart_at.items()):
+      if now >= restart_at:
+        del self._restart_at[slot]
+        _restarts.inc()
+        self._start(slot)
+
+  def _schedule_restart(self, worker: _Worker, now: float) -> None:
+    uptime = now - worker.started_at
+    if uptime < _MIN_UPTIME:
+      backoff = min(self._backoff.get(worker.slot, 0.5) * 2, _MAX_BACKOFF)
+    else:
+      backoff = 0.0
+    self._backoff[worker.slot] = backoff or 0.5
+    logging.warning(
+      f"worker {worker.slot} exited with code {worker.process.exitcode} after "
+      f"{uptime:.0f}s, restarting in {backoff:.0f}s"
+    )
+    self._restart_at[worker.slot] = now + backoff
+
+  def _retire(self, worker: _Worker, now: float) -> None:
+    worker.stopping_at = now
+    os.kill(worker.process.pid, signal.SIGTERM)
+
+  def _free_slot(self) -> int:
+    used = {w.slot for w in self._workers} | set(self._restart_at)
+    return next(slot for slot in range(len(used) + 1) if slot not in used)
+
+  def _shutdown(self) -> None:
+    self._restart_at.clear()
+    now = time.monotonic()
+    for worker in self._workers:
+      if worker.stopping_at is None and worker.process.is_alive():
+        self._retire(worker, now)
+
+    deadline = now + self._opts.stop_timeout
+    for worker in self._workers:
+      worker.process.join(max(deadline - time.monotonic(), 0.0))
+      if worker.process.is_alive():
+        logging.warning(f"worker {worker.slot} didn't stop in time, killing it")
+        worker.process.kill()
+        worker.process.join()
+
+
+def _unique_memory(pid: int) -> int:
+  try:
+    return psutil.Process(pid).memory_full_info().uss
+  except (psutil.NoSuchProcess, psutil.AccessDenied):
+    return 0
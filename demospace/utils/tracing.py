@@ -0,0 +1,104 @@
+import enum
+import json
+import logging
+import time
+
+from demospace.utils import metrics
+
+__all__ = [
+  "Stage",
+  "TurnTracer",
+  "mark",
+  "tracer",
+]
+
+
+class Stage(str, enum.Enum):
+  START_OF_SPEECH = "start_of_speech"
+  END_OF_SPEECH = "end_of_speech"
+  STT_FINAL = "stt_final"
+  LLM_REQUEST = "llm_request"
+  LLM_FIRST_TOKEN = "llm_first_token"
+  TOOL_START = "tool_start"
+  TOOL_END = "tool_end"
+  TTS_FIRST_BYTE = "tts_first_byte"
+  AUDIO_FIRST_FRAME = "audio_first_frame"
+
+
+# time from the end of the user's speech to each stage, registered at import so
+# they are shared by every job of the worker
+_stage_seconds = {
+  stage: metrics.histogram(
+    f"turn_{stage.value}_seconds",
+    f"Time from the end of the user's speech to {stage.value.replace('_', ' ')}.",
+  )
+  for stage in Stage
+  if stage not in (Stage.START_OF_SPEECH, Stage.END_OF_SPEECH)
+}
+_tool_seconds = metrics.histogram(
+  "turn_tool_seconds",
+  "Time from the first tool call to the last tool result of a turn.",
+)
+_turns = metrics.counter("turns_total", "Turns answered with audio.")
+
+_LAST_OCCURRENCE = frozenset((Stage.END_OF_SPEECH, Stage.TOOL_END))
+
+
+class TurnTracer:
+  """Stamps the stages of each turn, from the user's speech to the first audio
+  frame of the answer.
+
+  A turn opens when the user starts speaking and closes when the answer starts
+  playing. Stages are timestamped the first time they're reached (the last time
+  for the end of speech and tool results) and ignored while no turn is open, so
+  marking is a dict lookup on the hot paths.
+  """
+
+  def __init__(self) -> None:
+    self._turn = 0
+    self._marks: dict[Stage, float] | None = None
+
+  def start_turn(self) -> None:
+    # speech resuming before the answer played restarts the open turn
+    if self._marks is None:
+      self._turn += 1
+    self._marks = {Stage.START_OF_SPEECH: time.perf_counter()}
+
+  def mark(self, stage: Stage) -> None:
+    marks = self._marks
+    if marks is None:
+      return
+    if stage not in marks or stage in _LAST_OCCURRENCE:
+      marks[stage] = time.perf_counter()
+
+  def end_turn(self) -> None:
+    marks, self._marks = self._marks, None
+    if marks is None or Stage.END_OF_SPEECH not in marks:
+      return
+
+    end_of_speech = marks[Stage.END_OF_SPEECH]
+    record = {"turn": self._turn}
+    for stage, t in marks.items():
+      # the transcript and a speculative request often come before the VAD
+      # sees the end of speech
+      record[stage.value] = round(t - end_of_speech, 4)
+      histogram = _stage_seconds.get(stage)
+      if histogram is not None:
+        histogram.observe(max(t - end_of_speech, 0.0))
+
+    if Stage.TOOL_START in marks and Stage.TOOL_END in marks:
+      _tool_seconds.observe(marks[Stage.TOOL_END] - marks[Stage.TOOL_START])
+    _turns.inc()
+    logging.info(f"turn trace {json.dumps(record)}")
+
+
+_tracer = TurnTracer()
+
+
+def tracer() -> TurnTracer:
+  # one session per job process
+  return _tracer
+
+
+def mark(stage: Stage) -> None:
+  _tracer.mark(stage)
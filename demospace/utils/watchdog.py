@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from attrs import define
+
+from demospace.utils import metrics
+
+__all__ = [
+  "LoopWatchdog",
+  "WatchdogOptions",
+  "lag_histogram",
+]
+
+# Observed by the job processes, read by the admission controller of the worker.
+# Registered at import so the jobs forked from the worker share it.
+_loop_lag = metrics.histogram(
+  "event_loop_lag_seconds",
+  "Delay of a timer on the event loop of a session.",
+  buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+_stalls = metrics.counter(
+  "event_loop_stalls_total", "Callbacks that blocked an event loop past the threshold."
+)
+
+
+def lag_histogram() -> metrics.Histogram:
+  return _loop_lag
+
+
+@define(kw_only=True)
+class WatchdogOptions:
+  interval: float = 0.1
+  # a callback blocking the loop longer than this gets its stack logged
+  stall_threshold: float = 0.25
+
+
+class LoopWatchdog:
+  """Measures the lag of an event loop and logs what blocks it.
+
+  A task on the loop wakes every `interval` and observes how late it woke up. A
+  thread checks on the task as often. Once the task is late by more than the
+  stall threshold, the thread logs the stack of the loop's thread, which is the
+  callback blocking it. Nothing else runs until a stall, so it stays on in
+  production.
+  """
+
+  def __init__(self, opts: WatchdogOptions | None = None) -> None:
+    self._opts = opts or WatchdogOptions()
+    self._beat = 0.0
+    self._reported_beat = 0.0
+    self._loop_thread_id = 0
+    self._task: asyncio.Task | None = None
+    self._stop = threading.Event()
+
+  def start(self) -> None:
+    """Watches the running loop, must be called on it."""
+    self._loop_thread_id = threading.get_ident()
+    self._beat = time.perf_counter()
+    self._task = asyncio.create_task(self._heartbeat())
+    threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+  def stop(self) -> None:
+    self._stop.set()
+    if self._task is not None:
+      self._task.cancel()
+
+  async def _heartbeat(self) -> None:
+    interval = self._opts.interval
+    while True:
+      await asyncio.sleep(interval)
+      now = time.perf_counter()
+      _loop_lag.observe(max(now - self._beat - interval, 0.0))
+      self._beat = now
+
+  def _watch(self) -> None:
+    interval = self._opts.interval
+    while not self._stop.wait(interval):
+      beat = self._beat
+      blocked = time.perf_counter() - beat - interval
+      if blocked < self._opts.stall_threshold or beat == self._reported_beat:
+        continue
+
+      # once per stall
+      self._reported_beat = beat
+      _stalls.inc()
+      frame = sys._current_frames().get(self._loop_thread_id)
+      stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+      logging.warning(f"event loop blocked for {blocked * 1000:.0f}ms in:\n{stack}")
@@ -1,22 +1,116 @@
 import asyncio
+import functools
+import gc
 import logging
+import os
+import signal
+import sys
 
+import aiohttp
+import anthropic
 from dotenv import load_dotenv
+from livekit import agents, rtc
 from livekit.agents import JobContext, JobRequest, WorkerOptions, cli, llm
+from livekit.agents.cli.log import setup_logging
 from livekit.agents.voice_assistant import VoiceAssistant
 from livekit.plugins import deepgram, elevenlabs
 
 from demospace.functions import functions
-from demospace.livekit import claude, silero
-from demospace.llm import prompts
+from demospace.livekit import claude, silero, tts_cache
+from demospace.llm import assets, prompts
+from demospace.utils import admission, metrics, profiler, supervisor, tracing, watchdog
 from demospace.utils.env import is_prod
 
 if is_prod():
   load_dotenv(".env.local")
 
+TTS_MODEL = "eleven_turbo_v2"
+# the greeting is said without an audio track after this long
+AUDIO_TRACK_TIMEOUT = 5.0
+
+# Fire-and-forget tasks of the job, referenced until they're done so they
+# aren't collected mid-flight.
+_background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro, name: str) -> None:
+  task = asyncio.create_task(coro, name=name)
+  _background_tasks.add(task)
+  task.add_done_callback(_on_background_task_done)
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+  _background_tasks.discard(task)
+  if not task.cancelled() and task.exception() is not None:
+    logging.warning(f"{task.get_name()} failed: {task.exception()!r}")
+
 
 # This function is the entrypoint for the agent.
 async def entrypoint(ctx: JobContext):
+  # Open the Anthropic connections while the room is set up, so the first
+  # model call of the session doesn't pay for the TLS handshake.
+  run_in_background(claude.prewarm(), "anthropic prewarm")
+  # Loop lag is read by the admission controller of the worker, callbacks
+  # blocking the loop are logged with their stack.
+  watchdog.LoopWatchdog().start()
+  start_profiler_controls(ctx.room)
+
+  await run_session(ctx.room, stt=deepgram.STT(), tts=build_tts())
+
+
+def start_profiler_controls(room: rtc.Room) -> None:
+  # `kill -USR2 <job pid>`, or a "profile" message on the "debug" topic sent
+  # with the server API, starts profiling this job. The same again stops it and
+  # writes the profile to PROFILE_DIR.
+  job_profiler = profiler.SamplingProfiler(room.name)
+  asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, job_profiler.toggle)
+
+  @room.on("data_received")
+  def _data_received(packet: rtc.DataPacket):
+    # participants can't send as the server
+    from_server = packet.participant is None
+    if from_server and packet.topic == "debug" and packet.data == b"profile":
+      job_profiler.toggle()
+
+
+async def run_session(
+  room: rtc.Room,
+  *,
+  stt: agents.stt.STT,
+  tts: agents.tts.TTS,
+  anthropic_client: anthropic.AsyncClient | None = None,
+) -> VoiceAssistant:
+  """Starts the agent in the room and returns once the greeting was said.
+
+  The providers are parameters so the load test can run sessions against fakes.
+  """
+  chat_ctx = llm.ChatContext(
+    messages=[
+      llm.ChatMessage(
+        role=llm.ChatRole.USER,
+        text=prompts.INITIAL_PROMPT,
+      )
+    ]
+  )
+  asset_index = assets.load_index()
+  fnc_ctx = functions.Functions(room, asset_index.catalog)
+  claude_llm = claude.LLM(
+    room=room,
+    client=anthropic_client,
+    system=prompts.SYSTEM_PROMPT,
+    # only the assets relevant to the latest user message are sent each turn
+    turn_context=asset_index.turn_context,
+  )
+
+  # Speech-to-Text. Starts generating the answer once the interim transcript is
+  # stable, before the final transcript and the end of speech.
+  speculative_stt = claude.SpeculativeSTT(
+    stt,
+    llm=claude_llm,
+    chat_ctx=chat_ctx,
+    fnc_ctx=fnc_ctx,
+  )
+
   # VoiceAssistant is a class that creates a full conversational AI agent.
   # See https://github.com/livekit/agents/blob/main/livekit-agents/livekit/agents/voice_assistant/assistant.py
   # for details on how it works.
@@ -24,49 +118,164 @@ async def entrypoint(ctx: JobContext):
     vad=silero.VAD(
       min_silence_duration=1.0,
     ),  # Voice Activity Detection
-    stt=deepgram.STT(),  # Speech-to-Text
-    llm=claude.LLM(
-      room=ctx.room,
-      system=prompts.SYSTEM_PROMPT,
-    ),  # Language Model
-    tts=elevenlabs.TTS(),  # Text-to-Speech
-    chat_ctx=llm.ChatContext(
-      messages=[
-        llm.ChatMessage(
-          role=llm.ChatRole.USER,
-          text=prompts.INITIAL_PROMPT,
-        )
-      ]
-    ),
-    fnc_ctx=functions.Functions(ctx.room),
+    stt=speculative_stt,  # Speech-to-Text
+    llm=claude_llm,  # Language Model
+    tts=tts,  # Text-to-Speech
+    chat_ctx=chat_ctx,
+    fnc_ctx=fnc_ctx,
   )
 
+  @assistant.on("user_speech_committed")
+  def _user_speech_committed(chat_ctx: llm.ChatContext, msg: llm.ChatMessage):
+    speculative_stt.user_speech_committed()
+
   @assistant.on("agent_speech_interrupted")
   def _agent_speech_interrupted(chat_ctx: llm.ChatContext, msg: llm.ChatMessage):
     msg.text += "... (user interrupted you)"
 
+  # Per-turn latency, the other stages are marked by the STT, LLM and TTS
+  turn_tracer = tracing.tracer()
+
+  @assistant.on("user_started_speaking")
+  def _user_started_speaking():
+    turn_tracer.start_turn()
+
+  @assistant.on("user_stopped_speaking")
+  def _user_stopped_speaking():
+    turn_tracer.mark(tracing.Stage.END_OF_SPEECH)
+
+  @assistant.on("agent_started_speaking")
+  def _agent_started_speaking():
+    turn_tracer.mark(tracing.Stage.AUDIO_FIRST_FRAME)
+    turn_tracer.end_turn()
+
   # Start the voice assistant with the LiveKit room
-  assistant.start(ctx.room)
+  assistant.start(room)
+
+  # Lets the frontend prefetch every slide and look up the assetId of asset
+  # events. Sent again to participants joining later.
+  await fnc_ctx.publish_manifest()
 
-  await asyncio.sleep(1)
+  @room.on("participant_connected")
+  def _participant_connected(participant: rtc.RemoteParticipant):
+    run_in_background(fnc_ctx.publish_manifest(), "asset manifest publish")
 
-  # Greets the user with an initial message
-  await assistant.say(
-    "Hi there! I'm Demi, here to share more about Otter AI and answer any questions. First of all, I'd love to learn a bit more about your use case. Could you share what you're hoping to accomplish with Otter AI?",
-    allow_interruptions=True,
+  # Greets the user as soon as they can hear it, the greeting audio is cached.
+  # A participant without a microphone is greeted after a timeout instead.
+  try:
+    await asyncio.wait_for(wait_for_audio_track(room), timeout=AUDIO_TRACK_TIMEOUT)
+  except asyncio.TimeoutError:
+    logging.warning(
+      f"no audio track after {AUDIO_TRACK_TIMEOUT:.0f}s, greeting without one"
+    )
+  await assistant.say(prompts.GREETING, allow_interruptions=True)
+  return assistant
+
+
+def build_tts(http_session: aiohttp.ClientSession | None = None) -> tts_cache.CachedTTS:
+  # the greeting and the common phrases are synthesized once and served from
+  # the cache afterwards, the rest streams from ElevenLabs
+  return tts_cache.CachedTTS(
+    elevenlabs.TTS(
+      voice=elevenlabs.DEFAULT_VOICE,
+      model_id=TTS_MODEL,
+      http_session=http_session,
+    ),
+    voice=elevenlabs.DEFAULT_VOICE.id,
+    model=TTS_MODEL,
   )
 
 
+async def wait_for_audio_track(room: rtc.Room) -> None:
+  for participant in room.participants.values():
+    for publication in participant.tracks.values():
+      if publication.kind == rtc.TrackKind.KIND_AUDIO and publication.track is not None:
+        return
+
+  subscribed = asyncio.Event()
+
+  def _track_subscribed(track: rtc.Track, *_):
+    if track.kind == rtc.TrackKind.KIND_AUDIO:
+      subscribed.set()
+
+  room.on("track_subscribed", _track_subscribed)
+  try:
+    await subscribed.wait()
+  finally:
+    room.off("track_subscribed", _track_subscribed)
+
+
+async def prewarm_tts() -> None:
+  try:
+    async with aiohttp.ClientSession() as http_session:
+      await build_tts(http_session).warm([prompts.GREETING, *prompts.COMMON_PHRASES])
+  except Exception as e:
+    # filled by the first session instead
+    logging.warning(f"failed to prewarm the tts cache: {e}")
+
+
 # This function is called when the worker receives a job request
 # from a LiveKit server.
 async def request_fnc(req: JobRequest) -> None:
   logging.info("received request %s", req)
+  # Rejected jobs are dispatched to another worker, before the sessions of this
+  # one start to stutter.
+  reason = admission.controller().admit()
+  if reason is not None:
+    logging.warning(f"rejecting job {req.id}: {reason}")
+    await req.reject()
+    return
+
   # Accept the job tells the LiveKit server that this worker
   # wants the job. After the LiveKit server acknowledges that job is accepted,
   # the entrypoint function is called.
   await req.accept(entrypoint)
 
 
+# Reported to LiveKit every few seconds, the worker is marked full at 1.
+def load_fnc() -> float:
+  return admission.controller().load()
+
+
+def start_worker(slot: int = 0, workers: int = 1) -> None:
+  # The CLI runs the worker on the current event loop, asyncio.run() of the
+  # prewarm left none. Made here and not before the fork, the workers would
+  # share its epoll instance otherwise.
+  asyncio.set_event_loop(asyncio.new_event_loop())
+  # the machine's default limits are split between the workers
+  admission.start(admission.admission_options(workers=workers))
+  # every worker of the supervisor serves its health check on its own port
+  cli.run_app(
+    WorkerOptions(request_fnc, load_fnc=load_fnc, load_threshold=1.0, port=8081 + slot)
+  )
+
+
 if __name__ == "__main__":
+  # Load the VAD model, the asset index and the greeting audio once before any
+  # job starts. Job processes are forked from the worker, so every session
+  # reuses them instead of loading its own copy.
+  silero.prewarm()
+  assets.prewarm()
+  asyncio.run(prewarm_tts())
+  # With VAD_SHARED_INFERENCE=1 the VAD windows of every job of every worker are
+  # batched in one process, instead of an inference per window in each job.
+  inference_opts = silero.inference_options()
+  if inference_opts.enabled:
+    silero.start_inference_server(inference_opts)
+  # The collector never visits what's loaded so far, so it doesn't write to the
+  # pages forked processes share with this one.
+  gc.freeze()
+
+  # Histograms of every session of this machine, in the Prometheus text format
+  metrics.serve(int(os.environ.get("METRICS_PORT", "9100")))
+
+  # With WORKER_PROCESSES > 1, `start` runs that many workers forked from this
+  # process, each registered with LiveKit on its own.
+  supervisor_opts = supervisor.supervisor_options()
+  if supervisor_opts.processes > 1 and sys.argv[1:2] == ["start"]:
+    setup_logging("INFO", production=True)
+    target = functools.partial(start_worker, workers=supervisor_opts.processes)
+    sys.exit(supervisor.Supervisor(target, supervisor_opts).run())
+
   # Initialize the worker with the request function
-  cli.run_app(WorkerOptions(request_fnc))
+  start_worker()
@@ -0,0 +1,21 @@
+import psutil
+
+from demospace.utils import admission
+
+
+def test_default_limits_are_split_between_workers(monkeypatch):
+  monkeypatch.delenv("MAX_SESSIONS", raising=False)
+  monkeypatch.delenv("MAX_RSS_MB", raising=False)
+  one = admission.admission_options()
+  four = admission.admission_options(workers=4)
+
+  assert (one.max_sessions, four.max_sessions) == (8, 2)
+  assert four.max_rss_bytes == one.max_rss_bytes // 4
+  assert one.max_rss_bytes == int(psutil.virtual_memory().total * 0.8)
+
+
+def test_configured_limits_are_per_worker(monkeypatch):
+  monkeypatch.setenv("MAX_SESSIONS", "6")
+  monkeypatch.setenv("MAX_RSS_MB", "512")
+  opts = admission.admission_options(workers=4)
+  assert (opts.max_sessions, opts.max_rss_bytes) == (6, 512 * 1024 * 1024)
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from bench.inline_calls import random_split
+from demospace.livekit.claude import coalesce
+from demospace.livekit.claude.coalesce import CoalesceOptions, TextCoalescer
+
+
+def _release(coalescer: TextCoalescer, deltas: list[str]) -> list[str]:
+  chunks = []
+  for delta in deltas:
+    coalescer.push(delta)
+    if (chunk := coalescer.take()) is not None:
+      chunks.append(chunk)
+  if (chunk := coalescer.flush()) is not None:
+    chunks.append(chunk)
+  return chunks
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  now = [0.0]
+  monkeypatch.setattr(coalesce.time, "perf_counter", lambda: now[0])
+  return now
+
+
+def test_releases_at_clause_boundaries(clock):
+  deltas = ["Hello", ",", " how", " are", " you", "? I", "'m fine", ". Thanks"]
+  assert _release(TextCoalescer(), deltas) == [
+    "Hello,",
+    " how are you? ",
+    "I'm fine. ",
+    "Thanks",
+  ]
+
+
+@pytest.mark.parametrize(
+  "text, released",
+  [
+    ('He said "stop." Then', 'He said "stop." '),
+    ("A list (see below): item", "A list (see below): "),
+    ("Line one\nLine two", "Line one\n"),
+    ("Version 1.5 is out", None),
+    ("Wait...", "Wait..."),
+  ],
+)
+def test_boundaries(clock, text, released):
+  coalescer = TextCoalescer()
+  coalescer.push(text)
+  assert coalescer.take() == released
+
+
+def test_holds_at_most_max_hold(clock):
+  coalescer = TextCoalescer(CoalesceOptions(max_hold=0.3))
+  coalescer.push("Our pricing")
+  clock[0] = 0.2
+  assert coalescer.take() is None
+  coalescer.push(" starts")
+  clock[0] = 0.3
+  assert coalescer.take() == "Our pricing starts"
+  assert coalescer.take() is None
+
+
+def test_rest_is_held_from_its_boundary(clock):
+  coalescer = TextCoalescer(CoalesceOptions(max_hold=0.3))
+  coalescer.push("Yes")
+  clock[0] = 0.25
+  coalescer.push(". It")
+  assert coalescer.take() == "Yes. "
+  clock[0] = 0.5
+  assert coalescer.take() is None
+  clock[0] = 0.55
+  assert coalescer.take() == "It"
+
+
+def test_holds_at_most_max_chars(clock):
+  coalescer = TextCoalescer(CoalesceOptions(max_chars=10))
+  coalescer.push("abcdef")
+  assert coalescer.take() is None
+  coalescer.push("ghijk")
+  assert coalescer.take() == "abcdefghijk"
+
+
+def test_zero_max_hold_releases_every_delta(clock):
+  deltas = ["Our", " pricing", " starts"]
+  assert _release(TextCoalescer(CoalesceOptions(max_hold=0)), deltas) == deltas
+
+
+def test_push_boundary_releases_everything(clock):
+  coalescer = TextCoalescer()
+  coalescer.push("Let me show you")
+  assert coalescer.take() is None
+  coalescer.push_boundary()
+  assert coalescer.take() == "Let me show you"
+  assert coalescer.flush() is None
+
+
+def test_empty_deltas_are_ignored(clock):
+  coalescer = TextCoalescer()
+  coalescer.push("")
+  assert coalescer.take() is None
+  assert coalescer.flush() is None
+
+
+def test_random_splits_keep_the_text(clock):
+  text = (
+    "Great question! Otter transcribes meetings in real time; it also writes "
+    'summaries, "action items", and more.\nDoes that help? Version 2.0 is out...'
+  )
+  rng = random.Random(0)
+  for max_len in (1, 2, 4, 8, 32):
+    for _ in range(50):
+      chunks = _release(TextCoalescer(), random_split(text, rng, max_len))
+      assert "".join(chunks) == text
+      # every chunk but the last ends at a clause boundary, the clock is stopped
+      ends = [c.rstrip()[-1:] for c in chunks[:-1]]
+      assert all(end in '.!?;:,"' for end in ends), chunks
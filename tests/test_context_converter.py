@@ -0,0 +1,136 @@
+import copy
+
+from livekit.agents import llm
+
+from demospace.livekit.claude.context import ContextConverter
+
+TOOL_USE = {"type": "tool_use", "id": "toolu_1", "name": "send_asset", "input": {}}
+TOOL_RESULT = {"type": "tool_result", "tool_use_id": "toolu_1", "content": "sent"}
+
+
+def _chat_ctx(*messages: tuple[llm.ChatRole, str]) -> llm.ChatContext:
+  return llm.ChatContext(
+    messages=[llm.ChatMessage(role=role, text=text) for role, text in messages]
+  )
+
+
+def _conversation() -> llm.ChatContext:
+  return _chat_ctx(
+    (llm.ChatRole.USER, "Hi"),
+    (llm.ChatRole.ASSISTANT, "Hello! What do you need?"),
+    (llm.ChatRole.USER, "Show me pricing"),
+  )
+
+
+def test_converts_messages():
+  messages = ContextConverter().convert(_conversation())
+  assert messages == [
+    {"role": "user", "content": "Hi"},
+    {"role": "assistant", "content": "Hello! What do you need?"},
+    {"role": "user", "content": "Show me pricing"},
+  ]
+
+
+def test_reuses_converted_messages():
+  converter = ContextConverter()
+  first = converter.convert(_conversation())
+  # the assistant hands over a fresh copy every turn
+  chat_ctx = copy.deepcopy(_conversation())
+  chat_ctx.messages.append(llm.ChatMessage(role=llm.ChatRole.ASSISTANT, text="Sure."))
+  second = converter.convert(chat_ctx)
+
+  assert all(a is b for a, b in zip(first, second))
+  assert second[-1] == {"role": "assistant", "content": "Sure."}
+
+
+def test_changed_message_is_converted_again():
+  converter = ContextConverter()
+  first = converter.convert(_conversation())
+  chat_ctx = _conversation()
+  # e.g. "... (user interrupted you)" added to an interrupted answer
+  chat_ctx.messages[1].text += " (interrupted)"
+  second = converter.convert(chat_ctx)
+
+  assert second[0] is first[0]
+  assert second[1] == {
+    "role": "assistant",
+    "content": "Hello! What do you need? (interrupted)",
+  }
+  assert second[2] is first[2]
+
+
+def test_turn_context_is_not_cached():
+  converter = ContextConverter()
+  with_context = converter.convert(_conversation(), turn_context="Assets: a1")
+  assert with_context[-1] == {
+    "role": "user",
+    "content": [
+      {"type": "text", "text": "Show me pricing"},
+      {"type": "text", "text": "Assets: a1"},
+    ],
+  }
+  assert converter.convert(_conversation())[-1] == {
+    "role": "user",
+    "content": "Show me pricing",
+  }
+
+
+def test_tool_exchange_is_replayed_in_later_turns():
+  converter = ContextConverter()
+  chat_ctx = _conversation()
+  converter.add_tool_exchange(
+    chat_ctx, text="Let me show you.", tool_uses=[TOOL_USE], tool_results=[TOOL_RESULT]
+  )
+
+  # the assistant records the whole spoken answer once the turn is over
+  chat_ctx.messages.append(
+    llm.ChatMessage(
+      role=llm.ChatRole.ASSISTANT, text="Let me show you. Here is our pricing."
+    )
+  )
+  chat_ctx.messages.append(llm.ChatMessage(role=llm.ChatRole.USER, text="Thanks"))
+  messages = converter.convert(chat_ctx)
+
+  assert messages[3:] == [
+    {
+      "role": "assistant",
+      "content": [{"type": "text", "text": "Let me show you."}, TOOL_USE],
+    },
+    {"role": "user", "content": [TOOL_RESULT]},
+    # the text spoken before the tool call isn't repeated
+    {"role": "assistant", "content": " Here is our pricing."},
+    {"role": "user", "content": "Thanks"},
+  ]
+
+
+def test_tool_exchange_is_dropped_when_its_message_changes():
+  converter = ContextConverter()
+  converter.add_tool_exchange(
+    _conversation(), text="", tool_uses=[TOOL_USE], tool_results=[TOOL_RESULT]
+  )
+  chat_ctx = _conversation()
+  chat_ctx.messages[2].text = "Something else"
+  assert len(converter.convert(chat_ctx)) == 3
+
+
+def test_tool_failure_replaces_the_result():
+  converter = ContextConverter()
+  chat_ctx = _conversation()
+  converter.add_tool_exchange(
+    chat_ctx, text="", tool_uses=[TOOL_USE], tool_results=[TOOL_RESULT]
+  )
+  converter.add_tool_failure("toolu_1", "System note: send_asset failed")
+
+  assert converter.convert(chat_ctx)[-1] == {
+    "role": "user",
+    "content": [
+      {
+        "type": "tool_result",
+        "tool_use_id": "toolu_1",
+        "content": "System note: send_asset failed",
+        "is_error": True,
+      }
+    ],
+  }
+  # the recorded result itself is left alone
+  assert TOOL_RESULT["content"] == "sent"
@@ -0,0 +1,48 @@
+import json
+import random
+
+import pytest
+
+from bench.inline_calls import RESPONSES, parse, random_split
+from demospace.llm.inline_calls import InlineCallParser
+
+
+@pytest.mark.parametrize("response, expected_calls", RESPONSES)
+def test_parses_whole_response(response, expected_calls):
+  text, calls = parse([response])
+  assert [c.arguments for c in calls] == expected_calls
+  assert all(c.name == "send_asset" for c in calls)
+  assert "functions.send_asset" not in text
+
+
+@pytest.mark.parametrize("response, expected_calls", RESPONSES)
+@pytest.mark.parametrize("max_len", [1, 2, 4, 8, 32])
+def test_split_does_not_change_the_result(response, expected_calls, max_len):
+  expected_text, _ = parse([response])
+  rng = random.Random(max_len)
+  for _ in range(50):
+    deltas = random_split(response, rng, max_len)
+    text, calls = parse(deltas)
+    assert text == expected_text, deltas
+    assert [c.arguments for c in calls] == expected_calls, deltas
+    for call in calls:
+      assert json.loads(call.raw_arguments) == call.arguments
+
+
+def test_text_is_returned_right_away():
+  parser = InlineCallParser()
+  assert parser.feed("Hello there") == ["Hello there"]
+  # could still become a call
+  assert parser.feed(" func") == [" "]
+  assert parser.feed("y") == ["funcy"]
+
+
+def test_flush():
+  parser = InlineCallParser()
+  assert parser.feed("Those are functions.send") == ["Those are "]
+  # not a call yet, spoken as is
+  assert parser.flush() == ["functions.send"]
+
+  # the JSON arguments are never spoken, even if the call is cut off
+  assert parser.feed('See functions.send_asset({"alt": "x"') == ["See "]
+  assert parser.flush() == []
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Annotated
+
+import pytest
+from livekit.agents import llm
+
+from demospace.livekit import claude
+from demospace.livekit.claude.llm import LLMStream, _ToolUse
+
+
+class Tools(llm.FunctionContext):
+  def __init__(self) -> None:
+    self.sent: list[str] = []
+    super().__init__()
+
+  @claude.optimistic(result="sent")
+  @llm.ai_callable(desc="Sends a slide.")
+  async def send(self, slide: Annotated[str, llm.TypeInfo(desc="The slide.")]):
+    if slide == "unknown":
+      raise ValueError(f"no slide {slide}")
+    await asyncio.sleep(0.01)
+    if slide == "broken":
+      raise RuntimeError("publish failed")
+    self.sent.append(slide)
+    return "sent for real"
+
+  @llm.ai_callable(desc="Looks a slide up.")
+  async def lookup(self, slide: Annotated[str, llm.TypeInfo(desc="The slide.")]):
+    await asyncio.sleep(0.01)
+    return f"found {slide}"
+
+
+async def _run_tool(name: str, slide: str):
+  fnc_ctx = Tools()
+  background: list[asyncio.Task] = []
+  stream = LLMStream(
+    None,
+    None,
+    fnc_ctx,
+    run_in_background=lambda tool_use_id, fnc_name, task: background.append(task),
+  )
+  arguments = f'{{"slide": "{slide}"}}'
+  tool_use = _ToolUse(id="toolu_1", name=name, raw_arguments=[arguments])
+  result = await stream._run_tool(tool_use, None)
+  return result, background, fnc_ctx
+
+
+def test_optimistic_result_returned_before_the_function_finishes():
+  async def run():
+    result, background, fnc_ctx = await _run_tool("send", "pricing")
+    assert result == "sent"
+    assert fnc_ctx.sent == []
+    assert await background[0] == "sent for real"
+    assert fnc_ctx.sent == ["pricing"]
+
+  asyncio.run(run())
+
+
+def test_error_before_the_first_await_goes_back_to_the_model():
+  async def run():
+    with pytest.raises(ValueError, match="no slide unknown"):
+      await _run_tool("send", "unknown")
+
+  asyncio.run(run())
+
+
+def test_later_failure_is_left_to_the_background():
+  async def run():
+    result, background, _ = await _run_tool("send", "broken")
+    assert result == "sent"
+    with pytest.raises(RuntimeError, match="publish failed"):
+      await background[0]
+
+  asyncio.run(run())
+
+
+def test_other_functions_are_awaited():
+  async def run():
+    result, background, _ = await _run_tool("lookup", "pricing")
+    assert result == "found pricing"
+    assert background == []
+
+  asyncio.run(run())
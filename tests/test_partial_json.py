@@ -0,0 +1,69 @@
+import json
+import random
+
+import pytest
+
+from bench.inline_calls import random_split
+from demospace.llm.partial_json import PartialObjectParser
+
+OBJECTS = [
+  {},
+  {"assetId": "a1"},
+  {"assetId": 'a\\"1}', "alt": 'Summary {with braces} and "quotes"'},
+  {"count": 12, "ratio": -0.5, "enabled": True, "missing": None, "off": False},
+  {"nested": {"a": [1, {"b": "]"}], "c": {}}, "list": [], "after": "x"},
+  {"unicode": "café – \U0001f600", "escaped": "line\nbreak\ttab"},
+]
+
+
+def _encodings(obj):
+  yield json.dumps(obj)
+  yield json.dumps(obj, separators=(",", ":"))
+  yield json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("obj", OBJECTS)
+def test_random_splits(obj):
+  rng = random.Random(0)
+  for text in _encodings(obj):
+    for max_len in (1, 2, 4, 8, 32):
+      for _ in range(20):
+        parser = PartialObjectParser()
+        for delta in random_split(text, rng, max_len):
+          parser.feed(delta)
+          # members only show up complete, in order
+          assert list(parser.values.items()) == list(obj.items())[: len(parser.values)]
+        assert parser.done
+        assert parser.values == obj
+
+
+def test_scalar_needs_its_delimiter():
+  parser = PartialObjectParser()
+  parser.feed('{"a": "x", "n": 12')
+  assert parser.values == {"a": "x"}
+  parser.feed("3")
+  assert parser.values == {"a": "x"}
+  parser.feed(" ")
+  assert parser.values == {"a": "x", "n": 123}
+  assert not parser.done
+  parser.feed("}")
+  assert parser.done
+
+
+def test_string_is_complete_at_its_closing_quote():
+  parser = PartialObjectParser()
+  parser.feed('{"assetId": "a1"')
+  assert parser.values == {"assetId": "a1"}
+
+
+def test_text_after_the_object_is_ignored():
+  parser = PartialObjectParser()
+  parser.feed('{"a": 1} trailing')
+  assert parser.done
+  assert parser.values == {"a": 1}
+
+
+@pytest.mark.parametrize("text", ["[1]", '{"a" 1}', '{"a": 1 "b": 2}', "{'a': 1}"])
+def test_invalid_object(text):
+  with pytest.raises(ValueError):
+    PartialObjectParser().feed(text)
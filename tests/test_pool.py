@@ -0,0 +1,36 @@
+import asyncio
+import contextlib
+
+from demospace.livekit.claude import pool
+
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+  # a keep-alive HTTP/1.1 server answering every request with a short body
+  with contextlib.suppress(asyncio.IncompleteReadError):
+    while await reader.readuntil(b"\r\n\r\n"):
+      writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+      await writer.drain()
+
+
+def test_gauges_follow_the_connections():
+  async def run():
+    server = await asyncio.start_server(_serve, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+    client_pool = pool.ClientPool(pool.PoolOptions(http2=False))
+    gauges = []
+
+    def _read_gauges():
+      gauges.append((pool._connections_in_use.value, pool._connections_idle.value))
+
+    async with client_pool._http_client.stream("GET", url) as response:
+      _read_gauges()
+      await response.aread()
+    _read_gauges()
+
+    await client_pool.aclose()
+    server.close()
+    return gauges, client_pool.stats()
+
+  gauges, stats = asyncio.run(run())
+  assert gauges == [(1, 0), (0, 1)]
+  assert (stats.in_use, stats.idle) == (0, 0)
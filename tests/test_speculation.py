@@ -0,0 +1,139 @@
+import asyncio
+
+from livekit.agents import llm, stt
+
+from demospace.livekit import claude
+from demospace.livekit.claude import speculation
+
+
+class FakeStream:
+  def __init__(self, events: list) -> None:
+    self._events = list(events)
+    self.release = asyncio.Event()
+    self.closed = False
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    if self._events:
+      return self._events.pop(0)
+    raise StopAsyncIteration
+
+  async def close(self) -> None:
+    await self.release.wait()
+    self.closed = True
+
+
+class FakeSpeechStream:
+  def __init__(self, events: list[stt.SpeechEvent]) -> None:
+    self._events = events
+
+  async def __anext__(self) -> stt.SpeechEvent:
+    if not self._events:
+      raise StopAsyncIteration
+    return self._events.pop(0)
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    pass
+
+
+class FakeLLM:
+  def __init__(self) -> None:
+    self.speculated: list[str] = []
+    self.discarded = 0
+
+  def speculate(self, history: llm.ChatContext, fnc_ctx=None) -> None:
+    self.speculated.append(history.messages[-1].text)
+
+  def discard_speculation(self) -> None:
+    self.discarded += 1
+
+
+def _message_start(input_tokens: int):
+  usage = type("Usage", (), {"input_tokens": input_tokens})()
+  message = type("Message", (), {"usage": usage})()
+  return type("Event", (), {"type": "message_start", "message": message})()
+
+
+def _delta():
+  return type("Event", (), {"type": "content_block_delta"})()
+
+
+def _final(text: str) -> stt.SpeechEvent:
+  return stt.SpeechEvent(
+    type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+    alternatives=[stt.SpeechData(language="en", text=text)],
+  )
+
+
+def _history(*texts: str) -> llm.ChatContext:
+  ctx = llm.ChatContext()
+  for i, text in enumerate(texts):
+    role = llm.ChatRole.USER if i % 2 == 0 else llm.ChatRole.ASSISTANT
+    ctx.messages.append(llm.ChatMessage(role=role, text=text))
+  return ctx
+
+
+def test_the_final_text_must_match():
+  history = _history("Hello there.", "Hi!", "Show me the roadmap")
+  assert speculation.speculation_key(history, None) == speculation.speculation_key(
+    _history("hello there", "hi", "show"), None
+  )
+  assert speculation.user_text(history) == "show me the roadmap"
+  assert (
+    speculation.user_text(_history("Show me the road map.")) != "show me the roadmap"
+  )
+
+
+def test_waste_is_counted_when_discarded_while_closing():
+  async def run():
+    stream = FakeStream([_message_start(120), _delta(), _delta()])
+
+    async def create():
+      return stream
+
+    spec = speculation.Speculation("key", "text", create())
+    await asyncio.sleep(0.01)
+    # the pump is closing the finished stream
+    spec.discard()
+    spec.discard()
+    await asyncio.sleep(0.01)
+    return stream
+
+  input_tokens = speculation._wasted_input_tokens.value
+  output_tokens = speculation._wasted_output_tokens.value
+  stream = asyncio.run(run())
+  assert not stream.closed
+  assert speculation._wasted_input_tokens.value - input_tokens == 120
+  assert speculation._wasted_output_tokens.value - output_tokens == 2
+
+
+def test_transcribed_text_resets_on_user_speech_committed():
+  async def run():
+    fake_llm = FakeLLM()
+    chat_ctx = llm.ChatContext()
+    speculative_stt = claude.SpeculativeSTT(None, llm=fake_llm, chat_ctx=chat_ctx)
+    stream = speculation.SpeculativeSpeechStream(
+      FakeSpeechStream([_final("Show me "), _final("the roadmap "), _final("Thanks")]),
+      speculative_stt,
+    )
+
+    await stream.__anext__()
+    # the assistant's answer to the first part doesn't end the user's message
+    chat_ctx.messages.append(llm.ChatMessage(role=llm.ChatRole.ASSISTANT, text="Sure"))
+    await stream.__anext__()
+    stream._interim_text = "and"
+    stream._speculate()
+
+    speculative_stt.user_speech_committed()
+    await stream.__anext__()
+    stream._interim_text = " bye"
+    stream._speculate()
+
+    await stream.aclose()
+    return fake_llm
+
+  fake_llm = asyncio.run(run())
+  assert fake_llm.speculated == ["Show me the roadmap and", "Thanks bye"]
+  assert fake_llm.discarded == 1
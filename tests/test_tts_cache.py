@@ -0,0 +1,215 @@
+import asyncio
+import os
+
+import pytest
+from livekit import rtc
+from livekit.agents import tts
+
+from demospace.livekit.tts_cache import AudioCache, CacheOptions, CachedTTS, cache
+
+
+@pytest.fixture
+def audio_cache(tmp_path):
+  return AudioCache(str(tmp_path), CacheOptions(max_memory_bytes=10, max_disk_bytes=20))
+
+
+def _set_mtime(audio_cache: AudioCache, key: str, mtime: float) -> None:
+  os.utime(audio_cache._path(key), (mtime, mtime))
+
+
+def test_miss_then_hit(audio_cache):
+  assert audio_cache.get("a") is None
+  audio_cache.put("a", b"\x01\x00" * 2)
+  assert bytes(audio_cache.get("a")) == b"\x01\x00" * 2
+  assert "a" in audio_cache
+
+  stats = audio_cache.stats()
+  assert (stats.hits, stats.misses, stats.bytes_saved) == (1, 1, 4)
+  assert stats.hit_rate == 0.5
+
+
+def test_memory_tier_is_lru(audio_cache):
+  for key in "abc":
+    audio_cache.put(key, b"\x00" * 4)
+    audio_cache.get(key)
+  assert list(audio_cache._mapped) == ["b", "c"]
+
+  audio_cache.get("b")
+  audio_cache.put("d", b"\x00" * 4)
+  audio_cache.get("d")
+  assert list(audio_cache._mapped) == ["b", "d"]
+  # read back from disk
+  assert audio_cache.get("a") is not None
+  assert audio_cache.stats().memory_hits == 1
+
+
+def test_disk_tier_evicts_least_recently_used(audio_cache):
+  for i, key in enumerate("abc"):
+    audio_cache.put(key, b"\x00" * 6)
+    _set_mtime(audio_cache, key, 1000 + i)
+  # a read refreshes the mtime
+  audio_cache.get("a")
+
+  audio_cache.put("d", b"\x00" * 6)
+  on_disk = [os.path.exists(audio_cache._path(key)) for key in "abcd"]
+  assert on_disk == [True, False, True, True]
+
+
+def test_evicted_audio_stays_readable_while_mapped(audio_cache):
+  audio_cache.put("a", b"\x01\x00" * 3)
+  view = audio_cache.get("a")
+  _set_mtime(audio_cache, "a", 1000)
+  for key in "bc":
+    audio_cache.put(key, b"\x00" * 8)
+  assert not os.path.exists(audio_cache._path("a"))
+  assert bytes(view) == b"\x01\x00" * 3
+
+
+def test_empty_audio_is_not_stored(audio_cache):
+  audio_cache.put("a", b"")
+  assert "a" not in audio_cache
+
+
+def test_normalized_text_shares_a_key():
+  assert cache.normalize_text("  Do you have\n any  questions? ") == (
+    "Do you have any questions?"
+  )
+  key = cache.cache_key(voice="v", model="m", sample_rate=16000, text="Hi!")
+  assert key != cache.cache_key(voice="v", model="m", sample_rate=16000, text="Hi.")
+  assert key != cache.cache_key(voice="w", model="m", sample_rate=16000, text="Hi!")
+
+
+class _Chunked(tts.ChunkedStream):
+  def __init__(self, text: str) -> None:
+    self._frames = [_frame(text)]
+
+  async def __anext__(self) -> tts.SynthesizedAudio:
+    if not self._frames:
+      raise StopAsyncIteration
+    return self._frames.pop()
+
+  async def aclose(self) -> None:
+    pass
+
+
+class _Stream(tts.SynthesizeStream):
+  """One segment of audio per segment of text, like the ElevenLabs stream."""
+
+  def __init__(self, segments: list[str]) -> None:
+    self._segments = segments
+    self._text = ""
+    self._events = asyncio.Queue()
+
+  def push_text(self, token: str | None) -> None:
+    if token is not None:
+      self._text += token
+      return
+    self._segments.append(self._text)
+    for event in (
+      tts.SynthesisEvent(tts.SynthesisEventType.STARTED),
+      tts.SynthesisEvent(tts.SynthesisEventType.AUDIO, _frame(self._text)),
+      tts.SynthesisEvent(tts.SynthesisEventType.FINISHED),
+    ):
+      self._events.put_nowait(event)
+    self._text = ""
+
+  async def aclose(self, *, wait: bool = True) -> None:
+    self._events.put_nowait(None)
+
+  async def __anext__(self) -> tts.SynthesisEvent:
+    event = await self._events.get()
+    if event is None:
+      raise StopAsyncIteration
+    return event
+
+
+class _TTS(tts.TTS):
+  def __init__(self) -> None:
+    super().__init__(streaming_supported=True, sample_rate=16000, num_channels=1)
+    self.synthesized: list[str] = []
+    self.streamed: list[str] = []
+
+  def synthesize(self, text: str) -> tts.ChunkedStream:
+    self.synthesized.append(text)
+    return _Chunked(text)
+
+  def stream(self) -> tts.SynthesizeStream:
+    return _Stream(self.streamed)
+
+
+def _frame(text: str) -> tts.SynthesizedAudio:
+  samples = len(text)
+  return tts.SynthesizedAudio(
+    text=text,
+    data=rtc.AudioFrame(
+      data=b"\x01\x00" * samples,
+      sample_rate=16000,
+      num_channels=1,
+      samples_per_channel=samples,
+    ),
+  )
+
+
+@pytest.fixture
+def cached_tts(tmp_path):
+  # the cached texts are per voice and process, a voice per test keeps them apart
+  return CachedTTS(
+    _TTS(), voice=str(tmp_path), model="m", audio_cache=AudioCache(str(tmp_path))
+  )
+
+
+def test_synthesize_fills_the_cache(cached_tts):
+  async def run():
+    for _ in range(2):
+      async for _ in cached_tts.synthesize("Hi  there!"):
+        pass
+
+  asyncio.run(run())
+  assert cached_tts._tts.synthesized == ["Hi there!"]
+
+
+@pytest.mark.parametrize(
+  "tokens, streamed, played",
+  [
+    # uncached text goes through the provider's stream as is
+    (["Our", " pricing", " is simple."], ["Our pricing is simple."], 1),
+    (["Great", " question", "! Our", " plans"], ["Our plans"], 2),
+    (["Do you", " have any", " questions?"], [], 1),
+    (["Great question! Do you have any questions?", " Bye."], ["Bye."], 3),
+    # starts like a cached phrase but isn't one
+    (["Great", " questions", " abound."], ["Great questions abound."], 1),
+  ],
+)
+def test_stream_plays_cached_phrases(cached_tts, tokens, streamed, played):
+  async def run():
+    await cached_tts.warm(["Great question!", "Do you have any questions?"])
+    stream = cached_tts.stream()
+    for token in tokens:
+      stream.push_text(token)
+    stream.mark_segment_end()
+    await stream.aclose()
+    return [event async for event in stream]
+
+  events = asyncio.run(run())
+  assert cached_tts._tts.streamed == streamed
+  assert events[0].type == tts.SynthesisEventType.STARTED
+  assert events[-1].type == tts.SynthesisEventType.FINISHED
+  audio_texts = [e.audio.text for e in events if e.audio is not None]
+  assert len(dict.fromkeys(audio_texts)) == played
+
+
+def test_streamed_sentences_are_cached(cached_tts):
+  async def run():
+    for _ in range(2):
+      stream = cached_tts.stream()
+      for token in ["Our", " pricing", " is simple.", " Bye", "."]:
+        stream.push_text(token)
+      stream.mark_segment_end()
+      await stream.aclose()
+      async for _ in stream:
+        pass
+
+  asyncio.run(run())
+  # a segment per sentence, the second time both are played from the cache
+  assert cached_tts._tts.streamed == ["Our pricing is simple. ", "Bye."]
+  assert cached_tts._lookup("Our pricing is simple.") is not None
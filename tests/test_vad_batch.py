@@ -0,0 +1,158 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from demospace.livekit.silero import batch, inference, model
+
+
+@pytest.fixture(scope="module")
+def onnx_model():
+  return model.load_model()
+
+
+def _windows(sample_rate: int, count: int, seed: int) -> list[np.ndarray]:
+  rng = np.random.default_rng(seed)
+  size = model.window_size(sample_rate)
+  # noise with a louder stretch, so the probabilities aren't all the same
+  return [
+    (rng.standard_normal(size) * (0.5 if 3 <= i < 6 else 0.01)).astype(np.float32)
+    for i in range(count)
+  ]
+
+
+async def _infer(scheduler, stream_model, window) -> float:
+  probability, stream_model.state = await scheduler.run(
+    stream_model.next_input(window).copy(), stream_model.state, stream_model.sample_rate
+  )
+  return probability
+
+
+def _sequential(onnx_model, sample_rate: int, windows: list[np.ndarray]) -> list[float]:
+  stream_model = model.StreamModel(onnx_model, sample_rate)
+  return [stream_model(w) for w in windows]
+
+
+@pytest.mark.parametrize("sample_rates", [[16000] * 4, [16000, 8000, 16000, 8000]])
+def test_batched_matches_sequential(onnx_model, sample_rates):
+  windows = [_windows(sr, 10, seed) for seed, sr in enumerate(sample_rates)]
+
+  async def run():
+    scheduler = batch.BatchScheduler(onnx_model, max_wait=1.0)
+
+    async def stream(sample_rate, stream_windows):
+      stream_model = model.StreamModel(onnx_model, sample_rate)
+      return [await _infer(scheduler, stream_model, w) for w in stream_windows]
+
+    for _ in sample_rates:
+      scheduler.register()
+    return await asyncio.gather(
+      *[stream(sr, w) for sr, w in zip(sample_rates, windows)]
+    )
+
+  batched = asyncio.run(run())
+  for sr, stream_windows, probs in zip(sample_rates, windows, batched):
+    expected = _sequential(onnx_model, sr, stream_windows)
+    np.testing.assert_allclose(probs, expected, atol=1e-5)
+
+
+def test_runs_after_max_wait_without_every_stream(onnx_model):
+  async def run():
+    scheduler = batch.BatchScheduler(onnx_model, max_wait=0.01)
+    scheduler.register()
+    scheduler.register()
+    stream_model = model.StreamModel(onnx_model, 16000)
+    window = _windows(16000, 1, 0)[0]
+    return await asyncio.wait_for(_infer(scheduler, stream_model, window), 1.0)
+
+  assert 0.0 <= asyncio.run(run()) <= 1.0
+
+
+def test_unregister_runs_the_batch_it_was_waiting_for(onnx_model):
+  async def run():
+    scheduler = batch.BatchScheduler(onnx_model, max_wait=60.0)
+    scheduler.register()
+    scheduler.register()
+    stream_model = model.StreamModel(onnx_model, 16000)
+    infer = asyncio.create_task(
+      _infer(scheduler, stream_model, _windows(16000, 1, 0)[0])
+    )
+    await asyncio.sleep(0)
+    assert not infer.done()
+    scheduler.unregister()
+    return await asyncio.wait_for(infer, 1.0)
+
+  assert 0.0 <= asyncio.run(run()) <= 1.0
+
+
+def test_max_batch_size(onnx_model, monkeypatch):
+  sizes = []
+  run = onnx_model.run
+
+  def _run(inputs, states, sample_rate):
+    sizes.append(len(inputs))
+    return run(inputs, states, sample_rate)
+
+  monkeypatch.setattr(onnx_model, "run", _run)
+
+  async def infer_all():
+    scheduler = batch.BatchScheduler(onnx_model, max_batch_size=2, max_wait=0.01)
+    stream_models = [model.StreamModel(onnx_model, 16000) for _ in range(5)]
+    for _ in range(6):
+      scheduler.register()
+    window = _windows(16000, 1, 0)[0]
+    # the fifth window runs alone once it waited max_wait
+    await asyncio.gather(*[_infer(scheduler, m, window) for m in stream_models])
+
+  asyncio.run(infer_all())
+  assert sorted(sizes) == [1, 2, 2]
+
+
+@pytest.fixture
+def server_address(monkeypatch):
+  process = inference.start_inference_server(
+    inference.inference_options(enabled=True, max_batch_wait=1.0)
+  )
+  address = inference.server_address()
+  # VADs made by other tests run their inference themselves
+  monkeypatch.setattr(inference, "_address", None)
+  yield address
+  process.kill()
+  process.join()
+
+
+def _client_probabilities(onnx_model, client, windows) -> list[list[float]]:
+  async def stream(stream_windows):
+    stream_model = model.StreamModel(onnx_model, 16000)
+    return [await client.infer(stream_model, w) for w in stream_windows]
+
+  async def run():
+    for _ in windows:
+      client.register()
+    return await asyncio.gather(*[stream(w) for w in windows])
+
+  return asyncio.run(run())
+
+
+def test_server_matches_sequential(onnx_model, server_address, monkeypatch):
+  windows = [_windows(16000, 10, seed) for seed in range(3)]
+  expected = [_sequential(onnx_model, 16000, w) for w in windows]
+
+  def _run(*args):
+    raise AssertionError("ran in the job")
+
+  # the server's model is its own copy
+  monkeypatch.setattr(onnx_model, "run", _run)
+  probs = _client_probabilities(
+    onnx_model, inference.InferenceClient(server_address), windows
+  )
+  np.testing.assert_allclose(probs, expected, atol=1e-5)
+
+
+def test_client_runs_inference_without_the_server(onnx_model, tmp_path):
+  windows = [_windows(16000, 4, 0)]
+  client = inference.InferenceClient(str(tmp_path / "missing.sock"))
+  probs = _client_probabilities(onnx_model, client, windows)
+  np.testing.assert_allclose(
+    probs[0], _sequential(onnx_model, 16000, windows[0]), atol=1e-5
+  )